@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by benchmark scripts.
+
+Every benchmark runs against a separate database (`vulyk_bench` by default)
+which is dropped before the run. Connection could be altered with
+`mongodb_host`, `mongodb_port` and `mongodb_bench_db` environment variables.
+"""
+import os
+import time
+from statistics import median
+from typing import Callable, Dict, List
+
+from mongoengine.connection import get_db, register_connection
+from pymongo import monitoring
+
+from vulyk.models.task_types import AbstractTaskType
+from vulyk.models.tasks import AbstractAnswer, AbstractTask
+
+__all__ = [
+    'BenchAnswer',
+    'BenchTask',
+    'BenchType',
+    'connect',
+    'QueryCounter',
+    'measure',
+    'report'
+]
+
+ENV = os.environ.get
+
+
+class BenchTask(AbstractTask):
+    pass
+
+
+class BenchAnswer(AbstractAnswer):
+    pass
+
+
+class BenchType(AbstractTaskType):
+    task_model = BenchTask
+    answer_model = BenchAnswer
+    type_name = 'bench_task_type'
+    template = 'tmpl.html'
+
+
+class QueryCounter(monitoring.CommandListener):
+    """
+    Counts commands sent to the server, handshakes and pings aside.
+    """
+    ignored = {'isMaster', 'ismaster', 'hello', 'ping', 'endSessions'}
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in self.ignored:
+            self.count += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+def connect(counter: QueryCounter = None) -> None:
+    """
+    Registers the default connection and drops the benchmark database.
+
+    :param counter: Listener to count commands with (optional)
+    :type counter: QueryCounter
+    """
+    register_connection(
+        'default',
+        name=ENV('mongodb_bench_db', 'vulyk_bench'),
+        host=ENV('mongodb_host', 'localhost'),
+        port=int(ENV('mongodb_port', 27017)),
+        event_listeners=[counter] if counter is not None else [])
+
+    db = get_db()
+    db.client.drop_database(db.name)
+
+
+def measure(fun: Callable, repeat: int = 50) -> Dict[str, float]:
+    """
+    Runs given callable several times.
+
+    :param fun: Function to be measured
+    :type fun: Callable
+    :param repeat: Number of runs
+    :type repeat: int
+
+    :return: Median and maximum latencies in milliseconds
+    :rtype: Dict[str, float]
+    """
+    timings = []  # type: List[float]
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fun()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {'median': median(timings), 'max': max(timings)}
+
+
+def report(title: str, rows: List[List]) -> None:
+    """
+    Prints out results as a plain table.
+
+    :param title: Header of the table
+    :type title: str
+    :param rows: Table rows, the first one contains column names
+    :type rows: List[List]
+    """
+    widths = [max(len(str(r[i])) for r in rows) for i in range(len(rows[0]))]
+
+    print(title)
+
+    for row in rows:
+        print('  '.join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+    print()
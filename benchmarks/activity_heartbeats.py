@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Counts reads and writes caused by activity heartbeats of members working on
+their tasks in parallel: the former read and save of the whole session per
+heartbeat, the guarded increment per heartbeat and heartbeats accumulated
+in memory until the session is closed.
+
+Usage:
+
+    python benchmarks/activity_heartbeats.py [members] [heartbeats per task]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from pymongo import monitoring
+
+from _common import BenchType, QueryCounter, connect, report
+from vulyk.ext.worksession import WorkSessionManager
+from vulyk.models.stats import WorkSession
+from vulyk.models.user import Group, User
+
+TASKS = 5
+SECONDS = 10
+
+
+class WriteCounter(QueryCounter):
+    """
+    Counts writes apart from other commands.
+    """
+    writes = {'update', 'findAndModify', 'insert', 'delete'}
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.written = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        super().started(event)
+
+        if event.command_name in self.writes:
+            self.written += 1
+
+
+def legacy_record_activity(task, user_id, seconds) -> None:
+    session = WorkSession.objects.get(user=user_id, task=task)
+    duration = datetime.now() - session.start_time
+
+    if duration.total_seconds() > seconds + session.activity > 0:
+        session.activity += seconds
+        session.save()
+
+
+def work(task_type: BenchType, record, user: User, heartbeats: int) -> None:
+    manager = task_type.work_session_manager
+
+    for task in task_type.task_model.objects(task_type=task_type.type_name):
+        for _ in range(heartbeats):
+            record(task, user.id, SECONDS)
+
+        manager.end_work_session(task, user.id, None)
+
+
+def main(members: int, heartbeats: int) -> None:
+    counter = WriteCounter()
+    connect(counter)
+
+    Group(id='default', allowed_types=[BenchType.type_name]).save()
+    users = [User(username='bench%s' % i, email='bench%s@email.com' % i)
+             .save() for i in range(members)]
+    task_type = BenchType({})
+    task_type.task_model.objects.insert([
+        task_type.task_model(id='task%s' % i,
+                             task_type=task_type.type_name,
+                             task_data={'id': i})
+        for i in range(TASKS)])
+    rows = [['approach', 'heartbeats', 'commands', 'writes', 'seconds']]
+
+    for title, interval in (('read and save', None),
+                            ('guarded $inc', 0),
+                            ('accumulated', 3600)):
+        task_type._work_session_manager = manager = WorkSessionManager(
+            WorkSession, flush_interval=interval or 0)
+        record = legacy_record_activity if interval is None \
+            else manager.record_activity
+        long_ago = datetime.now() - timedelta(days=1)
+
+        with patch('vulyk.ext.worksession.datetime') as mock_date:
+            mock_date.now = lambda: long_ago
+
+            for user in users:
+                for task in task_type.task_model.objects:
+                    manager.start_work_session(task, user.id)
+
+        counter.count = counter.written = 0
+        started = time.perf_counter()
+
+        with patch('vulyk.ext.worksession.on_task_done'), \
+                ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda u: work(task_type, record, u, heartbeats),
+                          users))
+
+        rows.append([title,
+                     members * TASKS * heartbeats,
+                     counter.count,
+                     counter.written,
+                     '{:.2f}'.format(time.perf_counter() - started)])
+
+        activity = WorkSession.objects.sum('activity')
+        assert activity == members * TASKS * heartbeats * SECONDS, activity
+
+        WorkSession.objects.delete()
+
+    report('Heartbeats of {} members on {} tasks each'.format(members, TASKS),
+           rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
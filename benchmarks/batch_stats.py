@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Counts queries and time needed to gather completeness stats of batches:
+the former six queries per batch (one of them loading every task) against
+the single `$facet` aggregation.
+
+Usage:
+
+    python benchmarks/batch_stats.py [batches] [tasks per batch]
+"""
+import sys
+from unittest.mock import patch
+
+from _common import BenchType, QueryCounter, connect, measure, report
+from vulyk.cli import stats
+from vulyk.models.tasks import AbstractTask, Batch
+
+
+def legacy_completeness(task_type: BenchType) -> dict:
+    result = {}
+    rs = lambda batch: AbstractTask.objects(batch=batch)
+
+    for b in Batch.objects.order_by('id'):
+        if len(rs(b.id)) > 0:
+            rs(b.id).first()
+            result[b.id] = (
+                rs(b.id).filter(closed=False).sum('users_count'),
+                rs(b.id).sum('users_count'),
+                rs(b.id).item_frequencies('users_count'))
+
+    return result
+
+
+def populate(task_type: BenchType, batches: int, tasks: int) -> None:
+    for b in range(batches):
+        Batch(id='batch%s' % b, task_type=task_type.type_name,
+              tasks_count=tasks, tasks_processed=tasks // 2).save()
+        task_type.task_model._get_collection().insert_many([
+            task_type.task_model(id='task%s-%s' % (b, i),
+                                 task_type=task_type.type_name,
+                                 batch='batch%s' % b,
+                                 closed=i % 2 == 0,
+                                 users_count=i % 4,
+                                 task_data={'id': i}).to_mongo()
+            for i in range(tasks)])
+
+
+def main(batches: int, tasks: int) -> None:
+    counter = QueryCounter()
+    connect(counter)
+
+    task_type = BenchType({})
+    populate(task_type, batches, tasks)
+    rows = [['approach', 'queries', 'median, ms', 'max, ms']]
+
+    with patch.dict(stats.TASKS_TYPES, {task_type.type_name: task_type}):
+        for title, fun in (
+                ('queries per batch', lambda: legacy_completeness(task_type)),
+                ('single $facet',
+                 lambda: stats.batch_completeness(None, None))):
+            counter.count = 0
+            fun()
+            queries = counter.count
+            timings = measure(fun, 5)
+
+            rows.append([title,
+                         queries,
+                         '{:.1f}'.format(timings['median']),
+                         '{:.1f}'.format(timings['max'])])
+
+    report('Completeness of {} batches of {} tasks'.format(batches, tasks),
+           rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares throughput and size of export formats and compressions on generated
+answers: the former unbuffered JSON lines writer against the export writers.
+No database is needed.
+
+Usage:
+
+    python benchmarks/export_formats.py [tasks]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from _common import report
+from vulyk.ext.export import export_to
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+ANSWERS = 3
+
+
+def reports(tasks: int):
+    for i in range(tasks):
+        yield [{'task': {'id': 'task%s' % i, 'closed': True,
+                         'data': {'url': 'https://example.com/%s.pdf' % i,
+                                  'year': 2010 + i % 10}},
+                'answer': {'name': 'Person %s' % (i % 5000), 'choice': j},
+                'user': {'username': 'user%s' % j,
+                         'email': 'user%s@email.com' % j}}
+               for j in range(ANSWERS)]
+
+
+def legacy_export(path: str, tasks: int) -> None:
+    with open(path, 'w+') as f:
+        for r in reports(tasks):
+            f.write(json.dumps(r) + os.linesep)
+
+
+def main(tasks: int) -> None:
+    folder = tempfile.mkdtemp()
+    rows = [['writer', 'seconds', 'rows/s', 'MB']]
+
+    started = time.perf_counter()
+    path = os.path.join(folder, 'legacy.json')
+    legacy_export(path, tasks)
+    elapsed = time.perf_counter() - started
+    rows.append(['legacy jsonl', '{:.2f}'.format(elapsed),
+                 '{:.0f}'.format(tasks * ANSWERS / elapsed),
+                 '{:.1f}'.format(os.path.getsize(path) / 2 ** 20)])
+
+    for name in ('answers.jsonl', 'answers.jsonl.gz', 'answers.jsonl.bz2',
+                 'answers.csv', 'answers.csv.gz'):
+        path = os.path.join(folder, name)
+
+        try:
+            stats = export_to(path, reports(tasks))
+        except ValueError as e:
+            rows.append([name, str(e), '', ''])
+            continue
+
+        rows.append([name, '{:.2f}'.format(stats.elapsed),
+                     '{:.0f}'.format(stats.answers_per_second),
+                     '{:.1f}'.format(os.path.getsize(path) / 2 ** 20)])
+
+    shutil.rmtree(folder)
+    report('Export of {} tasks with {} answers each'.format(tasks, ANSWERS),
+           rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Estimates how many writes per minute the throttled last-seen tracker saves
+under a synthetic load: every member sends a request every few seconds,
+the clock is simulated.
+
+Usage:
+
+    python benchmarks/last_seen_writes.py [members] [seconds between requests]
+"""
+import sys
+from datetime import datetime, timedelta
+
+from _common import connect, report
+from vulyk.ext.lastseen import LastSeenTracker
+from vulyk.models.user import Group, User
+
+MINUTES = 10
+INTERVALS = [60, 300]
+
+
+class SimulatedTracker(LastSeenTracker):
+    clock = datetime.now()
+
+    @staticmethod
+    def _now() -> datetime:
+        return SimulatedTracker.clock
+
+
+def main(members: int, period: int) -> None:
+    connect()
+    Group(id='default').save()
+    users = [User(username='bench%s' % i,
+                  email='bench%s@email.com' % i).save()
+             for i in range(members)]
+    requests = members * MINUTES * 60 // period
+    rows = [['interval, s', 'writes/min before', 'writes/min after',
+             'saved']]
+
+    for interval in INTERVALS:
+        tracker = SimulatedTracker(User, interval)
+        started = SimulatedTracker.clock
+
+        for second in range(0, MINUTES * 60, period):
+            SimulatedTracker.clock = started + timedelta(seconds=second)
+
+            for user in users:
+                tracker.touch(User.objects.get(id=user.id))
+
+        # stored timestamps mustn't affect the next run
+        SimulatedTracker.clock += timedelta(seconds=interval)
+        before = requests / MINUTES
+        after = tracker.writes / MINUTES
+
+        rows.append([interval,
+                     '{:.0f}'.format(before),
+                     '{:.1f}'.format(after),
+                     '{:.1f} %'.format((1 - after / before) * 100)])
+
+    report('Last seen tracking of {} members, a request per {} s'.format(
+        members, period), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Counts queries needed to build the top-100 leaderboard: the former lookup of
+every member one by one against the single `$in` query, and against the
+cached leaderboard.
+
+Usage:
+
+    python benchmarks/leaderboard_queries.py [members]
+"""
+import sys
+
+from _common import BenchType, QueryCounter, connect, measure, report
+from vulyk.models.stats import LeaderboardScore
+from vulyk.models.user import Group, User
+
+LIMIT = 100
+
+
+def legacy_leaderboard(manager, limit):
+    leaders = manager.get_leaders()[:limit]
+
+    return [{'rank': i + 1,
+             'user': User.objects.get(id=user_id),
+             'freq': freq}
+            for i, (user_id, freq) in enumerate(leaders)]
+
+
+def populate(task_type: BenchType, members: int) -> None:
+    Group(id='default', allowed_types=[task_type.type_name]).save()
+
+    for i in range(members):
+        user = User(username='bench%s' % i,
+                    email='bench%s@email.com' % i).save()
+        LeaderboardScore(task_type=task_type.type_name,
+                         user=user,
+                         score=i + 1).save()
+
+
+def main(members: int) -> None:
+    counter = QueryCounter()
+    connect(counter)
+
+    plain = BenchType({})
+    cached = BenchType({'LEADERBOARD_CACHE_TTL': 60})
+    populate(plain, members)
+    rows = [['approach', 'queries', 'median, ms', 'max, ms']]
+
+    for title, fun in (
+            ('query per member',
+             lambda: legacy_leaderboard(plain.leaderboard_manager, LIMIT)),
+            ('single $in query',
+             lambda: plain.get_leaderboard(LIMIT)),
+            ('cached',
+             lambda: cached.get_leaderboard(LIMIT))):
+        fun()
+        counter.count = 0
+        fun()
+        queries = counter.count
+        timings = measure(fun, 20)
+
+        rows.append([title,
+                     queries,
+                     '{:.1f}'.format(timings['median']),
+                     '{:.1f}'.format(timings['max'])])
+
+    report('Top-{} leaderboard of {} members'.format(LIMIT, members), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Counts queries and time needed to export answers of closed tasks: the former
+query of answers per task (plus a lookup of a member and a task per answer)
+against the single aggregation of `ReportExporter`.
+
+Usage:
+
+    python benchmarks/report_export.py [tasks] [members]
+"""
+import sys
+import time
+
+from _common import BenchType, QueryCounter, connect, report
+from vulyk.models.user import Group, User
+
+ANSWERS = 3
+
+
+def legacy_export(task_type: BenchType, batch: str):
+    for task in task_type.task_model.objects(batch=batch, closed=True):
+        yield [a.as_dict()
+               for a in task_type.answer_model.objects(task=task)]
+
+
+def populate(task_type: BenchType, tasks: int, members: int) -> None:
+    Group(id='default', allowed_types=[task_type.type_name]).save()
+    users = [User(username='bench%s' % i,
+                  email='bench%s@email.com' % i).save()
+             for i in range(members)]
+    task_docs, answer_docs = [], []
+
+    for i in range(tasks):
+        task = task_type.task_model(id='task%s' % i,
+                                    task_type=task_type.type_name,
+                                    batch='default',
+                                    closed=True,
+                                    users_count=ANSWERS,
+                                    task_data={'id': i})
+        task_docs.append(task.to_mongo())
+
+        for j in range(ANSWERS):
+            answer_docs.append(task_type.answer_model(
+                task=task,
+                created_by=users[(i + j) % members],
+                task_type=task_type.type_name,
+                result={'answer': j}).to_mongo())
+
+    task_type.task_model._get_collection().insert_many(task_docs)
+    task_type.answer_model._get_collection().insert_many(answer_docs)
+
+
+def main(tasks: int, members: int) -> None:
+    counter = QueryCounter()
+    connect(counter)
+
+    task_type = BenchType({})
+    populate(task_type, tasks, members)
+    rows = [['approach', 'answers', 'queries', 'seconds', 'tasks/s']]
+
+    for title, fun in (
+            ('queries per task', lambda: legacy_export(task_type, 'default')),
+            ('aggregation',
+             lambda: task_type.export_reports('default'))):
+        counter.count = 0
+        started = time.perf_counter()
+        answers = sum(len(r) for r in fun())
+        elapsed = time.perf_counter() - started
+
+        rows.append([title,
+                     answers,
+                     counter.count,
+                     '{:.2f}'.format(elapsed),
+                     '{:.0f}'.format(tasks / elapsed)])
+
+    report('Export of {} tasks with {} answers each by {} members'.format(
+        tasks, ANSWERS, members), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
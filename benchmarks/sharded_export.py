@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares wall-clock time of exporting answers of many batches: one batch
+after another in the current process against the pool of processes of
+`ShardedExport`. Needs a real server, workers connect to it on their own.
+
+Usage:
+
+    python benchmarks/sharded_export.py [batches] [tasks per batch] [workers]
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from _common import BenchType, connect, report
+from vulyk.ext.shards import ShardedExport
+from vulyk.models.user import Group, User
+
+ANSWERS = 3
+
+
+def populate(task_type: BenchType, batches: int, tasks: int) -> None:
+    Group(id='default', allowed_types=[task_type.type_name]).save()
+    users = [User(username='bench%s' % i,
+                  email='bench%s@email.com' % i).save()
+             for i in range(ANSWERS)]
+
+    for b in range(batches):
+        task_docs, answer_docs = [], []
+
+        for i in range(tasks):
+            task = task_type.task_model(id='task%s-%s' % (b, i),
+                                        task_type=task_type.type_name,
+                                        batch='batch%s' % b,
+                                        closed=True,
+                                        users_count=ANSWERS,
+                                        task_data={'id': i})
+            task_docs.append(task.to_mongo())
+            answer_docs.extend(
+                task_type.answer_model(task=task,
+                                       created_by=user,
+                                       task_type=task_type.type_name,
+                                       result={'answer': i}).to_mongo()
+                for user in users)
+
+        task_type.task_model._get_collection().insert_many(task_docs)
+        task_type.answer_model._get_collection().insert_many(answer_docs)
+
+
+def main(batches: int, tasks: int, workers: int) -> None:
+    connect()
+    task_type = BenchType({})
+    populate(task_type, batches, tasks)
+    env = os.environ.get
+    connection = {'db': env('mongodb_bench_db', 'vulyk_bench'),
+                  'host': env('mongodb_host', 'localhost'),
+                  'port': int(env('mongodb_port', 27017))}
+    rows = [['workers', 'answers', 'seconds', 'answers/s']]
+
+    for n in (0, workers):
+        folder = tempfile.mkdtemp()
+        manifest = ShardedExport([task_type], connection, n).run(
+            folder, '.jsonl.gz')
+        shutil.rmtree(folder)
+        rows.append([n or 'sequential',
+                     manifest['answers'],
+                     manifest['seconds'],
+                     '{:.0f}'.format(manifest['answers'] /
+                                     manifest['seconds'])])
+
+    report('Export of {} batches of {} tasks'.format(batches, tasks), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+         int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures throughput of deriving task IDs from task data: the legacy
+`sha1(json.dumps(task))` against canonical serialisation hashed with sha1
+and blake2b.
+
+No database is needed.
+
+Usage:
+
+    python benchmarks/task_ids.py [tasks]
+"""
+import sys
+import time
+from hashlib import blake2b, sha1
+from typing import Callable, Dict, List
+
+from _common import report
+from vulyk.utils import canonical_json, make_task_id
+
+
+def generate(count: int) -> List[Dict]:
+    """
+    :return: Tasks resembling scanned declarations
+    :rtype: List[Dict]
+    """
+    return [{
+        'id': i,
+        'url': 'https://example.com/declarations/{}.pdf'.format(i),
+        'person': {'name': 'Особа {}'.format(i % 5000),
+                   'office': 'Office {}'.format(i % 300)},
+        'income': i * 1.25,
+        'pages': [p for p in range(i % 7)]
+    } for i in range(count)]
+
+
+def throughput(fun: Callable[[Dict], str], tasks: List[Dict]) -> float:
+    """
+    :return: Tasks hashed per second
+    :rtype: float
+    """
+    started = time.perf_counter()
+
+    for task in tasks:
+        fun(task)
+
+    return len(tasks) / (time.perf_counter() - started)
+
+
+def main(count: int) -> None:
+    tasks = generate(count)
+    schemes = [
+        ('legacy', lambda t: make_task_id(t, 'legacy')),
+        ('canonical + sha1',
+         lambda t: sha1(canonical_json(t)).hexdigest()[:20]),
+        ('canonical + blake2b',
+         lambda t: blake2b(canonical_json(t), digest_size=10).hexdigest())
+    ]
+    rows = [['scheme', 'tasks/s']]
+
+    for name, fun in schemes:
+        rows.append([name, '{:.0f}'.format(throughput(fun, tasks))])
+
+    report('Task IDs derived from {} tasks'.format(count), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
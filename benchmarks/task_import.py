@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares throughput of loading tasks from a generated JSON lines file: the
+former line by line parsing with ordered inserts of 100 tasks against the
+`TaskImporter` pipeline.
+
+Usage:
+
+    python benchmarks/task_import.py [lines] [workers]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from _common import BenchType, connect, report
+from vulyk.ext.importer import TaskImporter
+from vulyk.utils import chunked
+
+
+def generate(path: str, lines: int) -> None:
+    """
+    Writes a file of tasks resembling scanned declarations.
+
+    :param path: Path to the file
+    :type path: str
+    :param lines: Number of tasks
+    :type lines: int
+    """
+    with open(path, 'w') as f:
+        for i in range(lines):
+            f.write(json.dumps({
+                'id': i,
+                'url': 'https://example.com/declarations/{}.pdf'.format(i),
+                'person': {'name': 'Person {}'.format(i % 5000),
+                           'office': 'Office {}'.format(i % 300)},
+                'year': 2010 + i % 10,
+                'pages': [p for p in range(i % 7)]
+            }) + '\n')
+
+
+def legacy_load(task_type: BenchType, path: str) -> int:
+    """
+    Loads tasks the way `vulyk db load` used to.
+    """
+    with open(path, 'rb') as f:
+        tasks = filter(None, (json.loads(line) for line in f
+                              if line.strip()))
+
+        for chunk in chunked(tasks, 100):
+            task_type.import_tasks(chunk, 'default')
+
+    return task_type.task_model.objects.count()
+
+
+def main(lines: int, workers: int) -> None:
+    connect()
+    task_type = BenchType({})
+    path = os.path.join(tempfile.mkdtemp(), 'tasks.json')
+    generate(path, lines)
+    size = os.path.getsize(path) / 2 ** 20
+    rows = [['pipeline', 'tasks', 'seconds', 'tasks/s', 'MB/s']]
+
+    started = time.perf_counter()
+    stored = legacy_load(task_type, path)
+    elapsed = time.perf_counter() - started
+    rows.append(['legacy', stored, '{:.1f}'.format(elapsed),
+                 '{:.0f}'.format(stored / elapsed),
+                 '{:.2f}'.format(size / elapsed)])
+
+    for chunk_size in (1000, 5000):
+        task_type.task_model.objects.delete()
+        stats = TaskImporter(task_type, chunk_size, workers).run(
+            [path], 'default')
+        rows.append(['importer, chunks of {}'.format(chunk_size),
+                     stats.inserted,
+                     '{:.1f}'.format(stats.elapsed),
+                     '{:.0f}'.format(stats.tasks_per_second),
+                     '{:.2f}'.format(stats.mb_per_second)])
+
+    os.remove(path)
+    report('Loading {} tasks ({:.0f} MB)'.format(lines, size), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1)
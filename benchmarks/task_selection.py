@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares latency of picking a random task: the former `distinct` + `get`
+approach against the server-side `$sample` used by `AssignmentManager`.
+
+Usage:
+
+    python benchmarks/task_selection.py [size ...]
+"""
+import random
+import sys
+
+from _common import BenchType, connect, measure, report
+from vulyk.models.tasks import Batch
+from vulyk.models.user import Group, User
+from vulyk.utils import chunked
+
+SIZES = [10000, 100000, 1000000]
+
+
+def legacy_pick(rs):
+    _id = random.choice(rs.distinct('id') or [])
+
+    return rs.get(id=_id)
+
+
+def populate(task_type: BenchType, size: int) -> None:
+    collection = task_type.task_model._get_collection()
+    collection.delete_many({})
+
+    docs = ({
+        '_id': 'task{}'.format(i),
+        '_cls': task_type.task_model._class_name,
+        'taskType': task_type.type_name,
+        'batch': 'default',
+        'closed': False,
+        'usersCount': 0,
+        'usersProcessed': [],
+        'usersSkipped': [],
+        'task_data': {'payload': 'x' * 200, 'n': i}
+    } for i in range(size))
+
+    for chunk in chunked(docs, 10000):
+        collection.insert_many(chunk, ordered=False)
+
+
+def main(sizes) -> None:
+    connect()
+
+    task_type = BenchType({})
+    manager = task_type._assignment_manager
+    Group(id='default', allowed_types=[task_type.type_name]).save()
+    user = User(username='bench', email='bench@email.com').save()
+    Batch(id='default', task_type=task_type.type_name).save()
+    rows = [['tasks', 'legacy median, ms', 'legacy max, ms',
+             '$sample median, ms', '$sample max, ms']]
+
+    for size in sizes:
+        populate(task_type, size)
+
+        query = manager._query(user, skipped=False)
+        repeat = 5 if size >= 1000000 else 20
+        legacy = measure(
+            lambda: legacy_pick(task_type.task_model.objects(query)), repeat)
+        sample = measure(lambda: manager._pick(query), repeat)
+
+        rows.append([size,
+                     '{:.1f}'.format(legacy['median']),
+                     '{:.1f}'.format(legacy['max']),
+                     '{:.1f}'.format(sample['median']),
+                     '{:.1f}'.format(sample['max'])])
+
+    report('Random task selection', rows)
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or SIZES)
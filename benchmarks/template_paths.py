@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long the index page spends resolving paths of its templates:
+the page itself and partials included with `app_template` filter. Plugins
+are emulated by a number of package loaders serving bundled templates.
+
+No database is needed.
+
+Usage:
+
+    python benchmarks/template_paths.py [plugins]
+"""
+import sys
+
+import flask
+import jinja2
+
+from _common import measure, report
+from vulyk.utils import get_template_path, index_templates
+
+# templates resolved while rendering the index page for a guest
+INDEX_PAGE = ['index.html', '_nav.html', '_holding_page.html',
+              '_hello_block.html', '_social_signin.html', '_instruction.html']
+
+
+def make_app(plugins: int) -> flask.Flask:
+    """
+    :param plugins: Number of plugin loaders
+    :type plugins: int
+
+    :return: Application with plugin loaders set up like `init_plugins` does
+    :rtype: flask.Flask
+    """
+    app = flask.Flask('vulyk')
+    app.jinja_loader = jinja2.ChoiceLoader([
+        app.jinja_loader,
+        jinja2.PrefixLoader({'plugin%s' % i: jinja2.PackageLoader('vulyk')
+                             for i in range(plugins)})])
+    app.config['TEMPLATE_BASE_FOLDERS'] = ['plugin%s' % (plugins - 1)]
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+
+    return app
+
+
+def render_index(app: flask.Flask) -> None:
+    """
+    Resolves templates the same way rendering of the index page does.
+    """
+    for name in INDEX_PAGE:
+        get_template_path(app, name)
+
+
+def main(plugins: int) -> None:
+    app = make_app(plugins)
+    rows = [['mode', 'median, ms', 'max, ms']]
+
+    for mode in ('scan per call', 'index'):
+        if mode == 'index':
+            app._template_index = index_templates(app)
+
+        timings = measure(lambda: render_index(app), repeat=20)
+        rows.append([mode,
+                     '{:.3f}'.format(timings['median']),
+                     '{:.3f}'.format(timings['max'])])
+
+    report('Template paths resolved per index page, {} plugins'.format(
+        plugins), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -6,9 +6,8 @@ test_task_types
 """
 
 import unittest
-from unittest.mock import patch
 
-from vulyk.models.stats import WorkSession
+from vulyk.models.stats import TaskTypeCounters, WorkSession
 from vulyk.models.tasks import AbstractTask, AbstractAnswer, Batch
 from vulyk.models.user import User, Group
 
@@ -43,11 +42,11 @@ class TestTaskTypes(BaseTest):
         AbstractAnswer.objects.delete()
         Batch.objects.delete()
         WorkSession.objects.delete()
+        TaskTypeCounters.objects.delete()
 
         super().tearDown()
 
     # region Task type
-    @patch('mongoengine.queryset.base.BaseQuerySet.count', lambda *a: 22)
     def test_to_dict_no_batch(self):
         got = {
             'name': 'Fake name',
@@ -60,9 +59,10 @@ class TestTaskTypes(BaseTest):
             'has_tasks': False
         }
 
+        TaskTypeCounters(id=FakeType.type_name, total=22, closed=22).save()
+
         self.assertDictEqual(FakeType({}).to_dict(), got)
 
-    @patch('mongoengine.queryset.base.BaseQuerySet.count', lambda *a: 33)
     def test_to_dict_one_batch(self):
         got = {
             'name': 'Fake name',
@@ -80,6 +80,7 @@ class TestTaskTypes(BaseTest):
         }
 
         task_type = FakeType({})
+        TaskTypeCounters(id=task_type.type_name, total=33, closed=33).save()
         Batch(
             id='default',
             task_type=task_type.type_name,
@@ -94,7 +95,6 @@ class TestTaskTypes(BaseTest):
 
         self.assertDictEqual(task_type.to_dict(), got)
 
-    @patch('mongoengine.queryset.base.BaseQuerySet.count', lambda *a: 33)
     def test_to_dict_one_batch_but_closed(self):
         got = {
             'name': 'Fake name',
@@ -108,6 +108,7 @@ class TestTaskTypes(BaseTest):
         }
 
         task_type = FakeType({})
+        TaskTypeCounters(id=task_type.type_name, total=33, closed=33).save()
         Batch(
             id='default',
             task_type=task_type.type_name,
@@ -123,7 +124,6 @@ class TestTaskTypes(BaseTest):
 
         self.assertDictEqual(task_type.to_dict(), got)
 
-    @patch('mongoengine.queryset.base.BaseQuerySet.count', lambda *a: 44)
     def test_to_dict_two_batch(self):
         got = {
             'name': 'Fake name',
@@ -141,6 +141,7 @@ class TestTaskTypes(BaseTest):
         }
 
         task_type = FakeType({})
+        TaskTypeCounters(id=task_type.type_name, total=44, closed=44).save()
         Batch(
             id='default',
             task_type=task_type.type_name,
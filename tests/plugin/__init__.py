@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal plugin to load task types the way the application does.
+"""
+
+
+def configure(self_settings) -> dict:
+    return {key: getattr(self_settings, key) for key in dir(self_settings)
+            if key.isupper()}
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+from tests.fixtures import FakeType
+
+__all__ = [
+    'FakeType'
+]
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Settings of the plugin, they take precedence over the application ones.
+"""
+PLUGIN_SETTING = 'plugin'
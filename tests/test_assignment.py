@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_assignment
+"""
+import unittest
+
+from vulyk.ext.assignment import BatchQueueAssignmentManager
+from vulyk.models.tasks import AbstractTask, Batch
+from vulyk.models.user import User, Group
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+
+class TestBatchQueueAssignment(BaseTest):
+    TASK_TYPE = FakeType.type_name
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        Group.objects.create(
+            description='test', id='default', allowed_types=[cls.TASK_TYPE])
+
+    @classmethod
+    def tearDownClass(cls):
+        Group.objects.delete()
+
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        self.manager = BatchQueueAssignmentManager(
+            FakeType.type_name, FakeType.task_model,
+            queue_size=4, lookahead=2)
+
+    def tearDown(self):
+        User.objects.delete()
+        AbstractTask.objects.delete()
+        Batch.objects.delete()
+
+        super().tearDown()
+
+    def _make_tasks(self, batch, n, **kwargs):
+        return [
+            FakeType.task_model(
+                id='{}_task{}'.format(batch.id, i),
+                task_type=FakeType.type_name,
+                batch=batch,
+                task_data={'data': 'data'},
+                **kwargs
+            ).save() for i in range(n)
+        ]
+
+    def test_gives_task_from_first_batch(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batches = [
+            Batch(id='batch%s' % i,
+                  task_type=FakeType.type_name,
+                  tasks_count=3).save()
+            for i in range(2)
+        ]
+        first = self._make_tasks(batches[0], 3)
+        self._make_tasks(batches[1], 3)
+
+        for _ in range(5):
+            self.assertIn(self.manager.get_next_task(user), first)
+
+    def test_rotates_candidates(self):
+        users = [
+            User(username='user%s' % i, email='user%s@email.com' % i).save()
+            for i in range(2)
+        ]
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=2).save()
+        self._make_tasks(batch, 2)
+
+        self.assertNotEqual(self.manager.get_next_task(users[0]),
+                            self.manager.get_next_task(users[1]),
+                            'Consecutive requests should get other tasks')
+
+    def test_skips_processed_and_closed(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=6).save()
+        self._make_tasks(batch, 2, users_processed=[user])
+        closed = FakeType.task_model(
+            id='closed', task_type=FakeType.type_name, batch=batch,
+            closed=True, task_data={'data': 'data'}).save()
+        fresh = FakeType.task_model(
+            id='fresh', task_type=FakeType.type_name, batch=batch,
+            task_data={'data': 'data'}).save()
+
+        for _ in range(5):
+            task = self.manager.get_next_task(user)
+
+            self.assertEqual(task, fresh)
+            self.assertNotEqual(task, closed)
+
+    def test_returns_skipped_if_none_else_left(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=1).save()
+        task = self._make_tasks(batch, 1, users_skipped=[user])[0]
+
+        self.assertEqual(self.manager.get_next_task(user), task)
+
+    def test_nothing_left(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=3).save()
+        self._make_tasks(batch, 3, users_processed=[user])
+
+        self.assertIsNone(self.manager.get_next_task(user))
+
+    def test_honours_exclude(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=2).save()
+        tasks = self._make_tasks(batch, 2)
+
+        for _ in range(5):
+            self.assertEqual(
+                self.manager.get_next_task(user, exclude=[tasks[0].id]),
+                tasks[1])
+
+        self.assertIsNone(self.manager.get_next_task(
+            user, exclude=[t.id for t in tasks]))
+
+    def test_drops_queue_of_finished_batch(self):
+        user = User(username='user0', email='user0@email.com').save()
+        batch = Batch(id='default',
+                      task_type=FakeType.type_name,
+                      tasks_count=1).save()
+        self._make_tasks(batch, 1)
+        self.manager.get_next_task(user)
+
+        batch.update(set__closed=True)
+        self.manager.get_next_task(user)
+
+        self.assertNotIn(batch.id, self.manager._queues)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -92,6 +92,26 @@ class TestBatchModel(BaseTest):
         self.assertEqual(batch.tasks_processed, 5)
         self.assertEqual(called_times, 0)
 
+    def test_task_done_in_full(self):
+        batch = Batch(
+            id='default',
+            task_type=self.TASK_TYPE,
+            tasks_count=5,
+            tasks_processed=5,
+            batch_meta={}
+        ).save()
+
+        result = Batch.task_done_in(batch.id)
+        batch.reload()
+
+        self.assertEqual(result, BatchUpdateResult(False, False))
+        self.assertFalse(batch.closed)
+        self.assertEqual(batch.tasks_processed, 5)
+
+    def test_task_done_in_missing(self):
+        self.assertRaises(Batch.DoesNotExist,
+                          lambda: Batch.task_done_in('missing'))
+
 
 if __name__ == '__main__':
     unittest.main()
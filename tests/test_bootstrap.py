@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bootstrap
+"""
+import unittest
+
+import flask
+
+from vulyk.bootstrap import init_plugins
+
+from .base import BaseTest
+
+
+class TestInitPlugins(BaseTest):
+    def _init(self, **config):
+        app = flask.Flask(__name__)
+        app.config.update(ENABLED_TASKS={'tests.plugin': 'FakeType'},
+                          **config)
+
+        return init_plugins(app)['FakeTaskType']
+
+    def test_plugin_settings(self):
+        task_type = self._init()
+
+        self.assertEqual(task_type._settings['PLUGIN_SETTING'], 'plugin')
+        self.assertEqual(task_type.task_id_scheme, 'legacy')
+
+    def test_task_id_scheme(self):
+        task_type = self._init(TASK_ID_SCHEME='canonical')
+
+        self.assertEqual(task_type.task_id_scheme, 'canonical')
+
+    def test_activity_flush_interval(self):
+        task_type = self._init(ACTIVITY_FLUSH_INTERVAL=60)
+
+        self.assertEqual(
+            task_type.work_session_manager.flush_interval, 60)
+
+    def test_leaderboard_rank_staleness(self):
+        task_type = self._init(LEADERBOARD_RANK_STALENESS=60)
+
+        self.assertEqual(
+            task_type.leaderboard_manager._rank_staleness, 60)
+
+    def test_leaderboard_cache_ttl(self):
+        task_type = self._init(LEADERBOARD_CACHE_TTL=30)
+
+        self.assertEqual(task_type.leaderboard_manager._cache_ttl, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,19 @@ test_cli
 """
 import gzip
 import unittest
+from unittest.mock import patch
 
 import bz2file
 import click
 
-from vulyk.cli import admin, batches, db
+from vulyk.cli import admin, batches, indexes, stats
+from vulyk.ext.importer import open_anything
+from vulyk.models.exports import ExportCheckpoint
+from vulyk.models.imports import ImportCheckpoint
+from vulyk.models.jobs import DeferredJob
 from vulyk.models.task_types import AbstractTaskType
+from vulyk.models.leases import TaskLease
+from vulyk.models.stats import LeaderboardScore, WorkSession
 from vulyk.models.tasks import Batch, AbstractAnswer, AbstractTask
 from vulyk.models.user import Group, User
 
@@ -67,9 +74,9 @@ class TestAdmin(BaseTest):
 class TestDB(BaseTest):
     def test_open_anything(self):
         filename = 'test.bz2'
-        self.assertEqual(db.open_anything(filename), bz2file.BZ2File)
+        self.assertEqual(open_anything(filename), bz2file.BZ2File)
         filename = 'test.gz'
-        self.assertEqual(db.open_anything(filename), gzip.open)
+        self.assertEqual(open_anything(filename), gzip.open)
 
 
 class TestBatches(BaseTest):
@@ -226,5 +233,93 @@ class TestBatches(BaseTest):
                                            self.DEFAULT_BATCH))
 
 
+
+class TestStats(BaseTest):
+    def tearDown(self):
+        Batch.objects.delete()
+        AbstractTask.objects.delete()
+
+        super().tearDown()
+
+    def test_batch_completeness(self):
+        task_type = FakeType({})
+
+        for batch_id, closed, users in (('a', 3, [3, 3, 1, 0]),
+                                        ('b', 0, [1]),
+                                        ('c', 0, [])):
+            Batch(id=batch_id,
+                  task_type=task_type.type_name,
+                  tasks_count=len(users),
+                  tasks_processed=closed).save()
+
+            for i, users_count in enumerate(users):
+                task_type.task_model(
+                    id='%s%s' % (batch_id, i),
+                    task_type=task_type.type_name,
+                    batch=batch_id,
+                    closed=users_count == task_type.redundancy,
+                    users_count=users_count,
+                    task_data={'data': i}).save()
+
+        with patch.dict(stats.TASKS_TYPES, {task_type.type_name: task_type}):
+            completeness = stats.batch_completeness(None, None)
+
+        self.assertEqual(list(completeness), ['a', 'b', 'c'])
+        self.assertEqual(completeness['c']['total'], 0)
+
+        a = completeness['a']
+
+        self.assertEqual((a['total'], a['flag'], a['closed'], a['answers']),
+                         (4, 3, 2, 7))
+        self.assertEqual(a['histogram'], {'0': 1, '1': 1, '3': 2})
+        self.assertAlmostEqual(a['answers_percent'], (1 + 3 * 3) / 12 * 100)
+        self.assertEqual(a['breakdown'].splitlines()[-1],
+                         '{:>12}: 2'.format(3))
+        self.assertEqual(completeness['b']['answers'], 1)
+
+
+class TestIndexes(BaseTest):
+    def test_managed_models(self):
+        models = indexes.managed_models([FakeType({}), FakeType({})])
+
+        self.assertEqual(len(models), len(set(models)))
+
+        for model in (Batch, Group, User, FakeType.task_model,
+                      FakeType.answer_model, WorkSession, TaskLease,
+                      LeaderboardScore, DeferredJob, ImportCheckpoint,
+                      ExportCheckpoint):
+            self.assertIn(model, models)
+
+    def test_hot_queries(self):
+        queries = indexes.hot_queries(FakeType({}))
+
+        for name in ('open batches', 'next task in batch', 'next task',
+                     'active leases', 'work session', 'leaders', 'answer'):
+            self.assertIn(name, queries)
+
+    def test_plan_stages(self):
+        plan = {
+            'stage': 'FETCH',
+            'inputStage': {
+                'stage': 'OR',
+                'inputStages': [
+                    {'stage': 'IXSCAN', 'indexName': 'taskType_1'},
+                    {'stage': 'COLLSCAN'}
+                ]
+            }
+        }
+
+        self.assertEqual(indexes.plan_stages(plan),
+                         ['FETCH', 'OR', 'IXSCAN', 'COLLSCAN'])
+        self.assertEqual(len(plan['inputStage']['inputStages']), 2)
+
+    def test_plan_stages_sbe(self):
+        plan = {'queryPlan': {'stage': 'SORT',
+                              'inputStage': {'stage': 'IXSCAN'}},
+                'slotBasedPlan': {'slots': '...'}}
+
+        self.assertEqual(indexes.plan_stages(plan), ['SORT', 'IXSCAN'])
+
+
 if __name__ == '__main__':
     unittest.main()
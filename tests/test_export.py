@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+test_export
+"""
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from vulyk.cli import db
+from vulyk.ext import export
+from vulyk.ext.export import export_to, open_writer
+from vulyk.ext.shards import MANIFEST, ShardedExport
+from vulyk.models.exports import ExportCheckpoint
+from vulyk.models.tasks import AbstractAnswer, AbstractTask
+from vulyk.models.user import Group, User
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+
+def _report(i, answers=2):
+    return [{'task': {'id': 'task%s' % i, 'closed': True,
+                      'data': {'n': i, 'tags': ['a', 'b']}},
+             'answer': {'choice': j},
+             'user': {'username': 'user%s' % j, 'email': None}}
+            for j in range(answers)]
+
+
+class TestWriters(BaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+        super().tearDown()
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_jsonl_gzip(self):
+        path = self._path('answers.jsonl.gz')
+        reports = [_report(i) for i in range(3)]
+        progress = []
+
+        stats = export_to(path, iter(reports),
+                          progress=lambda s: progress.append(s.tasks),
+                          every=2)
+
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual([json.loads(line) for line in f], reports)
+
+        self.assertEqual((stats.tasks, stats.answers), (3, 6))
+        self.assertEqual(progress, [2])
+
+    def test_unknown_extension_is_jsonl(self):
+        path = self._path('answers.json')
+
+        export_to(path, [_report(0)])
+
+        with open(path) as f:
+            self.assertEqual(json.loads(f.readline()), _report(0))
+
+    def test_csv_bz2(self):
+        path = self._path('answers.csv.bz2')
+
+        export_to(path, [_report(0), [], _report(1, 1)])
+
+        with bz2.open(path, 'rt', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            list(rows[0]),
+            ['task.id', 'task.closed', 'task.data', 'answer',
+             'user.username', 'user.email'])
+        self.assertEqual(json.loads(rows[2]['task.data']),
+                         {'n': 1, 'tags': ['a', 'b']})
+        self.assertEqual(rows[1]['user.username'], 'user1')
+
+    def test_csv_answers_of_different_keys(self):
+        path = self._path('answers.csv')
+        report = _report(0)
+        report[1]['answer'] = {'choice': 1, 'comment': 'optional'}
+
+        export_to(path, [report])
+
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertEqual([json.loads(r['answer']) for r in rows],
+                         [a['answer'] for a in report])
+
+    def test_format_overrides_extension(self):
+        path = self._path('answers.txt')
+
+        export_to(path, [_report(0)], 'csv')
+
+        with open(path, newline='') as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 2)
+
+    def test_unavailable(self):
+        self.assertRaises(ValueError,
+                          lambda: open_writer(self._path('a.csv'), 'xml'))
+        self.assertRaises(
+            ValueError,
+            lambda: open_writer(self._path('a.parquet.gz'), 'parquet'))
+
+    @unittest.skipIf(export.zstandard is not None, 'zstandard is installed')
+    def test_zstd_requires_zstandard(self):
+        self.assertRaises(
+            ValueError, lambda: open_writer(self._path('answers.jsonl.zst')))
+
+    @unittest.skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        path = self._path('answers.parquet')
+
+        reports = [_report(i) for i in range(3)]
+        reports[2][1]['answer'] = {'choice': 1, 'comment': 'optional'}
+
+        export_to(path, reports)
+        table = export.pyarrow.parquet.read_table(path)
+
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.column('user.email').to_pylist(), [None] * 6)
+        self.assertEqual(
+            [json.loads(a) for a in table.column('answer').to_pylist()],
+            [a['answer'] for r in reports for a in r])
+
+
+class TestExportReports(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        Group.objects.create(description='test', id='default',
+                             allowed_types=[FakeType.type_name])
+
+    @classmethod
+    def tearDownClass(cls):
+        Group.objects.delete()
+
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        self.folder = tempfile.mkdtemp()
+        self.task_type = FakeType({})
+        self.user = User(username='user0', email='user0@email.com').save()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        User.objects.delete()
+        AbstractTask.objects.delete()
+        AbstractAnswer.objects.delete()
+        ExportCheckpoint.objects.delete()
+
+        super().tearDown()
+
+    def _answer(self, i, created_at, closed=True, batch='default'):
+        task = self.task_type.task_model(
+            id='task%s' % i,
+            task_type=self.task_type.type_name,
+            batch=batch,
+            closed=closed,
+            task_data={'data': i}).save()
+
+        return self.task_type.answer_model(
+            task=task,
+            created_by=self.user,
+            created_at=created_at,
+            task_type=self.task_type.type_name,
+            result={'answer': i}).save()
+
+    def _export(self, name, **kwargs):
+        path = os.path.join(self.folder, name)
+        db.export_reports(self.task_type, path, 'default', True, **kwargs)
+
+        with open(path) as f:
+            return [a['answer']['answer']
+                    for line in f for a in json.loads(line)]
+
+    def test_export_since_checkpoint(self):
+        hour_ago = datetime.now() - timedelta(hours=1)
+        self._answer(0, hour_ago)
+        self._answer(1, hour_ago, closed=False)
+        self._answer(2, hour_ago, batch='other')
+
+        self.assertCountEqual(self._export('first.jsonl', since='nightly'),
+                              [0, 1])
+
+        checkpoint = ExportCheckpoint.objects.get(name='nightly')
+
+        self.assertEqual(checkpoint.exported, 2)
+        self.assertLess(abs(checkpoint.watermark - hour_ago),
+                        timedelta(milliseconds=1))
+
+        # Pretend the first run was half an hour ago
+        checkpoint.update(set__watermark=hour_ago + timedelta(minutes=30))
+        self._answer(3, hour_ago + timedelta(minutes=45))
+        self._answer(4, datetime.now() + timedelta(minutes=1))
+
+        self.assertEqual(self._export('second.jsonl', since='nightly'), [3])
+        self.assertEqual(ExportCheckpoint.objects.get().exported, 3)
+
+    def test_export_since_checkpoint_late_answers(self):
+        now = datetime.now()
+        self._answer(0, now - timedelta(minutes=1))
+
+        self.assertEqual(self._export('first.jsonl', since='nightly'), [0])
+
+        # stamped before the last exported answer, but stored after it
+        self._answer(1, now - timedelta(minutes=2))
+
+        self.assertEqual(self._export('second.jsonl', since='nightly'), [1])
+        self.assertEqual(self._export('third.jsonl', since='nightly'), [])
+        self.assertEqual(ExportCheckpoint.objects.get().exported, 2)
+
+    def test_export_since_moment(self):
+        self._answer(0, datetime(2020, 1, 1, 10))
+        self._answer(1, datetime(2020, 1, 2))
+
+        self.assertEqual(
+            self._export('a.jsonl', since='2020-01-01T10:00:00'), [1])
+        self.assertCountEqual(self._export('b.jsonl', since='2020-01-01'),
+                              [0, 1])
+        self.assertEqual(ExportCheckpoint.objects.count(), 0)
+
+    def test_follow_until_interrupted(self):
+        self._answer(0, datetime.now() - timedelta(minutes=1))
+        self.task_type.report_exporter.wait = Mock(
+            side_effect=KeyboardInterrupt)
+
+        self.assertEqual(
+            self._export('a.jsonl', since='tail', follow=True), [0])
+        self.assertEqual(ExportCheckpoint.objects.get().exported, 1)
+
+    def test_sharded_export(self):
+        for i, batch in enumerate(['a', 'b', 'b', None, 'a/c']):
+            self._answer(i, datetime.now(), batch=batch)
+
+        self._answer(5, datetime.now(), closed=False, batch='a')
+        export = ShardedExport([self.task_type], workers=0)
+
+        self.assertEqual(
+            [(b, n) for _, b, n in export.partitions(['a', 'b', None])],
+            [('b', 2), (None, 1), ('a', 1)])
+
+        manifest = export.run(self.folder, '.jsonl.gz')
+
+        with open(os.path.join(self.folder, MANIFEST)) as f:
+            self.assertEqual(json.load(f), manifest)
+
+        self.assertEqual((manifest['tasks'], manifest['answers']), (5, 5))
+        self.assertEqual(
+            [s['path'] for s in manifest['shards']],
+            ['FakeTaskType-_none_.jsonl.gz', 'FakeTaskType-a.jsonl.gz',
+             'FakeTaskType-a_c.jsonl.gz', 'FakeTaskType-b.jsonl.gz'])
+
+        for shard in manifest['shards']:
+            with open(os.path.join(self.folder, shard['path']), 'rb') as f:
+                data = f.read()
+
+            self.assertEqual(hashlib.sha256(data).hexdigest(),
+                             shard['sha256'])
+            self.assertEqual(
+                len(gzip.decompress(data).splitlines()), shard['tasks'])
+
+    def test_export_csv_gzip(self):
+        path = os.path.join(self.folder, 'answers.csv.gz')
+
+        for i in range(3):
+            self._answer(i, datetime.now())
+
+        db.export_reports(self.task_type, path, 'default', True)
+
+        with io.TextIOWrapper(gzip.open(path), newline='') as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertCountEqual([r['task.id'] for r in rows],
+                              ['task0', 'task1', 'task2'])
+        self.assertEqual(rows[0]['user.username'], 'user0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+test_importer
+"""
+import bz2
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click import UsageError
+
+from vulyk.cli import db
+from vulyk.ext.importer import TaskImporter
+from vulyk.models.imports import ImportCheckpoint
+from vulyk.models.stats import TaskTypeCounters
+from vulyk.models.tasks import AbstractTask, Batch
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+
+class TestTaskImporter(BaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.folder = tempfile.mkdtemp()
+        self.task_type = FakeType({})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        AbstractTask.objects.delete()
+        TaskTypeCounters.objects.delete()
+        ImportCheckpoint.objects.delete()
+        Batch.objects.delete()
+
+        super().tearDown()
+
+    def _write(self, name, lines, opener=open):
+        path = os.path.join(self.folder, name)
+
+        with opener(path, 'wt') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        return path
+
+    def test_loads_compressed_files(self):
+        tasks = [json.dumps({'name': str(i)}) for i in range(5)]
+        paths = [self._write('tasks.json', tasks[:2]),
+                 self._write('tasks.json.gz', tasks[2:4], gzip.open),
+                 self._write('tasks.json.bz2', tasks[4:], bz2.open)]
+
+        stats = TaskImporter(self.task_type, chunk_size=2, workers=0) \
+            .run(paths, 'default')
+
+        self.assertEqual(stats.inserted, 5)
+        self.assertEqual(self.task_type.task_model.objects.count(), 5)
+        self.assertEqual(self.task_type.get_counters().total, 5)
+        self.assertEqual(
+            self.task_type.task_model.objects.get(
+                id=self.task_type.make_task_id({'name': '0'})).task_data,
+            {'name': '0'})
+
+    def test_tolerates_duplicates_and_junk(self):
+        path = self._write('tasks.json', [
+            json.dumps({'name': '0'}),
+            '',
+            'not a json',
+            json.dumps({'name': '1'}),
+            json.dumps(['a list']),
+            json.dumps({'name': '0'})
+        ])
+        importer = TaskImporter(self.task_type, chunk_size=10, workers=0)
+
+        first = importer.run([path], 'default')
+        second = importer.run([path], 'default')
+
+        self.assertEqual((first.inserted, first.duplicates, first.invalid),
+                         (2, 1, 2))
+        self.assertEqual((second.inserted, second.duplicates), (0, 3))
+        self.assertEqual(self.task_type.get_counters().total, 2)
+
+    def test_parses_in_processes(self):
+        path = self._write('tasks.json', [json.dumps({'name': str(i)})
+                                          for i in range(50)])
+        progress = []
+
+        stats = TaskImporter(self.task_type, chunk_size=7, workers=2,
+                             writers=2) \
+            .run([path], 'default', lambda p, s: progress.append(p))
+
+        self.assertEqual(stats.inserted, 50)
+        self.assertEqual(progress, [path] * 8)
+        self.assertGreater(stats.tasks_per_second, 0)
+        self.assertEqual(stats.bytes, os.path.getsize(path))
+
+    def test_resumes_interrupted(self):
+        tasks = [json.dumps({'name': str(i)}) for i in range(10)]
+        path = self._write('tasks.json.gz', tasks, gzip.open)
+
+        class Interrupted(TaskImporter):
+            def _insert(self, docs, checkpoint_id):
+                if docs[0]['task_data'] == {'name': '6'}:
+                    raise KeyboardInterrupt()
+
+                return super()._insert(docs, checkpoint_id)
+
+        self.assertRaises(
+            KeyboardInterrupt,
+            lambda: Interrupted(self.task_type, chunk_size=3, workers=0,
+                                writers=1).run([path], 'default'))
+
+        importer = TaskImporter(self.task_type, chunk_size=3, workers=0)
+        checkpoint = ImportCheckpoint.objects.get(path=path)
+
+        self.assertEqual((checkpoint.line, checkpoint.inserted), (6, 6))
+        self.assertTrue(importer.journaled([path], 'default'))
+
+        stats = importer.run([path], 'default', resume=True)
+
+        self.assertEqual((stats.lines, stats.inserted), (4, 4))
+        self.assertEqual(importer.inserted([path], 'default'), 10)
+        self.assertEqual(self.task_type.task_model.objects.count(), 10)
+
+        stats = importer.run([path], 'default', resume=True)
+
+        self.assertEqual(stats.lines, 0, 'Finished file should be skipped')
+
+        importer.forget([path], 'default')
+
+        self.assertFalse(importer.journaled([path], 'default'))
+
+    def test_load_requires_resume_once_journaled(self):
+        path = self._write('tasks.json',
+                           [json.dumps({'name': str(i)}) for i in range(3)])
+
+        # loaded, but the batch wasn't recorded
+        TaskImporter(self.task_type, workers=0).run([path], 'default')
+
+        with self.assertRaises(UsageError) as ctx:
+            db.load_tasks(self.task_type, path, 'default', workers=0)
+
+        self.assertIn('--resume', ctx.exception.message)
+        self.assertEqual(
+            db.load_tasks(self.task_type, path, 'default', workers=0,
+                          resume=True), 3)
+
+    def test_resume_counts_tasks_missed_by_journal(self):
+        batch = Batch(id='default', task_type=self.task_type.type_name,
+                      tasks_count=2).save()
+
+        for i in range(2):
+            self.task_type.task_model(id='earlier%s' % i,
+                                      task_type=self.task_type.type_name,
+                                      batch=batch,
+                                      task_data={'name': i}).save()
+
+        path = self._write('tasks.json',
+                           [json.dumps({'name': str(i)}) for i in range(3)])
+        TaskImporter(self.task_type, workers=0).run([path], 'default')
+        # interrupted after tasks were stored, but before they were counted
+        ImportCheckpoint.objects.update(set__inserted=1)
+
+        self.assertEqual(
+            db.load_tasks(self.task_type, path, 'default', workers=0,
+                          resume=True), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+test_lastseen
+"""
+from datetime import datetime, timedelta
+import unittest
+from unittest.mock import patch
+
+from vulyk.ext.lastseen import LastSeenTracker
+from vulyk.models.user import Group, User
+
+from .base import BaseTest
+
+
+class TestLastSeen(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        Group.objects.create(description='test', id='default')
+
+    @classmethod
+    def tearDownClass(cls):
+        Group.objects.delete()
+
+        super().tearDownClass()
+
+    def tearDown(self):
+        User.objects.delete()
+
+        super().tearDown()
+
+    def _load(self, user):
+        return User.objects.get(id=user.id)
+
+    def test_throttled(self):
+        tracker = LastSeenTracker(User, interval=60)
+        seen = datetime.now() - timedelta(seconds=30)
+        user = User(username='user0', email='user0@email.com',
+                    last_login=seen).save()
+
+        self.assertFalse(tracker.touch(self._load(user)))
+        self.assertEqual(self._load(user).last_login.replace(microsecond=0),
+                         seen.replace(microsecond=0))
+        self.assertEqual((tracker.writes, tracker.skipped), (0, 1))
+
+    def test_written_once_stale(self):
+        tracker = LastSeenTracker(User, interval=60)
+        seen = datetime.now() - timedelta(seconds=90)
+        user = User(username='user0', email='user0@email.com',
+                    last_login=seen).save()
+        stale = [self._load(user), self._load(user)]
+
+        self.assertTrue(tracker.touch(stale[0]))
+        self.assertFalse(tracker.touch(stale[1]),
+                         'Concurrent requests must not write twice')
+        self.assertGreater(self._load(user).last_login, seen)
+        self.assertEqual(tracker.writes, 1)
+
+    def test_does_not_save_document(self):
+        tracker = LastSeenTracker(User, interval=0)
+        user = User(username='user0', email='user0@email.com').save()
+
+        with patch.object(User, 'save') as save:
+            tracker.touch(self._load(user))
+
+        save.assert_not_called()
+        self.assertEqual(tracker.writes, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,8 +7,10 @@ test_leaderboard
 from datetime import datetime
 import unittest
 
+from bson import ObjectId
 
 from vulyk.ext.leaderboard import LeaderBoardManager
+from vulyk.models.stats import LeaderboardScore
 from vulyk.models.tasks import Batch, AbstractAnswer, AbstractTask
 from vulyk.models.user import User, Group
 
@@ -37,9 +39,25 @@ class TestLeaderBoard(BaseTest):
         AbstractTask.objects.delete()
         AbstractAnswer.objects.delete()
         Batch.objects.delete()
+        LeaderboardScore.objects.delete()
 
         super().tearDown()
 
+    def _answer(self, task_type, task, user):
+        return task_type.answer_model(
+            task=task,
+            created_by=user,
+            created_at=datetime.now(),
+            task_type=task_type.type_name,
+            result={}
+        ).save()
+
+    def _scores(self, task_type, leaders):
+        for user_id, score in leaders:
+            LeaderboardScore(task_type=task_type.type_name,
+                             user=user_id,
+                             score=score).save()
+
     def test_get_leaders_sorted_yield(self):
         """
         Really slow garbage. Uses PyExecJs to emulate Map-Reduce in MongoDB.
@@ -88,42 +106,134 @@ class TestLeaderBoard(BaseTest):
             User(username='user%s' % i, email='user%s@email.com' % i).save()
             for i in range(3)
         ]
-        leaders = [(users[i].id, i) for i in range(3)]
         task_type = FakeType({})
         manager = LeaderBoardManager(task_type.type_name,
                                      task_type.answer_model,
                                      User)
-        manager.get_leaders = lambda: leaders
+        self._scores(task_type, [(users[i].id, i + 1) for i in range(3)])
 
         self.assertEqual(
             manager.get_leaderboard(5),
             [
-                {'rank': 1, 'user': users[2], 'freq': 2},
-                {'rank': 2, 'user': users[1], 'freq': 1},
-                {'rank': 3, 'user': users[0], 'freq': 0}
+                {'rank': 1, 'user': users[2], 'freq': 3},
+                {'rank': 2, 'user': users[1], 'freq': 2},
+                {'rank': 3, 'user': users[0], 'freq': 1}
             ]
         )
+        self.assertEqual([e['user'] for e in manager.get_leaderboard(2)],
+                         [users[2], users[1]])
 
     def test_get_leaderboard_if_same_count(self):
         users = [
             User(username='user%s' % i, email='user%s@email.com' % i).save()
             for i in range(4)
         ]
-        leaders = [(users[i].id, i) for i in range(3)]
-        leaders.append((users[3].id, 1))
+        leaders = [(users[i].id, i + 1) for i in range(3)]
+        leaders.append((users[3].id, 2))
         task_type = FakeType({})
         manager = LeaderBoardManager(task_type.type_name,
                                      task_type.answer_model,
                                      User)
-        manager.get_leaders = lambda: leaders
+        self._scores(task_type, leaders)
+
+        self.assertEqual(
+            sorted(manager.get_leaderboard(5),
+                   key=lambda e: (e['rank'], e['user'].username)),
+            [
+                {'rank': 1, 'user': users[2], 'freq': 3},
+                {'rank': 2, 'user': users[1], 'freq': 2},
+                {'rank': 2, 'user': users[3], 'freq': 2},
+                {'rank': 3, 'user': users[0], 'freq': 1}
+            ]
+        )
+        # members sharing the last position are all there
+        self.assertEqual(len(manager.get_leaderboard(2)), 3)
+
+    def test_scores_incremented_on_new_answers_only(self):
+        task_type = FakeType({})
+        manager = task_type.leaderboard_manager
+        user = User(username='user0', email='user0@email.com').save()
+        tasks = [
+            task_type.task_model(
+                id='task%s' % i,
+                task_type=task_type.type_name,
+                task_data={'data': 'data'}
+            ).save() for i in range(2)
+        ]
+
+        for task in tasks:
+            answer = self._answer(task_type, task, user)
+
+        answer.result = {'changed': True}
+        answer.save()
+
+        self.assertEqual(manager.get_leaders(), [(user.id, 2)])
+
+    def test_rebuild(self):
+        task_type = FakeType({})
+        manager = task_type.leaderboard_manager
+        users = [
+            User(username='user%s' % i, email='user%s@email.com' % i).save()
+            for i in range(3)
+        ]
+        task = task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            task_data={'data': 'data'}
+        ).save()
+
+        for u in users[:2]:
+            self._answer(task_type, task, u)
+
+        LeaderboardScore.objects(user=users[0]).update(set__score=10)
+        LeaderboardScore(task_type=task_type.type_name,
+                         user=users[2],
+                         score=3).save()
+
+        self.assertEqual(manager.rebuild(), 2)
+        self.assertEqual(sorted(manager.get_leaders()),
+                         sorted([(users[0].id, 1), (users[1].id, 1)]))
+
+    def test_get_leaderboard_skips_missing_users(self):
+        users = [
+            User(username='user%s' % i, email='user%s@email.com' % i).save()
+            for i in range(2)
+        ]
+        task_type = FakeType({})
+        manager = task_type.leaderboard_manager
+        # the member is gone, the score is left behind
+        self._scores(task_type, [(ObjectId(), 2), (users[1].id, 1)])
+
+        self.assertEqual(manager.get_leaderboard(5),
+                         [{'rank': 2, 'user': users[1], 'freq': 1}])
+
+    def test_get_leaderboard_cached(self):
+        users = [
+            User(username='user%s' % i, email='user%s@email.com' % i).save()
+            for i in range(2)
+        ]
+        task_type = FakeType({'LEADERBOARD_CACHE_TTL': 60})
+        manager = task_type.leaderboard_manager
+        task = task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            task_data={'data': 'data'}
+        ).save()
+
+        self._answer(task_type, task, users[0])
+        board = manager.get_leaderboard(5)
+
+        LeaderboardScore.objects(user=users[0]).update(set__score=5)
+
+        self.assertIs(manager.get_leaderboard(5), board)
+
+        self._answer(task_type, task, users[1])
 
         self.assertEqual(
             manager.get_leaderboard(5),
             [
-                {'rank': 1, 'user': users[2], 'freq': 2},
-                {'rank': 2, 'user': users[1], 'freq': 1},
-                {'rank': 2, 'user': users[3], 'freq': 1},
-                {'rank': 3, 'user': users[0], 'freq': 0}
+                {'rank': 1, 'user': users[0], 'freq': 5},
+                {'rank': 2, 'user': users[1], 'freq': 1}
             ]
         )
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_leasing
+"""
+from datetime import datetime, timedelta
+import unittest
+from unittest.mock import ANY, patch
+
+from vulyk.ext.leasing import LeaseManager
+from vulyk.models.leases import TaskLease
+from vulyk.models.stats import WorkSession
+from vulyk.models.tasks import AbstractAnswer, AbstractTask, Batch
+from vulyk.models.user import User, Group
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+
+class TestLeasing(BaseTest):
+    TASK_TYPE = FakeType.type_name
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        Group.objects.create(
+            description='test', id='default', allowed_types=[cls.TASK_TYPE])
+
+    @classmethod
+    def tearDownClass(cls):
+        Group.objects.delete()
+
+        super().tearDownClass()
+
+    def tearDown(self):
+        User.objects.delete()
+        AbstractTask.objects.delete()
+        AbstractAnswer.objects.delete()
+        Batch.objects.delete()
+        WorkSession.objects.delete()
+        TaskLease.objects.delete()
+
+        super().tearDown()
+
+    def _make_task(self, i=0, **kwargs):
+        return FakeType.task_model(
+            id='task%s' % i,
+            task_type=FakeType.type_name,
+            task_data={'data': 'data'},
+            **kwargs).save()
+
+    def _make_user(self, i=0):
+        return User(username='user%s' % i,
+                    email='user%s@email.com' % i).save()
+
+    def test_acquire_and_release(self):
+        manager = LeaseManager(TaskLease)
+        task = self._make_task()
+        user = self._make_user()
+
+        manager.acquire(task, user.id)
+        manager.acquire(task, user.id)
+
+        self.assertEqual(manager.active_leases([task.id]), {task.id: 1})
+
+        manager.release(task, user.id)
+
+        self.assertEqual(manager.active_leases([task.id]), {})
+
+    def test_active_leases_exclude_user(self):
+        manager = LeaseManager(TaskLease)
+        task = self._make_task()
+        users = [self._make_user(i) for i in range(3)]
+
+        for u in users:
+            manager.acquire(task, u.id)
+
+        self.assertEqual(
+            manager.active_leases([task.id], exclude_user=users[0].id),
+            {task.id: 2})
+
+    def _expire(self, task, user):
+        TaskLease.objects(task=task, user=user).update(
+            set__expires_at=datetime.utcnow() - timedelta(seconds=1))
+
+    def test_reclaim_expired(self):
+        manager = LeaseManager(TaskLease)
+        task = self._make_task()
+        users = [self._make_user(i) for i in range(2)]
+
+        for u in users:
+            manager.acquire(task, u.id)
+
+        self._expire(task, users[1])
+
+        self.assertEqual(manager.active_leases([task.id]), {task.id: 1})
+        self.assertEqual(manager.reclaim_expired(), 1)
+        self.assertEqual(TaskLease.objects.count(), 1)
+        self.assertEqual(task.reload().leases_count, 1)
+
+    def test_acquire_within_redundancy(self):
+        manager = LeaseManager(TaskLease)
+        task = self._make_task(users_count=1)
+        users = [self._make_user(i) for i in range(3)]
+
+        self.assertTrue(manager.acquire(task, users[0].id, 2))
+        self.assertFalse(manager.acquire(task, users[1].id, 2),
+                         'Answers and leases must not exceed redundancy')
+        self.assertTrue(manager.acquire(task, users[0].id, 2),
+                        'Own lease is prolonged')
+        self.assertEqual(task.reload().leases_count, 1)
+
+        manager.release(task, users[0].id)
+
+        self.assertEqual(task.reload().leases_count, 0)
+        self.assertTrue(manager.acquire(task, users[2].id, 2))
+
+    def test_acquire_reclaims_expired_slots(self):
+        manager = LeaseManager(TaskLease)
+        task = self._make_task()
+        users = [self._make_user(i) for i in range(2)]
+
+        manager.acquire(task, users[0].id, 1)
+        self._expire(task, users[0])
+
+        self.assertTrue(manager.acquire(task, users[1].id, 1))
+        self.assertEqual(TaskLease.objects.get().user, users[1])
+        self.assertEqual(task.reload().leases_count, 1)
+
+    def test_session_lifecycle(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        task = self._make_task()
+        users = [self._make_user(i) for i in range(2)]
+
+        for u in users:
+            task_type.work_session_manager.start_work_session(task, u.id)
+
+        self.assertEqual(manager.active_leases([task.id]), {task.id: 2})
+
+        task_type.skip_task(task.id, users[0])
+        task_type.on_task_done(users[1], task.id, {'result': 'result'})
+
+        self.assertEqual(manager.active_leases([task.id]), {})
+
+    def test_assignment_prefers_free_slots(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        batch = Batch(id='default',
+                      task_type=task_type.type_name,
+                      tasks_count=2).save()
+        tasks = [self._make_task(i, batch=batch) for i in range(2)]
+        users = [self._make_user(i) for i in range(task_type.redundancy + 1)]
+
+        for u in users[:-1]:
+            manager.acquire(tasks[0], u.id)
+
+        for _ in range(5):
+            self.assertEqual(task_type.get_next(users[-1]),
+                             dict(tasks[1].as_dict(), session=ANY),
+                             'Should not give fully leased task away')
+
+    def test_assignment_reserves_slots_atomically(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        tasks = [self._make_task(i) for i in range(2)]
+        users = [self._make_user(i) for i in range(task_type.redundancy + 1)]
+
+        for u in users[:-2]:
+            manager.acquire(tasks[0], u.id)
+
+        # the last slot is taken by another request after leases were read
+        occupied = task_type.assignment_manager._occupied(users[-1])
+        manager.acquire(tasks[0], users[-2].id, task_type.redundancy)
+
+        with patch.object(task_type.assignment_manager, '_occupied',
+                          return_value=occupied), \
+                patch.object(task_type.assignment_manager, '_pick',
+                             side_effect=[tasks[0], tasks[1]]):
+            self.assertEqual(task_type.get_next(users[-1]),
+                             dict(tasks[1].as_dict(), session=ANY))
+
+        self.assertEqual(tasks[0].reload().leases_count,
+                         task_type.redundancy)
+        self.assertEqual(tasks[1].reload().leases_count, 1)
+
+    def test_assignment_finds_free_slots_beyond_sample(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        first, second = [
+            Batch(id=b, task_type=task_type.type_name, tasks_count=30).save()
+            for b in ('b1', 'b2')]
+        tasks = [self._make_task(i, batch=first) for i in range(30)]
+        self._make_task(30, batch=second)
+        users = [self._make_user(i) for i in range(task_type.redundancy + 1)]
+
+        # far more occupied tasks than are sampled at once
+        for task in tasks[:-2]:
+            for u in users[:-1]:
+                manager.acquire(task, u.id)
+
+        for _ in range(10):
+            given = task_type.get_next(users[-1])
+
+            self.assertIn(given['id'], ('task28', 'task29'),
+                          'Should give free tasks of the first batch away')
+            manager.release(FakeType.task_model(id=given['id']),
+                            users[-1].id)
+
+    def test_assignment_gives_occupied_if_nothing_else(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        task = self._make_task()
+        users = [self._make_user(i) for i in range(task_type.redundancy + 1)]
+
+        for u in users[:-1]:
+            manager.acquire(task, u.id)
+
+        self.assertEqual(task_type.get_next(users[-1]),
+                         dict(task.as_dict(), session=ANY))
+
+    def test_prefetch_leases_distinct_tasks(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        tasks = [self._make_task(i) for i in range(5)]
+        user = self._make_user()
+
+        current = task_type.get_next(user)
+        prefetched = task_type.prefetch(user, 2, exclude=[current['id']])
+        ids = [current['id']] + [t['id'] for t in prefetched]
+
+        self.assertEqual(len(prefetched), 2)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(sorted(manager.leased_to(user.id)), sorted(ids))
+        self.assertEqual(
+            WorkSession.objects(user=user, task__in=ids).count(), 3)
+
+        # leased tasks aren't given again
+        rest = task_type.prefetch(user, 5)
+
+        self.assertEqual(
+            sorted(ids + [t['id'] for t in rest]),
+            sorted(t.id for t in tasks))
+
+    def test_next_skips_prefetched(self):
+        task_type = FakeType({})
+        tasks = [self._make_task(i) for i in range(4)]
+        user = self._make_user()
+
+        prefetched = task_type.prefetch(user, 3)
+        ids = [t['id'] for t in prefetched]
+        current = task_type.get_next(user)
+
+        self.assertNotIn(current['id'], ids)
+        self.assertEqual(sorted(ids + [current['id']]),
+                         sorted(t.id for t in tasks))
+        # held tasks are given back once nothing else is left
+        self.assertIn(task_type.get_next(user)['id'], ids + [current['id']])
+
+    def test_prefetch_ignores_expired_leases(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager.lease_manager
+        task = self._make_task()
+        user = self._make_user()
+
+        TaskLease(task=task, user=user, task_type=task.task_type,
+                  expires_at=datetime.utcnow() - timedelta(seconds=1)).save()
+
+        self.assertEqual(manager.leased_to(user.id), [])
+        self.assertEqual(task_type.prefetch(user, 1),
+                         [dict(task.as_dict(), session=ANY)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+test_progress
+"""
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from vulyk import app as vulyk_app
+from vulyk.ext.progress import ProgressMetrics
+from vulyk.models.stats import TaskTypeCounters
+from vulyk.models.tasks import AbstractAnswer, AbstractTask, Batch
+from vulyk.models.user import Group, User
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+
+class TestProgressMetrics(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        Group.objects.create(description='test', id='default',
+                             allowed_types=[FakeType.type_name])
+
+    @classmethod
+    def tearDownClass(cls):
+        Group.objects.delete()
+
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        self.task_type = FakeType({})
+        Batch(id='a', task_type=self.task_type.type_name,
+              tasks_count=10, tasks_processed=4).save()
+        Batch(id='b', task_type=self.task_type.type_name,
+              tasks_count=2, tasks_processed=2, closed=True).save()
+        TaskTypeCounters(id=self.task_type.type_name,
+                         total=12, closed=6).save()
+        task = self.task_type.task_model(
+            id='task0', task_type=self.task_type.type_name, batch='a',
+            task_data={'data': 0}).save()
+
+        # 3 answers within the last 15 minutes, 1 long before
+        for minutes in (1, 5, 10, 60):
+            self.task_type.answer_model(
+                task=task,
+                created_by=User(username='u%s' % minutes,
+                                email='u%s@email.com' % minutes).save(),
+                created_at=datetime.now() - timedelta(minutes=minutes),
+                task_type=self.task_type.type_name,
+                result={}).save()
+
+    def tearDown(self):
+        User.objects.delete()
+        Batch.objects.delete()
+        AbstractTask.objects.delete()
+        AbstractAnswer.objects.delete()
+        TaskTypeCounters.objects.delete()
+
+        super().tearDown()
+
+    def test_snapshot(self):
+        snapshot = ProgressMetrics([self.task_type], window=900).snapshot()
+        task_type = snapshot['task_types'][self.task_type.type_name]
+
+        self.assertEqual((task_type['tasks'], task_type['open']), (12, 6))
+        self.assertEqual(task_type['answers_per_minute'], 0.2)
+        # 6 open tasks need 3 answers each at 3 answers per 900 seconds
+        self.assertEqual(task_type['eta_seconds'], 6 * 3 * 300)
+        self.assertEqual(snapshot['batches']['a']['percent'], 40.0)
+        self.assertEqual(snapshot['batches']['a']['eta_seconds'],
+                         6 * 3 * 300)
+        self.assertEqual(snapshot['batches']['b']['eta_seconds'], None)
+
+    def test_snapshot_cached(self):
+        metrics = ProgressMetrics([self.task_type], ttl=60)
+        first = metrics.snapshot()
+        Batch.objects(id='a').update(inc__tasks_processed=1)
+
+        self.assertIs(metrics.snapshot(), first)
+
+        metrics.invalidate()
+
+        self.assertEqual(metrics.snapshot()['batches']['a']['processed'], 5)
+
+    def test_prometheus(self):
+        text = ProgressMetrics([self.task_type]).prometheus()
+
+        self.assertIn('vulyk_tasks{state="open",task_type="FakeTaskType"} 6',
+                      text)
+        self.assertIn('vulyk_batch_processed_tasks{batch="a",'
+                      'task_type="FakeTaskType"} 4', text)
+        self.assertNotIn('vulyk_batch_eta_seconds{batch="b"', text)
+        self.assertIn('# TYPE vulyk_eta_seconds gauge', text)
+
+    def test_endpoints(self):
+        client = vulyk_app.app.test_client()
+
+        with patch.object(vulyk_app, 'PROGRESS',
+                          ProgressMetrics([self.task_type])), \
+                patch.dict(vulyk_app.app.config, {'METRICS_TOKEN': 'secret'}):
+            self.assertEqual(client.get('/metrics.json').status_code, 403)
+            self.assertEqual(
+                client.get('/metrics.json?token=wrong').status_code, 403)
+
+            resp = client.get('/metrics.json?token=secret')
+            result = json.loads(resp.data.decode('utf8'))['result']
+
+            self.assertEqual(result['batches']['a']['tasks'], 10)
+
+            resp = client.get('/metrics',
+                              headers={'Authorization': 'Bearer secret'})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, 'text/plain')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+test_signals
+"""
+import threading
+import unittest
+
+from blinker import Signal
+
+from vulyk import signals
+from vulyk.models.jobs import DeferredJob, JOB_FAILED
+from vulyk.models.tasks import Batch
+
+from .base import BaseTest
+from .fixtures import FakeType
+
+calls = []
+failures = {}
+lock = threading.Lock()
+on_test = Signal()
+
+
+@on_test.connect
+@signals.deferrable(key=lambda sender, user, n: user, retries=2)
+def record(sender, user, n):
+    with lock:
+        if failures.get(n, 0) > 0:
+            failures[n] -= 1
+
+            raise ValueError('Failed {}'.format(n))
+
+        calls.append((user, n, sender))
+
+
+@signals.deferrable()
+def record_barrier(sender, user, n):
+    with lock:
+        calls.append(('barrier', n, sender))
+
+
+class TestDispatchers(BaseTest):
+    def setUp(self):
+        super().setUp()
+
+        calls.clear()
+        failures.clear()
+
+    def tearDown(self):
+        signals.set_dispatcher(signals.SyncDispatcher())
+        DeferredJob.objects.delete()
+        Batch.objects.delete()
+
+        super().tearDown()
+
+    def test_sync(self):
+        on_test.send('sender', user='user0', n=0)
+
+        self.assertEqual(calls, [('user0', 0, 'sender')])
+
+    def test_sync_propagates_errors(self):
+        failures[0] = 1
+
+        self.assertRaises(
+            ValueError, lambda: on_test.send('sender', user='user0', n=0))
+
+    def test_threads_keep_order_per_key(self):
+        dispatcher = signals.ThreadPoolDispatcher(workers=3, backoff=0)
+        signals.set_dispatcher(dispatcher)
+        failures[3] = 2
+
+        for n in range(10):
+            on_test.send('sender', user='user%s' % (n % 2), n=n)
+
+        dispatcher.join()
+
+        for user in ('user0', 'user1'):
+            self.assertEqual(
+                [c[1] for c in calls if c[0] == user],
+                [n for n in range(10) if 'user%s' % (n % 2) == user])
+
+    def test_threads_give_up_after_retries(self):
+        dispatcher = signals.ThreadPoolDispatcher(workers=1, backoff=0)
+        signals.set_dispatcher(dispatcher)
+        failures[0] = 3
+
+        on_test.send('sender', user='user0', n=0)
+        on_test.send('sender', user='user0', n=1)
+        dispatcher.join()
+
+        self.assertEqual(calls, [('user0', 1, 'sender')])
+
+    def test_threads_barrier_waits_for_earlier_calls(self):
+        dispatcher = signals.ThreadPoolDispatcher(workers=4, backoff=0)
+        signals.set_dispatcher(dispatcher)
+
+        for n in range(8):
+            record('sender', user='user%s' % n, n=n)
+
+        record_barrier('sender', user=None, n=8)
+        dispatcher.join()
+
+        self.assertEqual(len(calls), 9)
+        self.assertEqual(calls[-1], ('barrier', 8, 'sender'))
+
+    def test_mongo_queue(self):
+        dispatcher = signals.MongoQueueDispatcher(backoff=0)
+        signals.set_dispatcher(dispatcher)
+        batch = Batch(id='default', task_type=FakeType.type_name).save()
+
+        on_test.send(batch, user='user0', n=0)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(DeferredJob.objects.count(), 1)
+        self.assertEqual(dispatcher.work(burst=True), 1)
+        self.assertEqual(calls, [('user0', 0, batch)])
+        self.assertEqual(DeferredJob.objects.count(), 0)
+
+    def test_mongo_queue_keeps_order_per_key(self):
+        dispatcher = signals.MongoQueueDispatcher(backoff=0)
+        signals.set_dispatcher(dispatcher)
+
+        for n in range(3):
+            on_test.send(None, user='user0', n=n)
+
+        on_test.send(None, user='user1', n=3)
+        first = dispatcher.claim()
+        second = dispatcher.claim()
+
+        self.assertEqual(first.payload['kwargs']['n'], 0)
+        self.assertEqual(second.payload['kwargs']['n'], 3,
+                         'Jobs of the same key must wait for earlier ones')
+        self.assertIsNone(dispatcher.claim())
+
+    def test_mongo_queue_retries_and_fails(self):
+        dispatcher = signals.MongoQueueDispatcher(backoff=0)
+        signals.set_dispatcher(dispatcher)
+        failures[0] = 5
+
+        on_test.send(None, user='user0', n=0)
+        on_test.send(None, user='user0', n=1)
+
+        self.assertEqual(dispatcher.work(burst=True), 4)
+
+        job = DeferredJob.objects.get()
+
+        self.assertEqual(job.state, JOB_FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(calls, [('user0', 1, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
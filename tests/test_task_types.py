@@ -8,15 +8,17 @@ from datetime import datetime
 
 from bson import ObjectId
 import unittest
-from unittest.mock import patch, Mock
+from unittest.mock import ANY, Mock
 
+from vulyk import utils
+from vulyk.ext.export import ReportExporter
 from vulyk.ext.leaderboard import LeaderBoardManager
 from vulyk.models.exc import (
     TaskImportError,
     TaskNotFoundError,
     TaskValidationError,
     WorkSessionLookUpError)
-from vulyk.models.stats import WorkSession
+from vulyk.models.stats import TaskTypeCounters, WorkSession
 from vulyk.models.task_types import AbstractTaskType
 from vulyk.models.tasks import AbstractTask, AbstractAnswer, Batch
 from vulyk.models.user import User, Group
@@ -47,6 +49,7 @@ class TestTaskTypes(BaseTest):
         AbstractAnswer.objects.delete()
         Batch.objects.delete()
         WorkSession.objects.delete()
+        TaskTypeCounters.objects.delete()
 
         super().tearDown()
 
@@ -79,19 +82,37 @@ class TestTaskTypes(BaseTest):
 
         self.assertRaises(AssertionError, lambda: NoTemplateName({}))
 
-    @patch('mongoengine.queryset.base.BaseQuerySet.count', lambda *a: 22)
     def test_to_dict(self):
         got = {
             'name': 'Fake name',
             'description': 'Fake description',
             'type': 'FakeTaskType',
             'tasks': 22,
-            'closed_tasks': 22,
-            'open_tasks': 0,
-            'has_tasks': False
+            'closed_tasks': 20,
+            'open_tasks': 2,
+            'has_tasks': True
         }
+        TaskTypeCounters(id=FakeType.type_name, total=22, closed=20).save()
 
         self.assertDictEqual(FakeType({}).to_dict(), got)
+
+    def test_counters_built_if_missing(self):
+        task_type = FakeType({})
+
+        for i, closed in enumerate([True, False, False]):
+            task_type.task_model(
+                id='task%s' % i,
+                task_type=task_type.type_name,
+                closed=closed,
+                task_data={'data': 'data'}).save()
+
+        AbstractTask(id='alien', task_type='alien',
+                     task_data={'data': 'data'}).save()
+        counters = task_type.get_counters()
+
+        self.assertEqual((counters.total, counters.closed), (3, 1))
+        self.assertEqual(
+            TaskTypeCounters.objects.get(id=task_type.type_name).open, 2)
     # endregion Task type
 
     # region Import tasks
@@ -100,9 +121,31 @@ class TestTaskTypes(BaseTest):
         repo = FakeType({})
 
         repo.import_tasks(tasks, 'default')
+        repo.import_tasks([{'name': '4'}], 'default')
+
+        self.assertEqual(len(FakeType.task_model.objects()), len(tasks) + 1)
+        self.assertEqual(repo.task_model.objects.count(), len(tasks) + 1)
+        self.assertEqual(repo.get_counters().total, len(tasks) + 1)
+
+    def test_import_tasks_legacy_ids(self):
+        repo = FakeType({})
+
+        repo.import_tasks([{'name': '1'}], 'default')
+
+        self.assertEqual(
+            repo.task_model.objects.get().id,
+            utils.make_task_id({'name': '1'}, 'legacy'))
+
+    def test_import_tasks_canonical_ids(self):
+        repo = FakeType({'TASK_ID_SCHEME': 'canonical'})
 
-        self.assertEqual(len(FakeType.task_model.objects()), len(tasks))
-        self.assertEqual(repo.task_model.objects.count(), len(tasks))
+        repo.import_tasks([{'name': '1'}], 'default')
+
+        self.assertEqual(
+            repo.task_model.objects.get().id,
+            utils.make_task_id({'name': '1'}, 'canonical'))
+        self.assertRaises(AssertionError,
+                          lambda: FakeType({'TASK_ID_SCHEME': 'md5'}))
 
     def test_import_tasks_not_dict(self):
         tasks = [{'name': '1'}, tuple(), {'name': '3'}]
@@ -123,6 +166,7 @@ class TestTaskTypes(BaseTest):
         self.assertRaises(TaskImportError,
                           lambda: repo.import_tasks(tasks, 'default'))
         self.assertEqual(repo.task_model.objects.count(), 2)
+        self.assertEqual(repo.get_counters().total, 2)
     # endregion Import tasks
 
     # region Export reports
@@ -294,6 +338,35 @@ class TestTaskTypes(BaseTest):
             task_type.export_reports(batch=batch, closed=False),
             reports)
 
+    def test_export_reports_small_windows(self):
+        task_type = FakeType({})
+        task_type._report_exporter = ReportExporter(
+            task_type.task_model, task_type.answer_model, User,
+            window=2, users_cache=2)
+        users = [User(username='user%s' % i,
+                      email='user%s@email.com' % i).save()
+                 for i in range(4)]
+        reports = []
+
+        for i in range(5):
+            task = task_type.task_model(
+                id='task%s' % i,
+                task_type=task_type.type_name,
+                batch='default',
+                closed=True,
+                users_count=1,
+                task_data={'data': i}
+            ).save()
+            reports.append([task_type.answer_model(
+                task=task,
+                created_by=users[i % len(users)],
+                task_type=task_type.type_name,
+                result={'answer': i}
+            ).save().as_dict()])
+
+        self.assertCountEqual(task_type.export_reports(batch='default'),
+                              reports)
+
     # endregion Export reports
 
     # region Next task
@@ -398,8 +471,12 @@ class TestTaskTypes(BaseTest):
         ]
         # that's how we deal with randomized yield
         for _ in range(5):
-            self.assertEqual(task_type.get_next(user), tasks[0].as_dict(),
+            self.assertEqual(task_type.get_next(user),
+                             dict(tasks[0].as_dict(), session=ANY),
                              'Should return only task that isn\'t skipped')
+            # a leased task isn't given again while anything else is left
+            task_type.work_session_manager.lease_manager.release(tasks[0],
+                                                                 user.id)
 
     def test_return_skipped_if_none_else_left(self):
         task_type = FakeType({})
@@ -418,7 +495,8 @@ class TestTaskTypes(BaseTest):
             users_skipped=[user],
             task_data={'data': 'data'}).save()
 
-        self.assertEqual(task_type.get_next(user), task.as_dict(),
+        self.assertEqual(task_type.get_next(user),
+                         dict(task.as_dict(), session=ANY),
                          'Should return even skipped task if nothing else'
                          ' is available')
 
@@ -440,7 +518,8 @@ class TestTaskTypes(BaseTest):
             task_data={'data': 'data'}).save() for i in range(2)]
 
         for _ in range(5):
-            self.assertEqual(task_type.get_next(user), tasks[1].as_dict(),
+            self.assertEqual(task_type.get_next(user),
+                             dict(tasks[1].as_dict(), session=ANY),
                              'Should return only task that isn\'t skipped')
 
     def test_return_skipped_if_none_else_left_no_batch(self):
@@ -456,7 +535,8 @@ class TestTaskTypes(BaseTest):
             users_skipped=[user],
             task_data={'data': 'data'}).save()
 
-        self.assertEqual(task_type.get_next(user), task.as_dict(),
+        self.assertEqual(task_type.get_next(user),
+                         dict(task.as_dict(), session=ANY),
                          'Should return even skipped task if nothing else'
                          ' is available')
     # endregion Next task
@@ -575,6 +655,7 @@ class TestTaskTypes(BaseTest):
         task.reload()
 
         self.assertTrue(task.closed)
+        self.assertEqual(task_type.get_counters().closed, 1)
 
     def test_on_done_alter_batch(self):
         task_type = FakeType({})
@@ -6,7 +6,11 @@ test_user_model
 """
 import unittest
 
+import flask
+
+from vulyk.models.stats import LeaderboardScore
 from vulyk.models.user import User, Group
+from vulyk.signals import on_group_changed
 
 from .base import BaseTest
 from .fixtures import FakeType
@@ -30,9 +34,23 @@ class TestUser(BaseTest):
 
     def tearDown(self):
         User.objects.delete()
+        LeaderboardScore.objects.delete()
 
         super().tearDown()
 
+    def _make_scores(self, task_type, scores):
+        users = []
+
+        for i, score in enumerate(scores):
+            user = User(username='user%s' % i,
+                        email='user%s@email.com' % i).save()
+            LeaderboardScore(task_type=task_type.type_name,
+                             user=user,
+                             score=score).save()
+            users.append(user)
+
+        return users
+
     def test_add_default_group(self):
         User(username='1', email='1@email.com', admin=True).save()
         User(username='2', email='2@email.com', admin=False).save()
@@ -67,6 +85,50 @@ class TestUser(BaseTest):
         self.assertTrue(u2.is_eligible_for(self.TASK_TYPE))
         self.assertFalse(u2.is_eligible_for(another_task_type))
 
+    def test_eligible_types_cached_until_group_changed(self):
+        app = flask.Flask(__name__)
+        another_task_type = 'task_type_2'
+        user = User(username='1', email='1@email.com').save()
+        user = User.objects.get(id=user.id)
+
+        with app.app_context():
+            self.assertEqual(user.get_eligible_types(), {self.TASK_TYPE})
+
+        try:
+            Group.objects(id='default') \
+                .update(add_to_set__allowed_types=another_task_type)
+
+            with app.app_context():
+                self.assertFalse(user.is_eligible_for(another_task_type),
+                                 'Groups should be taken from the cache')
+
+            on_group_changed.send('default')
+
+            with app.app_context():
+                self.assertTrue(user.is_eligible_for(another_task_type))
+        finally:
+            Group.objects(id='default') \
+                .update(pull__allowed_types=another_task_type)
+            on_group_changed.send('default')
+
+    def test_eligible_types_kept_for_request(self):
+        app = flask.Flask(__name__)
+        user = User(username='1', email='1@email.com').save()
+
+        with app.app_context():
+            self.assertEqual(user.get_eligible_types(), {self.TASK_TYPE})
+
+            Group(id='other', allowed_types=['task_type_2']).save()
+            user.groups.append(Group.objects.get(id='other'))
+
+            self.assertEqual(user.get_eligible_types(), {self.TASK_TYPE})
+
+        with app.app_context():
+            self.assertEqual(user.get_eligible_types(),
+                             {self.TASK_TYPE, 'task_type_2'})
+
+        Group.objects(id='other').delete()
+
     def test_as_dict(self):
         username = 'mutumba'
         email = 'mutumba@email.com'
@@ -82,9 +144,7 @@ class TestUser(BaseTest):
 
     def test_get_stats(self):
         task_type = FakeType({})
-        user = User(username='mutumba', email='mutumba@email.com').save()
-        leaders = [(user.id, 4), ('user0', 2)]
-        task_type.get_leaders = lambda: leaders
+        user = self._make_scores(task_type, [4, 2])[0]
 
         self.assertEqual(
             user.get_stats(task_type),
@@ -96,9 +156,7 @@ class TestUser(BaseTest):
 
     def test_get_stats_share_place_if_same_count(self):
         task_type = FakeType({})
-        user = User(username='mutumba', email='mutumba@email.com').save()
-        leaders = [('user0', 12), (user.id, 4), ('user1', 4)]
-        task_type.get_leaders = lambda: leaders
+        user = self._make_scores(task_type, [12, 4, 4])[1]
 
         self.assertEqual(
             user.get_stats(task_type),
@@ -110,9 +168,7 @@ class TestUser(BaseTest):
 
     def test_get_stats_others_share_place_if_same_count(self):
         task_type = FakeType({})
-        user = User(username='mutumba', email='mutumba@email.com').save()
-        leaders = [('user0', 12), ('user1', 4), ('user2', 4), (user.id, 3)]
-        task_type.get_leaders = lambda: leaders
+        user = self._make_scores(task_type, [12, 4, 4, 3])[3]
 
         self.assertEqual(
             user.get_stats(task_type),
@@ -122,6 +178,35 @@ class TestUser(BaseTest):
             }
         )
 
+    def test_get_stats_no_score(self):
+        task_type = FakeType({})
+        self._make_scores(task_type, [12, 4, 4])
+        user = User(username='mutumba', email='mutumba@email.com').save()
+
+        self.assertEqual(
+            user.get_stats(task_type),
+            {
+                'total': 0,
+                'position': 2
+            }
+        )
+
+    def test_get_stats_cached(self):
+        task_type = FakeType({'LEADERBOARD_RANK_STALENESS': 60})
+        users = self._make_scores(task_type, [12, 4])
+
+        self.assertEqual(users[1].get_stats(task_type),
+                         {'total': 4, 'position': 2})
+
+        LeaderboardScore.objects(user=users[1]).update(set__score=20)
+
+        self.assertEqual(users[1].get_stats(task_type),
+                         {'total': 20, 'position': 1},
+                         'Own score is always fresh')
+        self.assertEqual(users[0].get_stats(task_type),
+                         {'total': 12, 'position': 1},
+                         'Distinct scores are cached')
+
     def test_get_by_id(self):
         user = User(username='mutumba', email='mutumba@email.com').save()
         uid = str(user.id)
@@ -3,6 +3,7 @@
 test_utils
 """
 import unittest
+from hashlib import sha1
 from unittest.mock import Mock
 from werkzeug.exceptions import HTTPException
 
@@ -73,6 +74,41 @@ class TestUtils(BaseTest):
             'Wrong chunks were made.'
         )
 
+    def test_stage_timer(self):
+        timer = utils.StageTimer()
+        timer.lap('first')
+        timer.lap('second')
+        timer.lap('first')
+
+        self.assertEqual(list(timer.timings.keys()), ['first', 'second'])
+        self.assertAlmostEqual(timer.total, sum(timer.timings.values()))
+        self.assertRegex(
+            str(timer),
+            r'^first=[\d.]+ms, second=[\d.]+ms, total=[\d.]+ms$')
+
+    def test_canonical_json(self):
+        self.assertEqual(
+            utils.canonical_json({'b': [1, 0.1, 1e22],
+                                  'a': {'d': 'ї', 'c': 1.0}}),
+            '{"a":{"c":1.0,"d":"ї"},"b":[1,0.1,1e+22]}'.encode('utf8'))
+
+    def test_make_task_id_canonical(self):
+        task_id = utils.make_task_id({'a': 1, 'b': {'c': [2.5, 'x']}},
+                                     'canonical')
+
+        self.assertEqual(len(task_id), 20)
+        self.assertEqual(
+            task_id, utils.make_task_id({'b': {'c': [2.5, 'x']}, 'a': 1},
+                                        'canonical'))
+        self.assertNotEqual(task_id,
+                            utils.make_task_id({'a': 2}, 'canonical'))
+
+    def test_make_task_id_legacy(self):
+        self.assertEqual(
+            utils.make_task_id({'name': '1'}),
+            sha1(utils.json.dumps({'name': '1'}).encode('utf8'))
+            .hexdigest()[:20])
+
     def test_get_template_path_in_templates(self):
         app = Mock()
         app.jinja_loader = Mock()
@@ -99,6 +135,57 @@ class TestUtils(BaseTest):
             'base/shekel.html'
         )
 
+    def test_get_template_path_first_listed_wins(self):
+        app = Mock()
+        app.jinja_loader = Mock()
+        app.jinja_loader.list_templates = lambda: [
+            'templates/coins/base/shekel.html',
+            'templates/shekels/base/shekel.html'
+        ]
+        app.config = {'TEMPLATE_BASE_FOLDERS': [
+            'templates/shekels',
+            'templates/coins',
+        ]}
+
+        self.assertEqual(
+            utils.get_template_path(app, 'shekel.html'),
+            'templates/coins/base/shekel.html'
+        )
+
+    def test_get_template_path_uses_index(self):
+        app = Mock()
+        app.templates_auto_reload = False
+        app.jinja_loader = Mock()
+        app.jinja_loader.list_templates = Mock(return_value=[])
+        app._template_index = {
+            'shekel.html': 'templates/shekels/base/shekel.html'
+        }
+
+        self.assertEqual(
+            utils.get_template_path(app, 'shekel.html'),
+            'templates/shekels/base/shekel.html'
+        )
+        self.assertEqual(
+            utils.get_template_path(app, 'coin.html'),
+            'base/coin.html'
+        )
+        app.jinja_loader.list_templates.assert_not_called()
+
+    def test_get_template_path_reloads_index(self):
+        app = Mock()
+        app.templates_auto_reload = True
+        app.jinja_loader = Mock()
+        app.jinja_loader.list_templates = lambda: [
+            'templates/shekels/base/shekel.html'
+        ]
+        app.config = {'TEMPLATE_BASE_FOLDERS': ['templates/shekels']}
+        app._template_index = {}
+
+        self.assertEqual(
+            utils.get_template_path(app, 'shekel.html'),
+            'templates/shekels/base/shekel.html'
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,6 +10,7 @@ from unittest.mock import patch
 
 from vulyk.models.exc import (
     TaskNotFoundError,
+    WorkSessionLookUpError,
     WorkSessionUpdateError)
 from vulyk.models.stats import WorkSession
 from vulyk.models.tasks import AbstractTask, AbstractAnswer
@@ -214,8 +215,168 @@ class TestTaskTypes(BaseTest):
         fake_type = self.FAKE_TYPE
         self.assertRaises(TaskNotFoundError,
                           lambda: fake_type.record_activity('fake_id', '', 0))
+
+    def test_update_session_buffered(self):
+        task_type = FakeType({'ACTIVITY_FLUSH_INTERVAL': 60})
+        user = User(username='user0', email='user0@email.com').save()
+        task = task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            batch='any_batch',
+            closed=False,
+            users_count=0,
+            users_processed=[],
+            users_skipped=[],
+            task_data={'data': 'data'}).save()
+        fake_datetime = datetime.now() - timedelta(seconds=110)
+
+        with patch('vulyk.ext.worksession.datetime') as mock_date:
+            mock_date.now = lambda: fake_datetime
+            task_type.work_session_manager.start_work_session(task, user.id)
+
+        task_type.record_activity(user.id, task.id, 50)
+        task_type.record_activity(user.id, task.id, 50)
+
+        self.assertEqual(
+            WorkSession.objects.get(user=user.id, task=task).activity, 0)
+        # the budget is checked against the buffered activity as well
+        self.assertRaises(
+            WorkSessionUpdateError,
+            lambda: task_type.record_activity(user.id, task.id, 50)
+        )
+
+        with patch('vulyk.ext.worksession.on_task_done'):
+            task_type.on_task_done(user, task.id, {'result': 'result'})
+
+        session = WorkSession.objects.get(user=user.id, task=task)
+
+        self.assertEqual(session.activity, 100)
+        self.assertIsNotNone(session.end_time)
+
+    def test_update_session_restarted(self):
+        task_type = self.FAKE_TYPE
+        user = User(username='user0', email='user0@email.com').save()
+        task = task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            batch='any_batch',
+            closed=False,
+            users_count=0,
+            users_processed=[],
+            users_skipped=[],
+            task_data={'data': 'data'}).save()
+        fake_datetime = datetime.now() - timedelta(seconds=110)
+
+        with patch('vulyk.ext.worksession.datetime') as mock_date:
+            mock_date.now = lambda: fake_datetime
+            task_type.work_session_manager.start_work_session(task, user.id)
+
+        task_type.record_activity(user.id, task.id, 50)
+        # restarted elsewhere, the process still knows the former session
+        WorkSession.objects(user=user.id, task=task).update(
+            set__start_time=datetime.now() - timedelta(seconds=70),
+            set__activity=0)
+        task_type.record_activity(user.id, task.id, 60)
+
+        session = WorkSession.objects.get(user=user.id, task=task)
+
+        self.assertEqual(session.activity, 60)
+
+    def test_update_session_unlocked_io(self):
+        task_type = FakeType({})
+        manager = task_type.work_session_manager
+        user = User(username='user0', email='user0@email.com').save()
+        task = task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            batch='any_batch',
+            closed=False,
+            users_count=0,
+            users_processed=[],
+            users_skipped=[],
+            task_data={'data': 'data'}).save()
+        fake_datetime = datetime.now() - timedelta(seconds=110)
+
+        with patch('vulyk.ext.worksession.datetime') as mock_date:
+            mock_date.now = lambda: fake_datetime
+            manager.start_work_session(task, user.id)
+
+        def unlocked(method):
+            def wrapper(*args, **kwargs):
+                self.assertFalse(manager._lock.locked(),
+                                 'Buffer must not be locked during I/O')
+
+                return method(*args, **kwargs)
+
+            return wrapper
+
+        with patch.object(manager, '_read_heartbeat',
+                          unlocked(manager._read_heartbeat)), \
+                patch.object(manager, '_flush_heartbeat',
+                             unlocked(manager._flush_heartbeat)):
+            task_type.record_activity(user.id, task.id, 50)
+            manager.flush()
+
+        session = WorkSession.objects.get(user=user.id, task=task)
+
+        self.assertEqual(session.activity, 50)
     # endregion Record activity
 
+    # region Handles
+    def test_done_by_handle(self):
+        task_type = self.FAKE_TYPE
+        user = User(username='user0', email='user0@email.com').save()
+        task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            batch=None,
+            closed=False,
+            users_count=0,
+            users_processed=[],
+            users_skipped=[],
+            task_data={'data': 'data'}).save()
+
+        given = task_type.get_next(user)
+        session = WorkSession.objects.get(user=user.id)
+
+        self.assertEqual(given['session'], str(session.id))
+        self.assertEqual(task_type.get_next(user)['session'], given['session'],
+                         'Restarted session should keep its handle')
+
+        with patch('vulyk.ext.worksession.on_task_done'):
+            task_type.on_task_done(user, given['id'], {'result': 'result'},
+                                   session_id=given['session'])
+
+        self.assertIsNotNone(WorkSession.objects.get(id=session.id).end_time)
+
+    def test_skip_by_handle(self):
+        task_type = self.FAKE_TYPE
+        users = [User(username='user%s' % i,
+                      email='user%s@email.com' % i).save() for i in range(2)]
+        task_type.task_model(
+            id='task0',
+            task_type=task_type.type_name,
+            batch=None,
+            closed=False,
+            users_count=0,
+            users_processed=[],
+            users_skipped=[],
+            task_data={'data': 'data'}).save()
+        given = [task_type.get_next(user) for user in users]
+
+        # a handle of someone else's session isn't honoured
+        self.assertRaises(
+            WorkSessionLookUpError,
+            lambda: task_type.skip_task('task0', users[1], given[0]['session'])
+        )
+
+        task_type.skip_task('task0', users[0], given[0]['session'])
+        # old clients send no handle or some garbage
+        task_type.skip_task('task0', users[1], 'garbage')
+
+        self.assertEqual(WorkSession.objects.count(), 0)
+    # endregion Handles
+
     # region On task done
     def test_on_done_ok(self):
         task_type = self.FAKE_TYPE
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Die Hauptstadt of our little project. Just a usual Flask application."""
+import hmac
 from typing import Dict
 
 import flask
@@ -12,6 +13,7 @@ except ImportError:
     import json
 
 from vulyk import cli, bootstrap, utils
+from vulyk.ext.progress import ProgressMetrics
 from vulyk.models.exc import TaskNotFoundError
 from vulyk.utils import NO_TASKS
 
@@ -22,6 +24,9 @@ __all__ = [
 
 app = bootstrap.init_app(__name__)
 TASKS_TYPES = bootstrap.init_plugins(app)
+PROGRESS = ProgressMetrics(TASKS_TYPES.values(),
+                           window=app.config['METRICS_WINDOW'],
+                           ttl=app.config['METRICS_CACHE_TTL'])
 
 
 # region Views
@@ -69,6 +74,10 @@ def next_page(type_name: str) -> Response:
     If user isn't eligible for that type of tasks - an exception
     should be thrown.
 
+    Passing `prefetch` query argument one gets up to that many (but not more
+    than `TASKS_PREFETCH_LIMIT`) follow-up tasks as well. Those are reserved
+    for the user until they're done, skipped or their leases expire.
+
     :param type_name: Task type name
     :type type_name: str
 
@@ -86,11 +95,19 @@ def next_page(type_name: str) -> Response:
     if not task:
         return NO_TASKS
 
+    result = {
+        'task': task,
+        'stats': user.get_stats(task_type=task_type)
+    }
+    prefetch = min(flask.request.args.get('prefetch', 0, type=int),
+                   app.config['TASKS_PREFETCH_LIMIT'])
+
+    if prefetch > 0:
+        result['prefetched'] = task_type.prefetch(
+            user, prefetch, exclude=[task['id']])
+
     return utils.json_response(
-        {
-            'task': task,
-            'stats': user.get_stats(task_type=task_type)
-        },
+        result,
         # doubtful that we need it.
         task_type.template
     )
@@ -144,6 +161,10 @@ def skip(type_name: str, task_id: str) -> Response:
     """
     This action adds the task to the 'skipped' list of current user.
 
+    The `session` form field should carry the handle of the work session
+    given along with the task. Without it the latest session of the user on
+    the task is looked up.
+
     :param type_name: Task type name
     :type type_name: str
     :param task_id: Task ID
@@ -159,7 +180,8 @@ def skip(type_name: str, task_id: str) -> Response:
         return NO_TASKS
 
     try:
-        task_type.skip_task(user=user, task_id=task_id)
+        task_type.skip_task(user=user, task_id=task_id,
+                            session_id=flask.request.form.get('session'))
     except TaskNotFoundError:
         return NO_TASKS
 
@@ -172,6 +194,10 @@ def done(type_name: str, task_id: str) -> Response:
     """
     This action adds the task to the 'skipped' list of current user.
 
+    The `session` form field should carry the handle of the work session
+    given along with the task. Without it the latest session of the user on
+    the task is looked up.
+
     :param type_name: Task type name
     :type type_name: str
     :param task_id: Task ID
@@ -188,13 +214,57 @@ def done(type_name: str, task_id: str) -> Response:
 
     try:
         task_type.on_task_done(
-            user, task_id, json.loads(flask.request.form.get('result')))
+            user, task_id, json.loads(flask.request.form.get('result')),
+            session_id=flask.request.form.get('session'))
     except TaskNotFoundError:
         return NO_TASKS
 
     return utils.json_response({'done': True})
 
 
+@app.route('/metrics.json', methods=['GET'])
+def metrics_json() -> Response:
+    """
+    Progress of task types and batches: numbers of tasks, pace of answers
+    and estimated time to completion.
+
+    :returns: Prepared response.
+    :rtype: Response
+    """
+    _check_metrics_access()
+
+    return utils.json_response(PROGRESS.snapshot())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics() -> Response:
+    """
+    The same progress in the text format Prometheus scrapes.
+
+    :returns: Prepared response.
+    :rtype: Response
+    """
+    _check_metrics_access()
+
+    return Response(PROGRESS.prometheus(),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def _check_metrics_access() -> None:
+    """
+    Lets admins and requests bearing the metrics token in.
+    """
+    token = app.config['METRICS_TOKEN']
+    given = flask.request.args.get('token') or \
+        flask.request.headers.get('Authorization', '').replace('Bearer ', '')
+
+    if token and hmac.compare_digest(given.encode(), token.encode()):
+        return
+
+    if not getattr(flask.g.get('user'), 'admin', False):
+        flask.abort(utils.HTTPStatus.FORBIDDEN)
+
+
 # endregion Views
 
 
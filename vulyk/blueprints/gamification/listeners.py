@@ -7,7 +7,7 @@ from bson import ObjectId
 
 from vulyk.models.stats import WorkSession
 from vulyk.models.tasks import AbstractAnswer, Batch
-from vulyk.signals import on_batch_done, on_task_done
+from vulyk.signals import deferrable, on_batch_done, on_task_done
 from .core.events import Event
 from .core.queries import MongoRuleExecutor
 from .core.rules import Rule
@@ -25,6 +25,7 @@ __all__ = [
 
 
 @on_task_done.connect
+@deferrable(key=lambda sender, answer: answer.created_by.id)
 def track_events(sender: object, answer: AbstractAnswer) -> None:
     """
     The most important gear of the gamification module.
@@ -122,6 +123,7 @@ def get_actual_rules(
 
 
 @on_batch_done.connect
+@deferrable()
 def materialize_coins(sender: Batch) -> None:
     """
     Convert potential coins to active ones for every member participated upon
@@ -7,7 +7,7 @@ Contains code not to be used directly after the initialization.
 import flask
 from flask_mongoengine import MongoEngine
 
-from . import _assets, _logging, _social_login, _blueprints
+from . import _assets, _logging, _signals, _social_login, _blueprints
 from ._tasks import init_plugins
 
 __all__ = [
@@ -58,6 +58,7 @@ def init_app(name):
             app.admin = _admin.init_admin(app)
 
         _blueprints.init_blueprints(app)
+        _signals.init_dispatcher(app)
 
         setattr(init_app, key, app)
 
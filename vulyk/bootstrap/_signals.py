@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import atexit
+
+from flask import Flask
+
+from vulyk import signals
+
+__all__ = [
+    'init_dispatcher'
+]
+
+
+def init_dispatcher(app: Flask) -> None:
+    """
+    Sets up the dispatcher of deferrable signal listeners.
+
+    :param app: Current application instance
+    :type app: Flask
+    """
+    mode = app.config.get('SIGNALS_DISPATCHER', 'sync')
+
+    if mode == 'threads':
+        dispatcher = signals.ThreadPoolDispatcher(
+            workers=app.config.get('SIGNALS_WORKERS', 4),
+            queue_size=app.config.get('SIGNALS_QUEUE_SIZE', 1000))
+        atexit.register(dispatcher.shutdown)
+    elif mode == 'mongo':
+        dispatcher = signals.MongoQueueDispatcher()
+    else:
+        if mode != 'sync':
+            app.logger.warning('Unknown signals dispatcher %s, falling back '
+                               'to synchronous one.', mode)
+
+        dispatcher = signals.SyncDispatcher()
+
+    signals.set_dispatcher(dispatcher)
+
+    app.logger.info('Signals dispatcher: %s.', type(dispatcher).__name__)
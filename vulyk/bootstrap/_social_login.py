@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 """Module contains stuff related to interoperability with PSA."""
 
-import datetime
 from typing import Optional, Dict
 
 import flask_login as login
@@ -10,7 +9,8 @@ from social_flask.routes import social_auth
 from social_flask.template_filters import backends
 from social_flask_mongoengine.models import init_social
 
-from vulyk.models.user import User
+from vulyk.ext.lastseen import LastSeenTracker
+from vulyk.models.user import GROUPS_CACHE, User
 
 __all__ = [
     'init_social_login'
@@ -34,13 +34,16 @@ def init_social_login(app, db) -> None:
     login_manager.login_message = ''
     login_manager.init_app(app)
 
+    app.last_seen = LastSeenTracker(
+        User, app.config.get('LAST_SEEN_INTERVAL', 300))
+    GROUPS_CACHE.ttl = app.config.get('GROUPS_CACHE_TTL', 60)
+
     @login_manager.user_loader
     def load_user(userid) -> Optional[User]:
         try:
             user = User.objects.get(id=userid)
             if user:
-                user.last_login = datetime.datetime.now()
-                user.save()
+                app.last_seen.touch(user)
             return user
         except (TypeError, ValueError, User.DoesNotExist):
             return None
@@ -9,11 +9,21 @@ from flask_assets import Bundle
 from werkzeug.utils import import_string
 
 from vulyk.models.task_types import AbstractTaskType
+from vulyk.utils import index_templates
 
 __all__ = [
     'init_plugins'
 ]
 
+# application settings passed on to every task type unless its plugin sets
+# them on its own
+_SHARED_SETTINGS = (
+    'TASK_ID_SCHEME',
+    'ACTIVITY_FLUSH_INTERVAL',
+    'LEADERBOARD_RANK_STALENESS',
+    'LEADERBOARD_CACHE_TTL',
+)
+
 
 def _init_plugin_assets(app, task_type, static_path) -> List[str]:
     """
@@ -76,6 +86,8 @@ def init_plugins(app) -> Dict[str, AbstractTaskType]:
     task_types = {}
     loaders = {}
     enabled_tasks = app.config.get('ENABLED_TASKS', {})
+    shared_settings = {key: app.config[key] for key in _SHARED_SETTINGS
+                       if key in app.config}
     files_to_watch = []
 
     app.logger.info('Loading plugins: %s', list(enabled_tasks.keys()))
@@ -88,7 +100,8 @@ def init_plugins(app) -> Dict[str, AbstractTaskType]:
         )
         plugin_type = import_string(
             '{plugin_name}'.format(plugin_name=plugin))
-        settings = plugin_type.configure(task_settings)
+        settings = {**shared_settings,
+                    **plugin_type.configure(task_settings)}
 
         task_type = import_string(
             '{plugin_name}.models.task_types.{task}'.format(
@@ -122,5 +135,6 @@ def init_plugins(app) -> Dict[str, AbstractTaskType]:
         jinja2.PrefixLoader(loaders)])
 
     app._plugin_files_to_watch = files_to_watch
+    app._template_index = index_templates(app)
 
     return task_types
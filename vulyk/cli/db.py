@@ -1,111 +1,359 @@
 # -*- coding: utf-8 -*-
-import gzip
+from datetime import datetime, timedelta
 import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
-import bz2file as bz2
-from click import echo
+from bson import ObjectId
+from click import echo, UsageError
 
+from vulyk.ext.export import (
+    export_to,
+    ExportStats,
+    open_writer,
+    write_reports
+)
+from vulyk.ext.importer import ImportStats, TaskImporter
+from vulyk.ext.shards import MANIFEST, ShardedExport
+from vulyk.models.exports import ExportCheckpoint
 from vulyk.models.task_types import AbstractTaskType
-from vulyk.utils import chunked
 
-try:
-    import ujson as json
-except ImportError:
-    import json
+MOMENT_FORMATS = ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
 
 
-def open_anything(filename: str):
-    if filename.endswith('.bz2'):
-        return bz2.BZ2File
-    if filename.endswith('.gz'):
-        return gzip.open
-
-    return open
-
-
-def load_tasks(task_type: AbstractTaskType, path: str, batch: str) -> int:
+def load_tasks(
+    task_type: AbstractTaskType,
+    path: str,
+    batch: str,
+    chunk_size: int = 1000,
+    workers: Optional[int] = None,
+    writers: int = 4,
+    resume: bool = False
+) -> int:
     """
+    Loads tasks from files, tasks stored already are skipped.
+    Progress is journaled until `finish_loading` is called, so interrupted
+    import could be resumed.
 
     :type task_type: AbstractTaskType
     :type path: str
     :param batch: Batch ID tasks should be loaded into
     :type batch: str
+    :param chunk_size: Number of lines parsed and inserted at once
+    :type chunk_size: int
+    :param workers: Number of parsing processes, CPU count by default
+    :type workers: Optional[int]
+    :param writers: Number of concurrent inserts
+    :type writers: int
+    :param resume: Continue the interrupted import of the same files
+    :type resume: bool
 
-    :return: Number of tasks loaded
+    :return: Number of tasks loaded. When resuming, all tasks stored in the
+             batch and not accounted for in it are counted, including ones
+             loaded by interrupted attempts
     :rtype: int
+
+    :raise UsageError: if there is an interrupted import and it's not resumed
     """
     if isinstance(path, str):
         path = (path,)
 
-    count = len(path)
-    tasks = 0
+    importer = TaskImporter(task_type, chunk_size, workers, writers)
+
+    if not resume and importer.journaled(path, batch):
+        raise UsageError('Tasks of these files have been loaded before, but '
+                         'not accounted for in the batch: either the import '
+                         'was interrupted or the batch could not be '
+                         'recorded. Pass --resume to load the rest, if any, '
+                         'and record the batch')
+
+    files = {p: i for i, p in enumerate(path)}
+    current = [None]
+
+    def _progress(p: str, stats: ImportStats) -> None:
+        if p != current[0]:
+            current[0] = p
+            echo('Loading file {0:d} from {1:d}...'.format(
+                files[p] + 1, len(files)))
+
+        echo('{0:d} tasks processed'.format(
+            stats.inserted + stats.duplicates))
+
+    stats = importer.run(path, batch, _progress, resume)
+
+    echo('Finished loading: {}'.format(stats))
 
-    for i, p in enumerate(path):
-        echo('Loading file {0:d} from {1:d}...'.format(i + 1, count))
-        tasks += _load_tasks_file(task_type, p, batch)
+    if resume and batch is not None:
+        # the journal may miss tasks stored right before the interruption
+        return importer.unaccounted(batch)
 
-    return tasks
+    return importer.inserted(path, batch)
 
 
-def _load_tasks_file(task_type: AbstractTaskType, path: str, batch: str) -> int:
+def finish_loading(task_type: AbstractTaskType, path: str, batch: str) -> None:
     """
+    Drops the journal of the import, once loaded tasks are accounted for.
+
     :type task_type: AbstractTaskType
     :type path: str
-    :param batch: Batch ID tasks should be loaded into
+    :param batch: Batch ID tasks have been loaded into
     :type batch: str
+    """
+    if isinstance(path, str):
+        path = (path,)
 
-    :return: Number of stored tasks
-    :rtype: int
+    TaskImporter(task_type).forget(path, batch)
+
+
+def export_reports(
+    task_type: AbstractTaskType,
+    path: str,
+    batch: str,
+    closed: bool,
+    fmt: Optional[str] = None,
+    since: Optional[str] = None,
+    follow: bool = False,
+    interval: float = 10.0,
+    overlap: int = 300
+) -> None:
     """
-    i = 0
-    bunch_size = 100
+    Streams answers into the file, the format and compression are guessed
+    from the extension unless the format is given.
 
-    def _safe_load(fl):
-        """
-        :type fl: file
-        :rtype: __generator[dict]
-        """
-        l = lambda s: json.loads(s) if len(s.strip()) > 0 else {}
+    Incremental export starts from `since`, which is either a moment
+    (`2020-01-31` or `2020-01-31T10:00:00`, local time) or a name of the
+    checkpoint. The checkpoint is moved forward once answers are written,
+    so the next run picks up where this one has finished. Answers could be
+    exported twice if the run is interrupted.
 
-        return filter(None, map(l, fl))
+    Answers are stamped before they are stored, so those given within
+    `overlap` seconds before the latest exported one are read again and
+    the ones not exported yet are written. Answers stored later than that
+    after being stamped are skipped.
 
-    try:
-        with open_anything(path)(path, 'rb') as f:
-            for chunk in chunked(_safe_load(f), bunch_size):
-                task_type.import_tasks(chunk, batch)
+    :type task_type: AbstractTaskType
+    :type path: str
+    :type batch: str
+    :param closed: Export only answers to closed tasks (ignored by
+                   incremental export)
+    :type closed: bool
+    :param fmt: Format of the file (jsonl, csv or parquet)
+    :type fmt: Optional[str]
+    :param since: Moment or checkpoint name to export answers since
+    :type since: Optional[str]
+    :param follow: Keep exporting new answers until interrupted
+    :type follow: bool
+    :param interval: Max seconds between checks for new answers
+    :type interval: float
+    :param overlap: Seconds of answers read again upon every round
+    :type overlap: int
+    """
+    def progress(stats: ExportStats) -> None:
+        echo('{0:d} tasks processed ({1:.0f} rows/s)'.format(
+            stats.tasks, stats.answers_per_second))
 
-                i += len(chunk)
-                echo('{0:d} tasks processed'.format(i))
+    try:
+        if since is None and not follow:
+            stats = export_to(path, task_type.export_reports(batch, closed),
+                              fmt, progress)
+        else:
+            stats = _export_since(task_type, path, batch, fmt, since,
+                                  follow, interval, overlap, progress)
     except ValueError as e:
-        echo('Error while decoding json in {0}: {1}'.format(path, e))
+        echo('Error while exporting to {0}: {1}'.format(path, e))
     except IOError as e:
-        echo('Got IO error when tried to decode {0}: {1}'.format(path, e))
+        echo('Got IO error when tried to write {0}: {1}'.format(path, e))
+    else:
+        echo('Finished exporting answers for {0}'.format(stats))
 
-    echo('Finished loading {0:d} tasks'.format(i))
 
-    return i
+def _export_since(
+    task_type: AbstractTaskType,
+    path: str,
+    batch: str,
+    fmt: Optional[str],
+    since: Optional[str],
+    follow: bool,
+    interval: float,
+    overlap: int,
+    progress: Callable[[ExportStats], None]
+) -> ExportStats:
+    """
+    Exports answers given since the moment or the checkpoint.
 
+    :rtype: ExportStats
 
-def export_reports(task_id: AbstractTaskType, path: str, batch: str, closed: bool) -> None:
+    :raise ValueError: if the moment can't be parsed
     """
-    :type task_id: AbstractTaskType
-    :type path: str
-    :type batch: str
+    checkpoint = None
+    watermark = lower = None
+    # IDs of answers given within the overlap, mapped to `created_at`
+    recent = {}  # type: Dict[ObjectId, datetime]
+
+    if since is not None:
+        watermark = lower = _parse_moment(since)
+
+        if watermark is None:
+            checkpoint = ExportCheckpoint.objects(
+                name=since, task_type=task_type.type_name, batch=batch
+            ).first() or ExportCheckpoint(
+                name=since, task_type=task_type.type_name, batch=batch)
+            watermark = checkpoint.watermark
+
+            if watermark is not None:
+                lower = watermark - timedelta(seconds=overlap)
+                recent = dict.fromkeys(checkpoint.recent, watermark)
+
+    stats = ExportStats()
+
+    with open_writer(path, fmt) as writer:
+        try:
+            while True:
+                exported = stats.answers
+
+                write_reports(writer,
+                              task_type.export_reports(
+                                  batch, since=lower, until=datetime.now(),
+                                  exported=recent),
+                              stats, progress)
+                writer.flush()
+
+                if recent:
+                    watermark = max(filter(None, [watermark,
+                                                  *recent.values()]))
+                    lower = watermark - timedelta(seconds=overlap)
+                    recent = {k: v for k, v in recent.items() if v > lower}
+
+                if checkpoint is not None and watermark is not None:
+                    checkpoint.watermark = watermark
+                    checkpoint.recent = list(recent)
+                    checkpoint.exported += stats.answers - exported
+                    checkpoint.updated_at = datetime.utcnow()
+                    checkpoint.save()
+
+                if not follow:
+                    break
+
+                task_type.report_exporter.wait(interval)
+        except KeyboardInterrupt:
+            # The usual way to stop following, the checkpoint holds
+            # the last round written completely
+            pass
+
+    return stats
+
+
+def _parse_moment(value: str) -> Optional[datetime]:
+    """
+    :param value: Date or date and time
+    :type value: str
+
+    :return: Parsed moment, None if the value is not a moment
+    :rtype: Optional[datetime]
+    """
+    for pattern in MOMENT_FORMATS:
+        try:
+            return datetime.strptime(value, pattern)
+        except ValueError:
+            pass
+
+    return None
+
+
+def export_shards(
+    task_types: Iterable[AbstractTaskType],
+    folder: str,
+    batches: Optional[List[str]],
+    suffix: str,
+    closed: bool,
+    workers: Optional[int] = None,
+    connection: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Exports answers of task types into a shard per task type and batch in
+    parallel, see `ShardedExport`.
+
+    :param task_types: Task types to export
+    :type task_types: Iterable[AbstractTaskType]
+    :param folder: Folder to put shards and the manifest into
+    :type folder: str
+    :param batches: Export only these batches, all by default
+    :type batches: Optional[List[str]]
+    :param suffix: Extension of shards, sets the format and compression
+    :type suffix: str
+    :param closed: Export only answers to closed tasks
     :type closed: bool
+    :param workers: Number of processes, CPU count by default
+    :type workers: Optional[int]
+    :param connection: Settings of the database connection
+    :type connection: Optional[Dict[str, Any]]
     """
-    i = 0
+    def progress(shard: Dict[str, Any]) -> None:
+        echo('{path}: {tasks} tasks, {answers} answers in {seconds}s'.format(
+            **shard))
 
-    try:
-        with open(path, 'w+') as f:
-            for report in task_id.export_reports(batch, closed):
-                f.write(json.dumps(report) + os.linesep)
-                i += 1
+    os.makedirs(folder, exist_ok=True)
 
-                if i + 1 % 100 == 0:
-                    echo('{0:d} tasks processed'.format(i))
+    try:
+        manifest = ShardedExport(task_types, connection, workers).run(
+            folder, suffix, batches, closed, progress)
     except ValueError as e:
-        echo('Error while encoding json in {0}: {1}'.format(path, e))
-    except IOError as e:
-        echo('Got IO error when tried to read {0}: {1}'.format(path, e))
+        echo('Error while exporting to {0}: {1}'.format(folder, e))
+    else:
+        echo('Finished exporting {0} answers for {1} tasks into {2} shards '
+             'in {3}s, see {4}'.format(
+                 manifest['answers'], manifest['tasks'],
+                 len(manifest['shards']), manifest['seconds'],
+                 os.path.join(folder, MANIFEST)))
+
+
+def rebuild_leaderboards(task_types: Iterable[AbstractTaskType]) -> None:
+    """
+    Recounts materialised leaderboard scores from answers.
+
+    :param task_types: Task types to rebuild leaderboards of
+    :type task_types: Iterable[AbstractTaskType]
+    """
+    for task_type in task_types:
+        members = task_type.leaderboard_manager.rebuild()
+
+        echo('{}: {} members on the leaderboard'.format(
+            task_type.type_name, members))
+
+
+def rebuild_counters(task_types: Iterable[AbstractTaskType]) -> None:
+    """
+    Recounts materialised numbers of tasks from scratch.
+
+    :param task_types: Task types to rebuild counters of
+    :type task_types: Iterable[AbstractTaskType]
+    """
+    for task_type in task_types:
+        counters = task_type.counters_model.rebuild(
+            task_type.type_name, task_type.task_model)
+
+        echo('{}: {} tasks, {} open'.format(
+            task_type.type_name, counters.total, counters.open))
+
+
+def reclaim_leases(task_types: Iterable[AbstractTaskType]) -> int:
+    """
+    Removes expired task leases of all given task types in bulk.
+
+    :type task_types: Iterable[AbstractTaskType]
+
+    :return: Number of leases removed
+    :rtype: int
+    """
+    managers = {}
+
+    for task_type in task_types:
+        manager = task_type.work_session_manager.lease_manager
+
+        if manager is not None:
+            managers[manager.lease] = manager
+
+    removed = sum(m.reclaim_expired() for m in managers.values())
+
+    echo('Reclaimed {0:d} expired leases'.format(removed))
 
-    echo('Finished exporting answers for {0:d} tasks'.format(i))
+    return removed
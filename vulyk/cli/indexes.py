@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Package contains CLI tools to manage indexes and audit query plans."""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Type
+
+import click
+from bson import ObjectId, json_util
+from flask_mongoengine import Document
+from mongoengine.queryset import QuerySet
+
+from vulyk.models.exports import ExportCheckpoint
+from vulyk.models.imports import ImportCheckpoint
+from vulyk.models.jobs import DeferredJob
+from vulyk.models.task_types import AbstractTaskType
+from vulyk.models.tasks import Batch
+from vulyk.models.user import Group, User
+
+COLLSCAN = 'COLLSCAN'
+
+
+def managed_models(
+    task_types: Iterable[AbstractTaskType]
+) -> List[Type[Document]]:
+    """
+    Collects all models whose indexes are managed by the application.
+
+    :param task_types: Task types to collect models from
+    :type task_types: Iterable[AbstractTaskType]
+
+    :return: List of models, every one is mentioned once
+    :rtype: List[Type[Document]]
+    """
+    models = OrderedDict([(m, None) for m in (Batch, DeferredJob,
+                                                  ExportCheckpoint, Group,
+                                                  ImportCheckpoint, User)])
+
+    for task_type in task_types:
+        ws_manager = task_type.work_session_manager
+
+        models[task_type.task_model] = None
+        models[task_type.answer_model] = None
+        models[ws_manager.work_session] = None
+        models[task_type.leaderboard_manager.score_model] = None
+
+        if ws_manager.lease_manager is not None:
+            models[ws_manager.lease_manager.lease] = None
+
+    return list(models.keys())
+
+
+def ensure_indexes(
+    task_types: Iterable[AbstractTaskType],
+    prune: bool = False
+) -> None:
+    """
+    Creates missing indexes and reports (or drops) those that aren't declared
+    in models anymore.
+
+    :param task_types: Task types to collect models from
+    :type task_types: Iterable[AbstractTaskType]
+    :param prune: Drop undeclared indexes
+    :type prune: bool
+    """
+    for model in managed_models(task_types):
+        collection = model._get_collection()
+        model.ensure_indexes()
+
+        extra = model.compare_indexes()['extra']
+
+        for name, info in collection.index_information().items():
+            if name == '_id_' or info['key'] not in extra:
+                continue
+
+            if prune:
+                collection.drop_index(name)
+                click.echo('{}: dropped index {}'.format(
+                    collection.name, name))
+            else:
+                click.echo('{}: index {} is not declared in models'.format(
+                    collection.name, name))
+
+        click.echo('{}: {} indexes are in place'.format(
+            collection.name, len(model.list_indexes())))
+
+
+def hot_queries(task_type: AbstractTaskType) -> Dict[str, QuerySet]:
+    """
+    Prepares querysets the task type runs upon every request for a new task
+    or an answer.
+
+    :param task_type: Current task type
+    :type task_type: AbstractTaskType
+
+    :return: Map of query name to the queryset
+    :rtype: Dict[str, QuerySet]
+    """
+    user = User(id=ObjectId())
+    batch = Batch(id='__audit__', task_type=task_type.type_name)
+    ws = task_type.work_session_manager.work_session
+
+    queries = task_type.assignment_manager.hot_queries(user, batch)
+    queries['work session'] = ws.objects(user=user.id, task='__audit__')
+    queries['leaders'] = task_type.leaderboard_manager.leaders_qs()
+    queries['answer'] = task_type.answer_model.objects(created_by=user.id,
+                                                       task='__audit__')
+
+    return queries
+
+
+def audit_queries(task_types: Iterable[AbstractTaskType]) -> None:
+    """
+    Prints out query plans of hot queries of every task type.
+
+    :param task_types: Task types to audit
+    :type task_types: Iterable[AbstractTaskType]
+
+    :raise click.ClickException: if any query performs a collection scan
+    """
+    offenders = []
+
+    for task_type in task_types:
+        for name, qs in hot_queries(task_type).items():
+            plan = qs.explain()['queryPlanner']['winningPlan']
+            stages = plan_stages(plan)
+
+            click.echo('<{}> {} [{}]: {}'.format(
+                task_type.type_name,
+                name,
+                qs._collection.name,
+                ' <- '.join(stages)))
+            click.echo(json_util.dumps(plan, indent=2))
+
+            if COLLSCAN in stages:
+                offenders.append('<{}> {}'.format(task_type.type_name, name))
+
+    if offenders:
+        raise click.ClickException(
+            'Hot queries perform collection scans: {}'.format(
+                ', '.join(offenders)))
+
+
+def plan_stages(plan: Dict) -> List[str]:
+    """
+    Flattens a query plan into the list of its stages, from the root down to
+    leaves.
+
+    :param plan: Winning plan from `explain()` output
+    :type plan: Dict
+
+    :return: Stage names, e.g. ['FETCH', 'IXSCAN']
+    :rtype: List[str]
+    """
+    stages = [plan['stage']] if 'stage' in plan else []
+    children = list(plan.get('inputStages', []))
+
+    if 'inputStage' in plan:
+        children = [plan['inputStage']] + children
+
+    for shard in plan.get('shards', []):
+        children.append(shard.get('winningPlan', {}))
+
+    # slot-based engine wraps the classic plan
+    if 'queryPlan' in plan:
+        children.append(plan['queryPlan'])
+
+    for child in children:
+        stages.extend(plan_stages(child))
+
+    return stages
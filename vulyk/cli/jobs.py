@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Package contains CLI tools to process deferred signal listeners."""
+import click
+
+from vulyk.models.jobs import DeferredJob, JOB_FAILED, JOB_PENDING
+from vulyk.signals import MongoQueueDispatcher
+
+
+def work(burst: bool) -> None:
+    """
+    Runs deferred jobs from the durable queue.
+
+    :param burst: Quit once there are no jobs to run
+    :type burst: bool
+    """
+    processed = MongoQueueDispatcher().work(burst=burst)
+
+    click.echo('{} jobs processed'.format(processed))
+
+
+def retry_failed() -> int:
+    """
+    Puts failed jobs back into the queue.
+
+    :return: Number of jobs to be retried
+    :rtype: int
+    """
+    return DeferredJob \
+        .objects(state=JOB_FAILED) \
+        .update(set__state=JOB_PENDING, set__attempts=0)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict
+from typing import Dict, List
 
 from mongoengine import Q
 
@@ -21,54 +22,106 @@ def batch_completeness(batch_name: str, task_type: str) -> OrderedDict:
     :rtype: OrderedDict
     """
     batches = OrderedDict()
-    rs = lambda batch: AbstractTask.objects(batch=batch)
     percent = lambda done, total: (float(done) / (total or done or 1)) * 100
     query = Q(id=batch_name) if batch_name else Q()
     query &= Q(task_type=task_type) if task_type else Q()
+    found = list(Batch.objects(query).order_by('id'))
+    tasks = _tasks_by_batches([b.id for b in found])
 
-    for b in Batch.objects(query).order_by('id'):
+    for b in found:
         batches[b.id] = {
             'total': 0,
             'flag': 0,
             'flag_percent': 0,
+            'closed': 0,
             'answers': 0,
             'answers_percent': 0,
+            'histogram': {},
             'breakdown': ''}
 
-        if len(rs(b.id)) > 0:
-            rs_task = TASKS_TYPES[rs(b.id).first().task_type]
+        if b.id in tasks:
+            stats = tasks[b.id]
+            rs_task = TASKS_TYPES[stats['task_type']]
 
-            answers = rs(b.id).filter(closed=False).sum('users_count')
-            answers_all = rs(b.id).sum('users_count')
-            answers_mix = answers + (rs_task.redundancy * b.tasks_processed)
+            answers_mix = stats['open_answers'] + \
+                (rs_task.redundancy * b.tasks_processed)
             answers_needed = b.tasks_count * rs_task.redundancy
 
             batches[b.id] = {
                 'total': b.tasks_count,
                 'flag': b.tasks_processed,
                 'flag_percent': percent(b.tasks_processed, b.tasks_count),
-                'answers': answers_all,
+                'closed': stats['closed'],
+                'answers': stats['answers'],
                 'answers_percent': percent(answers_mix, answers_needed),
-                'breakdown': _breakdown_by_processed(b.id)
+                'histogram': stats['histogram'],
+                'breakdown': _breakdown_by_processed(stats['histogram'])
             }
 
     return batches
 
 
-def _breakdown_by_processed(batch: str) -> str:
+def _tasks_by_batches(batch_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Counts tasks and answers of all given batches with a single
+    aggregation.
+
+    :param batch_ids: Batch IDs
+    :type batch_ids: List[str]
+
+    :return: Task type, numbers of closed tasks, of answers overall and of
+             answers to open tasks, and numbers of tasks by numbers of
+             answers they got, by batch ID. Batches with no tasks are
+             missing.
+    :rtype: Dict[str, Dict]
+    """
+    users_count = '$' + AbstractTask.users_count.db_field
+    result = {}
+
+    facets = next(AbstractTask.objects(batch__in=batch_ids).aggregate(
+        {'$facet': {
+            'totals': [{'$group': {
+                '_id': '$batch',
+                'task_type': {
+                    '$first': '$' + AbstractTask.task_type.db_field},
+                'closed': {'$sum': {'$cond': ['$closed', 1, 0]}},
+                'answers': {'$sum': users_count},
+                'open_answers': {
+                    '$sum': {'$cond': ['$closed', 0, users_count]}}
+            }}],
+            'histogram': [
+                {'$group': {
+                    '_id': {'batch': '$batch', 'users_count': users_count},
+                    'tasks': {'$sum': 1}
+                }},
+                {'$sort': {'_id.users_count': 1}}
+            ]
+        }}))
+
+    for totals in facets['totals']:
+        totals['histogram'] = OrderedDict()
+        result[totals.pop('_id')] = totals
+
+    for bucket in facets['histogram']:
+        result[bucket['_id']['batch']]['histogram'][
+            str(bucket['_id']['users_count'])] = bucket['tasks']
+
+    return result
+
+
+def _breakdown_by_processed(histogram: Dict[str, int]) -> str:
     """
     Combines stats on responses count ratio for certain batch
 
-    :param batch: Batch ID
-    :type batch: str
+    :param histogram: Numbers of tasks by numbers of answers they got
+    :type histogram: Dict[str, int]
 
     :returns: string ready to be displayed in CLI
     :rtype: str
     """
     result = []
-    rs = AbstractTask.objects(batch=batch)
 
-    for i in rs.item_frequencies('users_count').items():
+    for i in histogram.items():
         result.append('{:>12}: {}'.format(*i))
 
     return '\n'.join(result)
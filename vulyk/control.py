@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding=utf-8 -*-
-from typing import AnyStr, List, Tuple
+import json
+from typing import AnyStr, List, Optional, Tuple
 
 import click
 from veryprettytable import VeryPrettyTable, ALL
@@ -11,8 +12,11 @@ from vulyk.cli import (
     batches as _batches,
     db as _db,
     groups as _groups,
+    indexes as _indexes,
+    jobs as _jobs,
     project_init as _project_init,
     stats as _stats)
+from vulyk.ext.export import WRITERS
 
 
 def abort_if_false(ctx, param, value) -> None:
@@ -87,24 +91,47 @@ def db() -> None:
                   app.config['DEFAULT_BATCH']
               ),
               help='Specify the batch id tasks should be loaded into')
+@click.option('--chunk-size', 'chunk_size', default=1000, type=int,
+              help='Number of lines parsed and inserted at once')
+@click.option('--workers', default=None, type=int,
+              help='Number of parsing processes (CPU count by default)')
+@click.option('--writers', default=4, type=int,
+              help='Number of concurrent inserts')
+@click.option('--resume', is_flag=True, default=False,
+              help='Continue the interrupted import of the same files')
 def load(
     task_type: str,
     path: str,
     meta: Tuple[str, str],
-    batch: str
+    batch: str,
+    chunk_size: int,
+    workers: Optional[int],
+    writers: int,
+    resume: bool
 ) -> None:
     """Refills tasks collection from json."""
     task_type_obj = TASKS_TYPES[task_type]
-    count = _db.load_tasks(task_type_obj, path, batch)
+    count = _db.load_tasks(task_type_obj, path, batch,
+                           chunk_size, workers, writers, resume)
 
     if batch is not None and count > 0:
-        _batches.add_batch(
-            batch_id=batch,
-            count=count,
-            task_type=task_type_obj,
-            default_batch=app.config['DEFAULT_BATCH'],
-            batch_meta=dict(meta)
-        )
+        try:
+            _batches.add_batch(
+                batch_id=batch,
+                count=count,
+                task_type=task_type_obj,
+                default_batch=app.config['DEFAULT_BATCH'],
+                batch_meta=dict(meta)
+            )
+        except click.ClickException as err:
+            # the journal is kept, so the batch could be recorded later
+            raise click.ClickException(
+                '{} {} tasks are stored, but not accounted for in the '
+                'batch. Once the cause is fixed, run the import again with '
+                '--resume to record them.'.format(err.format_message(),
+                                                  count))
+
+    _db.finish_loading(task_type_obj, path, batch)
 
 
 @db.command('export')
@@ -119,14 +146,101 @@ def load(
               help='Specify the batch id from which tasks should be exported. '
                    'Passing __all__ will export all tasks of a given type')
 @click.option('--export-all', 'export_all', default=False, is_flag=True)
+@click.option('--format', 'fmt', default=None,
+              type=click.Choice(WRITERS.keys()),
+              help='Format of the file, guessed from the extension by '
+                   'default (.jsonl, .csv or .parquet, optionally followed '
+                   'by .gz, .bz2 or .zst)')
+@click.option('--since', default=None,
+              help='Export only answers given since the moment (local '
+                   'time, e.g. 2020-01-31T10:00:00) or since the last run '
+                   'with the same checkpoint name, whether tasks are '
+                   'closed or not')
+@click.option('--follow', default=False, is_flag=True,
+              help='Keep exporting new answers until interrupted')
+@click.option('--interval', default=10.0, type=float,
+              help='Max seconds between checks for new answers')
 def export(
     task_type: str,
     path: str,
     batch: str,
+    export_all: bool,
+    fmt: str,
+    since: str,
+    follow: bool,
+    interval: float
+) -> None:
+    """Exports answers to chosen tasks to json, csv or parquet."""
+    _db.export_reports(TASKS_TYPES[task_type], path, batch, not export_all,
+                       fmt, since, follow, interval,
+                       app.config['EXPORT_OVERLAP'])
+
+
+@db.command('export-shards')
+@click.argument('folder',
+                type=click.Path(file_okay=False,
+                                writable=True,
+                                resolve_path=True))
+@click.option('--task-type', 'task_types', multiple=True,
+              type=click.Choice(TASKS_TYPES.keys()),
+              help='Task type to export (all task types by default)')
+@click.option('--batch', 'batches', multiple=True,
+              help='Batch to export (all batches by default)')
+@click.option('--suffix', default='.jsonl.gz',
+              help='Extension of shards, sets the format and compression')
+@click.option('--workers', default=None, type=int,
+              help='Number of exporting processes (CPU count by default)')
+@click.option('--export-all', 'export_all', default=False, is_flag=True)
+def export_shards(
+    folder: str,
+    task_types: List[str],
+    batches: List[str],
+    suffix: str,
+    workers: Optional[int],
     export_all: bool
 ) -> None:
-    """Exports answers to chosen tasks to json."""
-    _db.export_reports(TASKS_TYPES[task_type], path, batch, not export_all)
+    """Exports answers into a shard per task type and batch in parallel."""
+    _db.export_shards(
+        [TASKS_TYPES[t] for t in task_types] or TASKS_TYPES.values(),
+        folder,
+        batches or None,
+        suffix,
+        not export_all,
+        workers,
+        app.config['MONGODB_SETTINGS'])
+
+
+@db.command('reclaim')
+def reclaim() -> None:
+    """Removes expired task leases in bulk."""
+    _db.reclaim_leases(TASKS_TYPES.values())
+
+
+@db.command('leaderboard')
+@click.argument('task_types', type=click.Choice(TASKS_TYPES.keys()),
+                nargs=-1)
+def leaderboard(task_types: List[str]) -> None:
+    """Recounts leaderboard scores from answers (all task types by default)."""
+    _db.rebuild_leaderboards(
+        [TASKS_TYPES[t] for t in task_types] or TASKS_TYPES.values())
+
+
+@db.command('counters')
+@click.argument('task_types', type=click.Choice(TASKS_TYPES.keys()),
+                nargs=-1)
+def counters(task_types: List[str]) -> None:
+    """Recounts numbers of tasks shown on the index page."""
+    _db.rebuild_counters(
+        [TASKS_TYPES[t] for t in task_types] or TASKS_TYPES.values())
+
+
+@db.command('indexes')
+@click.option('--prune', is_flag=True, default=False,
+              help='Drop indexes that are not declared in models')
+def indexes(prune: bool) -> None:
+    """Creates missing indexes and audits plans of hot queries."""
+    _indexes.ensure_indexes(TASKS_TYPES.values(), prune)
+    _indexes.audit_queries(TASKS_TYPES.values())
 
 
 # endregion DB (export/import)
@@ -232,6 +346,31 @@ def project_init(allowed_types: List[AnyStr]) -> None:
 # endregion Bootstrapping
 
 
+# region Jobs
+@cli.group('jobs')
+def jobs() -> None:
+    """Commands to process deferred signal listeners"""
+    pass
+
+
+@jobs.command('work')
+@click.option('--burst', is_flag=True,
+              help='Quit once there are no jobs to run')
+def jobs_work(burst: bool) -> None:
+    """Run jobs from the durable queue"""
+    _jobs.work(burst)
+
+
+@jobs.command('retry')
+def jobs_retry() -> None:
+    """Put failed jobs back into the queue"""
+    click.echo('{} failed jobs are queued again'.format(
+        _jobs.retry_failed()))
+
+
+# endregion Jobs
+
+
 # region Stats
 @cli.group('stats')
 def stats() -> None:
@@ -244,10 +383,22 @@ def stats() -> None:
               type=click.Choice(_batches.batches_list()))
 @click.option('-t', '--task_type', 'task_type',
               type=click.Choice(TASKS_TYPES.keys()))
-def batch(batch_name: str, task_type: str) -> None:
+@click.option('--json', 'as_json', default=False, is_flag=True,
+              help='Print out numbers as JSON')
+def batch(batch_name: str, task_type: str, as_json: bool) -> None:
     """
     Prints out some numbers which describe the state of tasks in certain batch
     """
+    completeness = _stats.batch_completeness(batch_name, task_type)
+
+    if as_json:
+        for v in completeness.values():
+            del v['breakdown']
+
+        click.echo(json.dumps(completeness))
+
+        return
+
     headers = ['Batch',
                'Total',
                'Completed (flag)',
@@ -260,7 +411,7 @@ def batch(batch_name: str, task_type: str) -> None:
     pt.left_padding_width = 1
     pt.hrules = ALL
 
-    for k, v in _stats.batch_completeness(batch_name, task_type).items():
+    for k, v in completeness.items():
         values = [k,
                   v['total'],
                   v['flag'],
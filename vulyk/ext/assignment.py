@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains managers that decide which task a member gets next.
+"""
+import logging
+import random
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional, Type
+
+from mongoengine import Q
+from mongoengine.queryset import QuerySet
+
+from vulyk.ext.leasing import LeaseManager
+from vulyk.models.tasks import AbstractTask, Batch
+from vulyk.models.user import User
+
+__all__ = [
+    'AssignmentManager',
+    'BatchQueueAssignmentManager'
+]
+
+
+class AssignmentManager:
+    """
+    Finds a task for a member.
+
+    Batches are walked in the order of their IDs: tasks from the first batch
+    that still has something to do for the member are preferred. Tasks the
+    member has already skipped are given back only when nothing else is
+    left. If no open batch has a suitable task, the search is performed
+    without the batch restriction.
+
+    Having a lease manager and the redundancy passed, the manager prefers
+    tasks with free slots, i.e. those with `users_count + active leases`
+    below the redundancy. Tasks with no free slots are excluded by the query
+    itself, so within batches only free tasks are given away. The slot of
+    the found task is reserved for the member right away; if somebody took
+    the last one meanwhile, another task is looked for. Occupied tasks are
+    given outside batches only when no free task is left at all.
+
+    Could be overridden in plugins.
+    """
+    # fields of the task model a picked task is loaded with, i.e. everything
+    # needed for `AbstractTask.as_dict` and to start a work session
+    sample_fields = ['id', 'task_type', 'batch', 'closed', 'users_count',
+                     'task_data']
+    # number of occupied candidates sampled to give the least occupied one
+    sample_size = 10
+    # number of free tasks tried if their last slots are taken concurrently
+    reserve_attempts = 3
+
+    def __init__(
+        self,
+        task_type_name: str,
+        task_model: Type[AbstractTask],
+        redundancy: Optional[int] = None,
+        lease_manager: Optional[LeaseManager] = None
+    ) -> None:
+        """
+        Constructor.
+
+        :param task_type_name: Current task type name
+        :type task_type_name: str
+        :param task_model: Current task model
+        :type task_model: Type[AbstractTask]
+        :param redundancy: Number of answers needed per task (optional)
+        :type redundancy: Optional[int]
+        :param lease_manager: Manager that keeps task leases (optional)
+        :type lease_manager: Optional[LeaseManager]
+        """
+        assert issubclass(task_model, AbstractTask), \
+            'You should define task model properly'
+
+        self._logger = logging.getLogger('vulyk.app')
+
+        self._task_type_name = task_type_name
+        self._task_model = task_model
+        self._redundancy = redundancy
+        self._lease_manager = lease_manager
+
+    def get_next_task(
+        self,
+        user: User,
+        exclude: Optional[List[str]] = None,
+        held: Optional[List[str]] = None
+    ) -> Optional[AbstractTask]:
+        """
+        Finds given user a new task.
+
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+        :param held: IDs of tasks the member holds already, e.g. prefetched
+                     ones. Those are given only if no other free task is
+                     left (optional)
+        :type held: Optional[List[str]]
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        exclude = list(exclude or [])
+        held = [_id for _id in held or [] if _id not in exclude]
+        occupied = self._occupied(user) if self.tracks_leases else []
+        task = None
+
+        for _ in range(self.reserve_attempts):
+            task = self._next_free_task(user, exclude + held + occupied)
+
+            if task is None or self._reserve(task, user):
+                break
+
+            # the last free slot was taken meanwhile
+            occupied.append(task.id)
+            task = None
+
+        if task is None and held:
+            task = self._pick(Q(id__in=held)
+                              & self._query(user, False, exclude=exclude)) \
+                or self._pick(Q(id__in=held)
+                              & self._query(user, True, exclude=exclude))
+
+        if task is None and occupied:
+            # every task left is occupied, the least occupied one is given
+            task = self._pick_least_occupied(
+                self._query(user, False, exclude=exclude), user) \
+                or self._pick_least_occupied(
+                    self._query(user, True, exclude=exclude), user)
+
+        return task
+
+    def _next_free_task(
+        self,
+        user: User,
+        exclude: List[str]
+    ) -> Optional[AbstractTask]:
+        """
+        Finds given user a task, in open batches first.
+
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given
+        :type exclude: List[str]
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        for batch in self._open_batches():
+            task = self._next_in_batch(batch, user, exclude)
+
+            if task is not None:
+                return task
+
+        # Now searching w/o batch restriction
+        return self._pick(self._query(user, False, exclude=exclude)) \
+            or self._pick(self._query(user, True, exclude=exclude))
+
+    def _reserve(self, task: AbstractTask, user: User) -> bool:
+        """
+        Reserves a slot in the task for the member unless the task is full.
+
+        :param task: Task found for the member
+        :type task: AbstractTask
+        :param user: an instance of User model
+        :type user: User
+
+        :return: True if the task could be given to the member
+        :rtype: bool
+        """
+        return not self.tracks_leases \
+            or self._lease_manager.acquire(task, user.id, self._redundancy)
+
+    def _open_batches(self) -> Iterator[Batch]:
+        """
+        :return: Batches of current task type that have tasks left.
+        :rtype: Iterator[Batch]
+        """
+        for batch in self._open_batches_qs():
+
+            if batch.tasks_count == batch.tasks_processed:
+                continue
+
+            yield batch
+
+    def _open_batches_qs(self) -> QuerySet:
+        """
+        Open batches of current task type. Equality on `closed` lets the query
+        use the partial index on open batches.
+
+        :return: Batches queryset ordered by IDs
+        :rtype: QuerySet
+        """
+        return Batch \
+            .objects(task_type=self._task_type_name, closed=False) \
+            .order_by('id')
+
+    def _next_in_batch(
+        self,
+        batch: Batch,
+        user: User,
+        exclude: Optional[List[str]] = None
+    ) -> Optional[AbstractTask]:
+        """
+        Finds given user a new task within certain batch.
+
+        :param batch: Open batch
+        :type batch: Batch
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        return self._pick(self._query(user, False, batch, exclude)) \
+            or self._pick(self._query(user, True, batch, exclude))
+
+    def _query(
+        self,
+        user: User,
+        skipped: bool,
+        batch: Optional[Batch] = None,
+        exclude: Optional[List[str]] = None
+    ) -> Q:
+        """
+        Builds a filter for tasks available to the member.
+
+        :param user: an instance of User model
+        :type user: User
+        :param skipped: Whether tasks skipped by the member are allowed
+        :type skipped: bool
+        :param batch: Batch to restrict the search with (optional)
+        :type batch: Optional[Batch]
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+
+        :returns: Query object
+        :rtype: Q
+        """
+        query = Q(task_type=self._task_type_name) \
+            & Q(users_processed__nin=[user]) \
+            & Q(closed=False)
+
+        if not skipped:
+            query &= Q(users_skipped__nin=[user])
+
+        if batch is not None:
+            query &= Q(batch=batch.id)
+
+        if exclude:
+            query &= Q(id__nin=exclude)
+
+        return query
+
+    def hot_queries(self, user: User, batch: Batch) -> Dict[str, QuerySet]:
+        """
+        Querysets the manager runs upon every request for a new task. Used to
+        audit query plans.
+
+        :param user: an instance of User model
+        :type user: User
+        :param batch: Open batch
+        :type batch: Batch
+
+        :return: Map of query name to the queryset
+        :rtype: Dict[str, QuerySet]
+        """
+        tasks = self._task_model.objects
+        queries = OrderedDict([
+            ('open batches', self._open_batches_qs()),
+            ('next task in batch', tasks(self._query(user, False, batch))),
+            ('next skipped task in batch',
+             tasks(self._query(user, True, batch))),
+            ('next task', tasks(self._query(user, False))),
+            ('next skipped task', tasks(self._query(user, True)))
+        ])
+
+        if self.tracks_leases:
+            queries['active leases'] = \
+                self._lease_manager.active_leases_of_type_qs(
+                    self._task_type_name, exclude_user=user.id)
+
+        return queries
+
+    @property
+    def tracks_leases(self) -> bool:
+        """
+        :return: True if active leases are taken into account
+        :rtype: bool
+        """
+        return self._lease_manager is not None and bool(self._redundancy)
+
+    def _pick(self, query: Q) -> Optional[AbstractTask]:
+        """
+        Randomly picks one of the tasks matching the query.
+
+        The sampling is done on the server side within a single aggregation,
+        which returns only fields listed in `sample_fields`.
+
+        :param query: Tasks filter
+        :type query: Q
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        docs = self._sample(query, 1)
+
+        return self._task_model._from_son(docs[0]) if docs else None
+
+    def _pick_least_occupied(
+        self,
+        query: Q,
+        user: User
+    ) -> Optional[AbstractTask]:
+        """
+        Samples a few tasks matching the query and picks the one with the
+        least occupied slots.
+
+        :param query: Tasks filter
+        :type query: Q
+        :param user: an instance of User model
+        :type user: User
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        docs = self._sample(query, self.sample_size)
+
+        if not docs:
+            return None
+
+        occupied = self._occupancy(docs, user)
+
+        return self._task_model._from_son(
+            min(docs, key=lambda d: occupied[d['_id']]))
+
+    def _sample(self, query: Q, size: int) -> List[Dict]:
+        """
+        :param query: Tasks filter
+        :type query: Q
+        :param size: Number of tasks to sample
+        :type size: int
+
+        :return: Raw documents of randomly chosen tasks matching the query
+        :rtype: List[Dict]
+        """
+        fields = self._task_model._fields
+        projection = {fields[f].db_field: True for f in self.sample_fields}
+        projection['_cls'] = True
+
+        return list(self._task_model
+                    .objects(query)
+                    .aggregate(
+                        {'$sample': {'size': size}},
+                        {'$project': projection}))
+
+    def _occupied(self, user: User) -> List[str]:
+        """
+        Finds open tasks having no free slots for the member. Only tasks
+        leased to other members could be such, so both lookups are bounded
+        by the number of active leases rather than by the number of tasks.
+
+        :param user: an instance of User model
+        :type user: User
+
+        :returns: IDs of occupied tasks
+        :rtype: List[str]
+        """
+        leases = self._lease_manager.active_leases_of_type(
+            self._task_type_name, exclude_user=user.id)
+
+        if not leases:
+            return []
+
+        return [
+            doc['_id']
+            for doc in self._task_model
+            .objects(id__in=list(leases), closed=False)
+            .only('id', 'users_count')
+            .as_pymongo()
+            if doc.get('usersCount', 0) + leases[doc['_id']]
+            >= self._redundancy
+        ]
+
+    def _occupancy(self, docs: List[Dict], user: User) -> Dict[str, int]:
+        """
+        Counts occupied slots of given tasks: answers given and active leases
+        of other members.
+
+        :param docs: Raw task documents, containing `_id` and `usersCount`
+        :type docs: List[Dict]
+        :param user: an instance of User model
+        :type user: User
+
+        :returns: Map of task ID to number of occupied slots
+        :rtype: Dict[str, int]
+        """
+        leases = self._lease_manager.active_leases(
+            [d['_id'] for d in docs], exclude_user=user.id)
+
+        return {
+            d['_id']: d.get('usersCount', 0) + leases.get(d['_id'], 0)
+            for d in docs
+        }
+
+
+class _BatchQueue:
+    """
+    Pre-shuffled window over IDs of open tasks in a single batch.
+
+    IDs are loaded by chunks in the order of the primary key, so the full
+    list of IDs is never held in memory. When the end of the batch is reached
+    the cursor starts over, which lets the queue pick up tasks added later.
+    """
+    __slots__ = ['batch_id', 'ids', 'cursor', 'lock']
+
+    def __init__(self, batch_id: str) -> None:
+        self.batch_id = batch_id
+        self.ids = deque()  # type: Deque[str]
+        self.cursor = None  # type: Optional[str]
+        self.lock = threading.Lock()
+
+
+class BatchQueueAssignmentManager(AssignmentManager):
+    """
+    Assignment manager that keeps a compact queue of candidates per every
+    open batch, so a task is given away without counting and fetching
+    every eligible ID in the batch.
+
+    The queue lives in the memory of current process. Candidates are checked
+    against the DB before being given away, so several processes having their
+    own queues are fine. If nothing suitable is found within the lookahead
+    window, the manager falls back to the regular lookup.
+    """
+
+    def __init__(
+        self,
+        task_type_name: str,
+        task_model: Type[AbstractTask],
+        redundancy: Optional[int] = None,
+        lease_manager: Optional[LeaseManager] = None,
+        queue_size: int = 1000,
+        lookahead: int = 50
+    ) -> None:
+        """
+        Constructor.
+
+        :param task_type_name: Current task type name
+        :type task_type_name: str
+        :param task_model: Current task model
+        :type task_model: Type[AbstractTask]
+        :param redundancy: Number of answers needed per task (optional)
+        :type redundancy: Optional[int]
+        :param lease_manager: Manager that keeps task leases (optional)
+        :type lease_manager: Optional[LeaseManager]
+        :param queue_size: Number of IDs loaded into the queue at once
+        :type queue_size: int
+        :param lookahead: Number of candidates checked per single request
+        :type lookahead: int
+        """
+        super().__init__(task_type_name, task_model, redundancy, lease_manager)
+
+        assert queue_size >= lookahead > 0, \
+            'Queue size must not be less than lookahead'
+
+        self._queue_size = queue_size
+        self._lookahead = lookahead
+        self._queues = {}  # type: Dict[str, _BatchQueue]
+        self._lock = threading.Lock()
+
+    def _open_batches(self) -> Iterator[Batch]:
+        """
+        :return: Batches of current task type that have tasks left.
+        :rtype: Iterator[Batch]
+        """
+        batches = list(super()._open_batches())
+        self._drop_queues(keep=[b.id for b in batches])
+
+        return iter(batches)
+
+    def _next_in_batch(
+        self,
+        batch: Batch,
+        user: User,
+        exclude: Optional[List[str]] = None
+    ) -> Optional[AbstractTask]:
+        """
+        Takes the first suitable candidate from the batch queue. Falls back to
+        the regular lookup if there is none.
+
+        :param batch: Open batch
+        :type batch: Batch
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        queue = self._get_queue(batch.id)
+        _id = self._take_candidate(queue, user, exclude)
+
+        if _id is not None:
+            task = self._task_model \
+                .objects(id=_id, closed=False) \
+                .only(*self.sample_fields) \
+                .first()  # type: Optional[AbstractTask]
+
+            if task is not None:
+                return task
+
+        return super()._next_in_batch(batch, user, exclude)
+
+    def _get_queue(self, batch_id: str) -> _BatchQueue:
+        """
+        :param batch_id: Batch ID
+        :type batch_id: str
+
+        :return: Existing or new queue for the batch
+        :rtype: _BatchQueue
+        """
+        with self._lock:
+            if batch_id not in self._queues:
+                self._queues[batch_id] = _BatchQueue(batch_id)
+
+            return self._queues[batch_id]
+
+    def _drop_queues(self, keep: List[str]) -> None:
+        """
+        Forgets queues of batches that were closed meanwhile.
+
+        :param keep: IDs of batches that are still open
+        :type keep: List[str]
+        """
+        with self._lock:
+            for batch_id in set(self._queues.keys()).difference(keep):
+                del self._queues[batch_id]
+
+    def hot_queries(self, user: User, batch: Batch) -> Dict[str, QuerySet]:
+        """
+        Querysets the manager runs upon every request for a new task. Used to
+        audit query plans.
+
+        :param user: an instance of User model
+        :type user: User
+        :param batch: Open batch
+        :type batch: Batch
+
+        :return: Map of query name to the queryset
+        :rtype: Dict[str, QuerySet]
+        """
+        queries = super().hot_queries(user, batch)
+        queries['queue refill'] = self._refill_qs(batch.id, '')
+
+        return queries
+
+    def _refill(self, queue: _BatchQueue) -> None:
+        """
+        Loads the next chunk of open tasks' IDs into the queue.
+        Must be called having the queue locked.
+
+        :param queue: Batch queue
+        :type queue: _BatchQueue
+        """
+        chunk = list(self._refill_qs(queue.batch_id, queue.cursor)
+                     .scalar('id'))
+
+        # start over next time if the end of the batch is reached
+        queue.cursor = chunk[-1] if len(chunk) == self._queue_size else None
+
+        random.shuffle(chunk)
+        known = set(queue.ids)
+        queue.ids.extend(_id for _id in chunk if _id not in known)
+
+    def _refill_qs(self, batch_id: str, cursor: Optional[str]) -> QuerySet:
+        """
+        :param batch_id: Batch ID
+        :type batch_id: str
+        :param cursor: The last ID loaded into the queue
+        :type cursor: Optional[str]
+
+        :return: Next chunk of open tasks in the batch
+        :rtype: QuerySet
+        """
+        query = Q(task_type=self._task_type_name) \
+            & Q(batch=batch_id) \
+            & Q(closed=False)
+
+        if cursor is not None:
+            query &= Q(id__gt=cursor)
+
+        return self._task_model \
+            .objects(query) \
+            .order_by('id') \
+            .limit(self._queue_size)
+
+    def _take_candidate(
+        self,
+        queue: _BatchQueue,
+        user: User,
+        exclude: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """
+        Finds an ID of a task within the lookahead window that is open,
+        has a free slot, is not excluded and is neither processed nor skipped
+        by the user.
+        The candidate goes to the tail of the queue to let others get
+        different tasks meanwhile; closed tasks are thrown away.
+
+        :param queue: Batch queue
+        :type queue: _BatchQueue
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+
+        :return: Task ID or None
+        :rtype: Optional[str]
+        """
+        with queue.lock:
+            if len(queue.ids) < self._lookahead:
+                self._refill(queue)
+
+            window = list(islice(queue.ids, self._lookahead))
+
+        if not window:
+            return None
+
+        states = {
+            doc['_id']: doc
+            for doc in self._task_model
+            .objects(id__in=window)
+            .only('id', 'closed', 'users_count', 'users_processed',
+                  'users_skipped')
+            .as_pymongo()
+        }
+        occupied = self._occupancy(list(states.values()), user) \
+            if self.tracks_leases else {}
+        excluded = set(exclude or [])
+        chosen = None
+        stale = []
+
+        for _id in window:
+            doc = states.get(_id)
+
+            if doc is None or doc.get('closed', False):
+                stale.append(_id)
+            elif chosen is None \
+                    and _id not in excluded \
+                    and user.id not in doc.get('usersProcessed', []) \
+                    and user.id not in doc.get('usersSkipped', []) \
+                    and occupied.get(_id, 0) < (self._redundancy or 1):
+                chosen = _id
+
+        with queue.lock:
+            for _id in stale + [chosen]:
+                try:
+                    queue.ids.remove(_id)
+                except ValueError:
+                    # either None or was taken by someone else
+                    pass
+
+            if chosen is not None:
+                queue.ids.append(chosen)
+
+        return chosen
@@ -0,0 +1,689 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains the engine that exports answers of tasks and writers that
+stream them into files of different formats.
+
+The format is chosen by the extension of the file (`.jsonl`, `.csv` or
+`.parquet`), optionally followed by the extension of compression (`.gz`,
+`.bz2` or `.zst`), e.g. `answers.csv.gz`. Unknown extensions are written as
+JSON lines, as they always were.
+"""
+import csv
+import gzip
+import io
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple
+)
+
+import bz2file as bz2
+from bson import ObjectId
+from mongoengine.queryset import QuerySet
+from pymongo.errors import OperationFailure
+
+from vulyk.models.tasks import AbstractAnswer, AbstractTask
+from vulyk.models.user import User
+from vulyk.utils import chunked
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__all__ = [
+    'COMPRESSIONS',
+    'CSVWriter',
+    'export_to',
+    'ExportStats',
+    'JSONLinesWriter',
+    'open_writer',
+    'ParquetWriter',
+    'ReportExporter',
+    'ReportWriter',
+    'WRITERS',
+    'write_reports'
+]
+
+# Size of the buffer in front of the compressor and of the file itself
+BUFFER_SIZE = 2 ** 20
+
+
+class ReportExporter:
+    """
+    Streams answers of tasks grouped by task.
+
+    Tasks are read by a single aggregation which joins their answers with
+    `$lookup`, so there are no queries per task or per answer. Members are
+    few and give many answers each, so they are fetched in bulk once per
+    window of tasks and kept in a bounded cache. Memory use doesn't depend
+    on the number of tasks exported.
+    """
+
+    def __init__(
+        self,
+        task_model: type,
+        answer_model: type,
+        user_model: type = User,
+        window: int = 500,
+        users_cache: int = 100000
+    ) -> None:
+        """
+        Constructor.
+
+        :param task_model: Task model of the task type
+        :type task_model: type
+        :param answer_model: Answer model of the task type
+        :type answer_model: type
+        :param user_model: Active user model
+        :type user_model: type
+        :param window: Number of tasks read from the cursor at once
+        :type window: int
+        :param users_cache: Max number of members kept in memory
+        :type users_cache: int
+        """
+        assert issubclass(task_model, AbstractTask), \
+            'You should define task model properly'
+        assert issubclass(answer_model, AbstractAnswer), \
+            'You should define answer model properly'
+        assert window > 0 and users_cache >= window, \
+            'Cache should hold members of a window at least'
+
+        self._task_model = task_model
+        self._answer_model = answer_model
+        self._user_model = user_model
+        self._window = window
+        self._users_cache = users_cache
+        # Change streams need a replica set, we poll on standalone servers
+        self._watch = True
+
+    def reports(
+        self,
+        qs: QuerySet
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        :param qs: Tasks to export answers of
+        :type qs: QuerySet
+
+        :return: Generator of lists of answers (as dicts) per task
+        :rtype: Generator[List[Dict[str, Any]], None, None]
+        """
+        fields = self._answer_model._fields
+        users = OrderedDict()  # type: OrderedDict
+        cursor = qs.aggregate(
+            [{'$lookup': {
+                'from': self._answer_model._get_collection_name(),
+                'localField': '_id',
+                'foreignField': fields['task'].db_field,
+                'as': '_answers'
+            }}],
+            allowDiskUse=True,
+            batchSize=self._window)
+
+        for window in chunked(cursor, self._window):
+            self._fetch_users(
+                users,
+                (a.get(fields['created_by'].db_field)
+                 for doc in window for a in doc['_answers']))
+
+            for doc in window:
+                yield self._reports_of(doc, users)
+
+    def _reports_of(self, doc: Dict, users: Dict) -> List[Dict[str, Any]]:
+        """
+        Turns the task joined with its answers into the list of answers as
+        `AbstractAnswer.as_dict` gives them, without querying anything.
+
+        :param doc: Raw task document with `_answers`
+        :type doc: Dict
+        :param users: Cached members by ID
+        :type users: Dict
+
+        :rtype: List[Dict[str, Any]]
+        """
+        answers = doc.pop('_answers')
+        task = self._task_model._from_son(doc)
+        classes = self._answer_model._subclasses
+
+        return [self._answer_of(son, task, users) for son in answers
+                if son.get('_cls', self._answer_model._class_name)
+                in classes]
+
+    def _answer_of(
+        self,
+        son: Dict,
+        task: AbstractTask,
+        users: Dict
+    ) -> Dict[str, Any]:
+        """
+        :param son: Raw answer document
+        :type son: Dict
+        :param task: Task the answer belongs to
+        :type task: AbstractTask
+        :param users: Cached members by ID
+        :type users: Dict
+
+        :return: Answer as `AbstractAnswer.as_dict` gives it
+        :rtype: Dict[str, Any]
+        """
+        created_by = self._answer_model._fields['created_by'].db_field
+        answer = self._answer_model._from_son(son)
+        answer._data['task'] = task
+        answer._data['created_by'] = users.get(son.get(created_by))
+
+        return answer.as_dict()
+
+    def reports_between(
+        self,
+        since: Optional[datetime],
+        until: datetime,
+        batch: Optional[str] = None,
+        exported: Optional[Dict[ObjectId, datetime]] = None
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        Streams answers given after `since` (if set) and not later than
+        `until` in order they were given. Answers are read with the index on
+        the creation time, so the cost depends on the number of new answers
+        only. Answers of a task are grouped within a window of answers, so
+        the same task could appear again in the next window.
+
+        :param since: Exclusive lower bound of `created_at`
+        :type since: Optional[datetime]
+        :param until: Inclusive upper bound of `created_at`
+        :type until: datetime
+        :param batch: Export only tasks of this batch if set
+        :type batch: Optional[str]
+        :param exported: Answers exported already, they are skipped. Given
+                         answers are added to it along with their
+                         `created_at`
+        :type exported: Optional[Dict[ObjectId, datetime]]
+
+        :return: Generator of lists of answers (as dicts) per task
+        :rtype: Generator[List[Dict[str, Any]], None, None]
+        """
+        fields = self._answer_model._fields
+        task_field = fields['task'].db_field
+        created_at = fields['created_at'].db_field
+        users = OrderedDict()  # type: OrderedDict
+        query = {'created_at__lte': until}
+        tasks_query = {}
+
+        if since is not None:
+            query['created_at__gt'] = since
+
+        if batch is not None:
+            tasks_query['batch'] = batch
+
+        cursor = self._answer_model.objects(**query) \
+            .order_by('created_at') \
+            .as_pymongo() \
+            .batch_size(self._window)
+
+        for window in chunked(cursor, self._window):
+            grouped = OrderedDict()  # type: OrderedDict
+
+            for son in window:
+                if exported is None or son['_id'] not in exported:
+                    grouped.setdefault(son.get(task_field), []).append(son)
+
+            tasks = {
+                doc['_id']: self._task_model._from_son(doc)
+                for doc in self._task_model.objects(
+                    id__in=list(grouped), **tasks_query).as_pymongo()}
+            self._fetch_users(
+                users,
+                (son.get(fields['created_by'].db_field) for son in window))
+
+            for task_id, answers in grouped.items():
+                if task_id in tasks:
+                    yield [self._answer_of(son, tasks[task_id], users)
+                           for son in answers]
+
+                    if exported is not None:
+                        exported.update((son['_id'], son.get(created_at))
+                                        for son in answers)
+
+    def wait(self, timeout: float) -> None:
+        """
+        Blocks until some answer is given or timeout passes. Change stream
+        is used to wake up early where the server supports it, otherwise
+        it's just a pause between polls.
+
+        :param timeout: Max seconds to wait
+        :type timeout: float
+        """
+        if self._watch:
+            collection = self._answer_model._get_collection()
+
+            try:
+                with collection.watch(
+                        [{'$match': {'operationType': 'insert'}}],
+                        max_await_time_ms=int(timeout * 1000)) as stream:
+                    stream.try_next()
+
+                return
+            except (OperationFailure, NotImplementedError):
+                self._watch = False
+
+        time.sleep(timeout)
+
+    def _fetch_users(
+        self,
+        users: OrderedDict,
+        ids: Iterable[ObjectId]
+    ) -> None:
+        """
+        Makes sure given members are cached, missing ones are fetched with
+        a single query.
+
+        :param users: Cached members by ID, the least recently used first
+        :type users: OrderedDict
+        :param ids: IDs of members
+        :type ids: Iterable[ObjectId]
+        """
+        missing = set()
+
+        for user_id in ids:
+            if user_id in users:
+                users.move_to_end(user_id)
+            elif user_id is not None:
+                missing.add(user_id)
+
+        if not missing:
+            return
+
+        while users and len(users) + len(missing) > self._users_cache:
+            users.popitem(last=False)
+
+        for user in self._user_model.objects(id__in=list(missing)):
+            users[user.id] = user
+
+
+class ExportStats:
+    """
+    Running totals of the export.
+    """
+
+    def __init__(self) -> None:
+        self.tasks = 0
+        self.answers = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        """
+        :return: Seconds since the export was started
+        :rtype: float
+        """
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    @property
+    def answers_per_second(self) -> float:
+        """
+        :return: Answers (rows) written per second
+        :rtype: float
+        """
+        return self.answers / self.elapsed
+
+    def __str__(self) -> str:
+        return '{s.tasks} tasks, {s.answers} answers in {s.elapsed:.1f}s ' \
+               '({s.answers_per_second:.0f} rows/s)'.format(s=self)
+
+
+# Parts of the answer having the same keys in every answer, those are spread
+# into columns. The result itself varies from answer to answer, so it's kept
+# as a single JSON column.
+FLAT_PARTS = ('task', 'user')
+
+
+def _flatten(answer: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turns the answer into a flat row: `FLAT_PARTS` are spread into dotted
+    columns (e.g. `task.id`), other structures are kept as JSON, so every
+    row has the same columns.
+
+    :param answer: Answer as `AbstractAnswer.as_dict` gives it
+    :type answer: Dict[str, Any]
+
+    :rtype: Dict[str, Any]
+    """
+    row = {}
+
+    for key, value in answer.items():
+        values = value.items() \
+            if isinstance(value, dict) and key in FLAT_PARTS \
+            else [(None, value)]
+
+        for sub, v in values:
+            if isinstance(v, (dict, list, tuple)):
+                v = json.dumps(v)
+
+            row[key if sub is None else '{}.{}'.format(key, sub)] = v
+
+    return row
+
+
+class ReportWriter:
+    """
+    Base class of writers. Writer gets answers of tasks one task at a time
+    and doesn't keep them in memory longer than needed to encode them.
+    """
+    # Writer could be used on top of compression
+    compressible = True
+
+    def __init__(self, stream: BinaryIO) -> None:
+        """
+        :param stream: Buffered binary stream to write into
+        :type stream: BinaryIO
+        """
+        self._stream = stream
+
+    def write(self, report: List[Dict[str, Any]]) -> None:
+        """
+        :param report: Answers of a single task
+        :type report: List[Dict[str, Any]]
+        """
+        raise NotImplementedError()
+
+    def flush(self) -> None:
+        """
+        Pushes everything written so far through the buffer and
+        the compressor to the file.
+        """
+        stream = self._stream
+
+        while stream is not None:
+            stream.flush()
+            stream = getattr(stream, 'raw', None)
+
+    def close(self) -> None:
+        """
+        Flushes everything and closes the stream.
+        """
+        self._stream.close()
+
+    def __enter__(self) -> 'ReportWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class JSONLinesWriter(ReportWriter):
+    """
+    Writes answers of each task as a JSON list on a separate line.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        super().__init__(stream)
+
+        self._text = io.TextIOWrapper(stream, encoding='utf-8')
+
+    def write(self, report: List[Dict[str, Any]]) -> None:
+        self._text.write(json.dumps(report) + os.linesep)
+
+    def flush(self) -> None:
+        self._text.flush()
+        super().flush()
+
+    def close(self) -> None:
+        self._text.close()
+
+
+class CSVWriter(ReportWriter):
+    """
+    Writes a row per answer, columns are taken from the first answer. The
+    result of the answer makes a single JSON column.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        super().__init__(stream)
+
+        self._text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        self._csv = None  # type: Optional[csv.DictWriter]
+
+    def write(self, report: List[Dict[str, Any]]) -> None:
+        """
+        :raise ValueError: if answer has columns the first one didn't have,
+                           i.e. `as_dict` of answers isn't uniform
+        """
+        for answer in report:
+            row = _flatten(answer)
+
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._text, list(row))
+                self._csv.writeheader()
+
+            self._csv.writerow(row)
+
+    def flush(self) -> None:
+        self._text.flush()
+        super().flush()
+
+    def close(self) -> None:
+        self._text.close()
+
+
+class ParquetWriter(ReportWriter):
+    """
+    Writes answers into a columnar Parquet file in row groups, so only
+    a single group is held in memory. Columns are taken from the first
+    answer, the result of the answer makes a single JSON column. Requires
+    `pyarrow`, Parquet is compressed on its own.
+    """
+    compressible = False
+    row_group = 50000
+
+    def __init__(self, stream: BinaryIO) -> None:
+        if pyarrow is None:
+            raise ValueError('pyarrow must be installed to export Parquet')
+
+        super().__init__(stream)
+
+        self._rows = []  # type: List[Dict[str, Any]]
+        self._schema = None
+        self._parquet = None
+
+    def write(self, report: List[Dict[str, Any]]) -> None:
+        self._rows.extend(_flatten(a) for a in report)
+
+        if len(self._rows) >= self.row_group:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+
+        columns = list(self._schema.names if self._schema else self._rows[0])
+        table = pyarrow.table(
+            {c: [r.get(c) for r in self._rows] for c in columns},
+            schema=self._schema)
+
+        if self._parquet is None:
+            # Columns that were empty in the first group hold strings
+            self._schema = pyarrow.schema(
+                f.with_type(pyarrow.string())
+                if pyarrow.types.is_null(f.type) else f
+                for f in table.schema)
+            table = table.cast(self._schema)
+            self._parquet = pyarrow.parquet.ParquetWriter(
+                self._stream, self._schema)
+
+        self._parquet.write_table(table)
+        self._rows = []
+
+    def flush(self) -> None:
+        self._flush()
+        super().flush()
+
+    def close(self) -> None:
+        self._flush()
+
+        if self._parquet is not None:
+            self._parquet.close()
+
+        super().close()
+
+
+# Writers by format
+WRITERS = {
+    'jsonl': JSONLinesWriter,
+    'csv': CSVWriter,
+    'parquet': ParquetWriter
+}
+
+# Extensions of formats, the rest is written as JSON lines
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet'
+}
+
+
+def _zstd_open(path: str) -> BinaryIO:
+    if zstandard is None:
+        raise ValueError('zstandard must be installed to export into .zst')
+
+    return zstandard.ZstdCompressor().stream_writer(
+        open(path, 'wb', buffering=BUFFER_SIZE))
+
+
+# Functions that open a compressed file for writing, by extension
+COMPRESSIONS = {
+    '.gz': lambda path: gzip.open(path, 'wb', compresslevel=6),
+    '.bz2': lambda path: bz2.BZ2File(path, 'wb'),
+    '.zst': _zstd_open
+}  # type: Dict[str, Callable[[str], BinaryIO]]
+
+
+def _guess(path: str) -> Tuple[str, Optional[str]]:
+    """
+    :param path: Path to the file
+    :type path: str
+
+    :return: Format and extension of compression (if any) of the file
+    :rtype: Tuple[str, Optional[str]]
+    """
+    base, compression = os.path.splitext(path.lower())
+
+    if compression not in COMPRESSIONS:
+        base, compression = path.lower(), None
+
+    return _EXTENSIONS.get(os.path.splitext(base)[1], 'jsonl'), compression
+
+
+def open_writer(path: str, fmt: Optional[str] = None) -> ReportWriter:
+    """
+    :param path: Path to the file
+    :type path: str
+    :param fmt: Format, guessed from the extension if not set
+    :type fmt: Optional[str]
+
+    :return: Writer of the format on top of the buffered (and compressed if
+             extension says so) file
+    :rtype: ReportWriter
+
+    :raise ValueError: if format is unknown or can't be used
+    """
+    guessed, compression = _guess(path)
+    fmt = fmt or guessed
+
+    if fmt not in WRITERS:
+        raise ValueError('Unknown format {}'.format(fmt))
+
+    writer_class = WRITERS[fmt]
+
+    if compression is None:
+        stream = open(path, 'wb', buffering=BUFFER_SIZE)
+    elif writer_class.compressible:
+        stream = io.BufferedWriter(COMPRESSIONS[compression](path),
+                                   BUFFER_SIZE)
+    else:
+        raise ValueError('{} files are compressed already'.format(fmt))
+
+    try:
+        return writer_class(stream)
+    except Exception:
+        stream.close()
+        raise
+
+
+def export_to(
+    path: str,
+    reports: Iterable[List[Dict[str, Any]]],
+    fmt: Optional[str] = None,
+    progress: Optional[Callable[[ExportStats], None]] = None,
+    every: int = 1000
+) -> ExportStats:
+    """
+    Streams answers into the file.
+
+    :param path: Path to the file
+    :type path: str
+    :param reports: Answers grouped by task, see `export_reports`
+    :type reports: Iterable[List[Dict[str, Any]]]
+    :param fmt: Format, guessed from the extension if not set
+    :type fmt: Optional[str]
+    :param progress: Callback invoked with running totals
+    :type progress: Optional[Callable[[ExportStats], None]]
+    :param every: Number of tasks between progress callbacks
+    :type every: int
+
+    :rtype: ExportStats
+    """
+    stats = ExportStats()
+
+    with open_writer(path, fmt) as writer:
+        write_reports(writer, reports, stats, progress, every)
+
+    return stats
+
+
+def write_reports(
+    writer: ReportWriter,
+    reports: Iterable[List[Dict[str, Any]]],
+    stats: ExportStats,
+    progress: Optional[Callable[[ExportStats], None]] = None,
+    every: int = 1000
+) -> None:
+    """
+    Feeds answers to the open writer updating running totals.
+
+    :param writer: Open writer
+    :type writer: ReportWriter
+    :param reports: Answers grouped by task
+    :type reports: Iterable[List[Dict[str, Any]]]
+    :param stats: Running totals
+    :type stats: ExportStats
+    :param progress: Callback invoked with running totals
+    :type progress: Optional[Callable[[ExportStats], None]]
+    :param every: Number of tasks between progress callbacks
+    :type every: int
+    """
+    for report in reports:
+        writer.write(report)
+        stats.tasks += 1
+        stats.answers += len(report)
+
+        if progress is not None and stats.tasks % every == 0:
+            progress(stats)
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains the pipeline which loads tasks from JSON lines files.
+
+Files are read line by line in chunks, chunks are parsed and turned into
+documents by a pool of processes, documents are stored by a pool of threads
+with unordered bulk inserts. Tasks that are stored already are counted as
+duplicates and don't interrupt the import, so it's safe to load the same
+file again.
+"""
+import gzip
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import (
+    Executor,
+    Future,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+import bz2file as bz2
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from vulyk.models.imports import ImportCheckpoint
+from vulyk.models.task_types import AbstractTaskType
+from vulyk.models.tasks import AbstractTask, Batch
+from vulyk.utils import chunked, make_task_id
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+__all__ = [
+    'ImportStats',
+    'open_anything',
+    'TaskImporter'
+]
+
+DUPLICATE_KEY = 11000
+
+
+def open_anything(filename: str):
+    """
+    :param filename: Path to the file
+    :type filename: str
+
+    :return: Function that opens the file, decompressing it if needed
+    """
+    if filename.endswith('.bz2'):
+        return bz2.BZ2File
+    if filename.endswith('.gz'):
+        return gzip.open
+
+    return open
+
+
+class ImportStats:
+    """
+    Running totals of the import.
+    """
+
+    def __init__(self) -> None:
+        self.lines = 0
+        self.bytes = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        """
+        :return: Seconds since the import was started
+        :rtype: float
+        """
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    @property
+    def tasks_per_second(self) -> float:
+        """
+        :return: Tasks stored or found stored already per second
+        :rtype: float
+        """
+        return (self.inserted + self.duplicates) / self.elapsed
+
+    @property
+    def mb_per_second(self) -> float:
+        """
+        :return: Megabytes of (decompressed) input read per second
+        :rtype: float
+        """
+        return self.bytes / 2 ** 20 / self.elapsed
+
+    def __str__(self) -> str:
+        return '{s.lines} lines: {s.inserted} inserted, {s.duplicates} ' \
+               'duplicates, {s.invalid} invalid, {s.failed} failed in ' \
+               '{s.elapsed:.1f}s ({s.tasks_per_second:.0f} tasks/s, ' \
+               '{s.mb_per_second:.2f} MB/s)'.format(s=self)
+
+
+def _prepare(
+    task_model: Type[AbstractTask],
+    type_name: str,
+    id_scheme: str,
+    batch: Optional[str],
+    lines: Tuple[bytes, ...]
+) -> Tuple[List[Dict], int]:
+    """
+    Parses a chunk of lines and turns tasks into documents ready to insert.
+    Runs in a worker process.
+
+    :param task_model: Task model of the task type
+    :type task_model: Type[AbstractTask]
+    :param type_name: Task type name
+    :type type_name: str
+    :param id_scheme: Name of the task ID scheme
+    :type id_scheme: str
+    :param batch: Batch ID (optional)
+    :type batch: Optional[str]
+    :param lines: Raw lines
+    :type lines: Tuple[bytes, ...]
+
+    :return: Documents and number of lines that are not tasks
+    :rtype: Tuple[List[Dict], int]
+    """
+    docs = []
+    invalid = 0
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            task = json.loads(line)
+        except ValueError:
+            invalid += 1
+            continue
+
+        if not isinstance(task, dict) or not task:
+            invalid += 1
+            continue
+
+        docs.append(task_model(
+            id=make_task_id(task, id_scheme),
+            batch=batch,
+            task_type=type_name,
+            task_data=task).to_mongo())
+
+    return docs, invalid
+
+
+class TaskImporter:
+    """
+    Loads tasks of certain task type from JSON lines files, which may be
+    compressed with gzip or bzip2.
+
+    Progress of every file is kept in the journal, so an interrupted import
+    can be resumed from the last chunk stored along with all chunks before
+    it. Chunks stored after that are read again and found to be duplicates.
+    """
+
+    def __init__(
+        self,
+        task_type: AbstractTaskType,
+        chunk_size: int = 1000,
+        workers: Optional[int] = None,
+        writers: int = 4,
+        checkpoint_model: type = ImportCheckpoint
+    ) -> None:
+        """
+        Constructor.
+
+        :param task_type: Task type to load tasks of
+        :type task_type: AbstractTaskType
+        :param chunk_size: Number of lines parsed and inserted at once
+        :type chunk_size: int
+        :param workers: Number of parsing processes, CPU count by default.
+                        0 makes lines parsed within current process.
+        :type workers: Optional[int]
+        :param writers: Number of concurrent inserts
+        :type writers: int
+        :param checkpoint_model: Model of the journal
+        :type checkpoint_model: type
+        """
+        assert chunk_size > 0, 'Chunk size must be positive'
+        assert writers > 0, 'At least one writer is needed'
+        assert issubclass(checkpoint_model, ImportCheckpoint), \
+            'You should define checkpoint model properly'
+
+        self._logger = logging.getLogger('vulyk.app')
+        self._task_type = task_type
+        self._chunk_size = chunk_size
+        self._workers = (os.cpu_count() or 1) if workers is None else workers
+        self._writers = writers
+        self.checkpoint = checkpoint_model
+
+    def run(
+        self,
+        paths: Iterable[str],
+        batch: Optional[str],
+        progress: Optional[Callable[[str, ImportStats], None]] = None,
+        resume: bool = False
+    ) -> ImportStats:
+        """
+        Loads all given files.
+
+        :param paths: Paths to the files
+        :type paths: Iterable[str]
+        :param batch: Batch ID tasks should be loaded into (optional)
+        :type batch: Optional[str]
+        :param progress: Called with the path and stats every time a chunk
+                         is stored
+        :type progress: Optional[Callable[[str, ImportStats], None]]
+        :param resume: Continue from the journal instead of starting anew,
+                       files loaded completely are skipped
+        :type resume: bool
+
+        :return: Totals of the import, previous attempts aside
+        :rtype: ImportStats
+        """
+        stats = ImportStats()
+        parsers = ProcessPoolExecutor(self._workers) \
+            if self._workers > 0 else None
+
+        try:
+            with ThreadPoolExecutor(self._writers) as inserters:
+                for path in paths:
+                    checkpoint = self._checkpoint(path, batch, resume)
+
+                    if checkpoint.finished:
+                        continue
+
+                    self._load_file(path, batch, checkpoint, stats, parsers,
+                                    inserters,
+                                    lambda: progress and progress(path, stats))
+        finally:
+            if parsers is not None:
+                parsers.shutdown()
+
+            if stats.inserted > 0:
+                self._task_type.counters_model.tasks_added(
+                    self._task_type.type_name, stats.inserted)
+
+        self._logger.info('Tasks of <%s> loaded: %s',
+                          self._task_type.type_name, stats)
+
+        return stats
+
+    def inserted(self, paths: Iterable[str], batch: Optional[str]) -> int:
+        """
+        :param paths: Paths to the files
+        :type paths: Iterable[str]
+        :param batch: Batch ID (optional)
+        :type batch: Optional[str]
+
+        :return: Number of tasks stored from the files by all attempts
+        :rtype: int
+        """
+        return int(self._journal(paths, batch).sum('inserted'))
+
+    def unaccounted(self, batch: str) -> int:
+        """
+        Counts tasks in the batch rather than in the journal, so the number
+        is exact even if the import was interrupted right after tasks were
+        stored.
+
+        :param batch: Batch ID
+        :type batch: str
+
+        :return: Number of tasks stored in the batch, but not accounted for
+                 in the batch yet
+        :rtype: int
+        """
+        stored = self._task_type.task_model.objects(batch=batch).count()
+        recorded = Batch.objects(id=batch).scalar('tasks_count').first()
+
+        return max(stored - (recorded or 0), 0)
+
+    def journaled(self, paths: Iterable[str], batch: Optional[str]) -> bool:
+        """
+        :param paths: Paths to the files
+        :type paths: Iterable[str]
+        :param batch: Batch ID (optional)
+        :type batch: Optional[str]
+
+        :return: True if any of the files has been loaded and not forgotten
+        :rtype: bool
+        """
+        return self._journal(paths, batch).only('id').first() is not None
+
+    def forget(self, paths: Iterable[str], batch: Optional[str]) -> None:
+        """
+        Drops the journal of the files once the import is accounted for.
+
+        :param paths: Paths to the files
+        :type paths: Iterable[str]
+        :param batch: Batch ID (optional)
+        :type batch: Optional[str]
+        """
+        self._journal(paths, batch).delete()
+
+    def _journal(self, paths: Iterable[str], batch: Optional[str]):
+        """
+        :return: Queryset of journal entries of the files
+        :rtype: mongoengine.queryset.QuerySet
+        """
+        return self.checkpoint.objects(
+            task_type=self._task_type.type_name,
+            batch=batch,
+            path__in=list(paths))
+
+    def _checkpoint(
+        self,
+        path: str,
+        batch: Optional[str],
+        resume: bool
+    ) -> ImportCheckpoint:
+        """
+        :return: Journal entry of the file, a fresh one unless resuming
+        :rtype: ImportCheckpoint
+        """
+        journal = self.checkpoint.objects(
+            task_type=self._task_type.type_name, batch=batch, path=path)
+
+        if not resume:
+            journal.delete()
+
+        return journal.modify(upsert=True, new=True,
+                              set__updated_at=datetime.utcnow())
+
+    def _load_file(
+        self,
+        path: str,
+        batch: Optional[str],
+        checkpoint: ImportCheckpoint,
+        stats: ImportStats,
+        parsers: Optional[Executor],
+        inserters: Executor,
+        notify: Callable[[], None]
+    ) -> None:
+        """
+        Streams a single file through the pipeline. Parsing and inserts run
+        ahead of the reader by a couple of chunks per worker at most.
+
+        Chunks are stored out of order, so the journal is moved forward only
+        when all chunks read before are stored.
+        """
+        parsing = deque()  # type: deque
+        inserting = {}  # type: Dict[Future, List]
+        # [end offset, end line, stored] of chunks past the journal
+        chunks = deque()  # type: deque
+        prepare_args = (self._task_type.task_model,
+                        self._task_type.type_name,
+                        self._task_type.task_id_scheme,
+                        batch)
+        offset, line = checkpoint.offset, checkpoint.line
+
+        def commit() -> None:
+            committed = None
+
+            while chunks and chunks[0][2]:
+                committed = chunks.popleft()
+
+            if committed is not None:
+                checkpoint.update(set__offset=committed[0],
+                                  set__line=committed[1],
+                                  set__updated_at=datetime.utcnow())
+
+        def collect(done: Iterable[Future]) -> None:
+            for future in list(done):
+                inserted, duplicates, failed = future.result()
+                stats.inserted += inserted
+                stats.duplicates += duplicates
+                stats.failed += failed
+                inserting.pop(future)[2] = True
+                notify()
+
+            commit()
+
+        def insert(parsed: Tuple[List[Dict], int], chunk: List) -> None:
+            docs, invalid = parsed
+            stats.invalid += invalid
+
+            if len(inserting) >= self._writers:
+                done, _ = wait(inserting, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            if docs:
+                inserting[inserters.submit(
+                    self._insert, docs, checkpoint.id)] = chunk
+            else:
+                chunk[2] = True
+                commit()
+
+        with open_anything(path)(path, 'rb') as f:
+            if offset:
+                f.seek(offset)
+
+            for lines in chunked(f, self._chunk_size):
+                size = sum(map(len, lines))
+                offset += size
+                line += len(lines)
+                stats.lines += len(lines)
+                stats.bytes += size
+                chunk = [offset, line, False]
+                chunks.append(chunk)
+
+                if parsers is None:
+                    insert(_prepare(*prepare_args, lines), chunk)
+                    continue
+
+                parsing.append((parsers.submit(_prepare, *prepare_args,
+                                               lines), chunk))
+
+                if len(parsing) >= self._workers * 2:
+                    future, chunk = parsing.popleft()
+                    insert(future.result(), chunk)
+
+        while parsing:
+            future, chunk = parsing.popleft()
+            insert(future.result(), chunk)
+
+        collect(list(inserting))
+        checkpoint.update(set__finished=True,
+                          set__updated_at=datetime.utcnow())
+
+    def _insert(
+        self,
+        docs: List[Dict],
+        checkpoint_id: ObjectId
+    ) -> Tuple[int, int, int]:
+        """
+        Stores documents, tasks stored already are skipped. Stored tasks are
+        counted in the journal right away. Those stored right before an
+        interruption could be missed there, so resumed imports count tasks
+        in the batch instead, see `unaccounted`.
+
+        :param docs: Documents to insert
+        :type docs: List[Dict]
+        :param checkpoint_id: ID of the journal entry of the file
+        :type checkpoint_id: ObjectId
+
+        :return: Numbers of inserted, duplicate and failed documents
+        :rtype: Tuple[int, int, int]
+        """
+        collection = self._task_type.task_model._get_collection()
+        duplicates = failed = 0
+
+        try:
+            collection.insert_many(docs, ordered=False)
+            inserted = len(docs)
+        except BulkWriteError as err:
+            errors = err.details.get('writeErrors', [])
+            inserted = err.details.get('nInserted', 0)
+            duplicates = sum(e.get('code') == DUPLICATE_KEY for e in errors)
+            failed = len(errors) - duplicates
+
+            if failed:
+                self._logger.error('%s tasks of <%s> were not stored: %s',
+                                   failed, self._task_type.type_name,
+                                   errors[0].get('errmsg'))
+
+        if inserted:
+            self.checkpoint.objects(id=checkpoint_id) \
+                .update_one(inc__inserted=inserted)
+
+        return inserted, duplicates, failed
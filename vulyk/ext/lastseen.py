@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, timedelta
+
+from mongoengine import Q
+
+from vulyk.models.user import User
+
+__all__ = [
+    'LastSeenTracker'
+]
+
+
+class LastSeenTracker:
+    """
+    This class keeps `last_login` of members up to date without writing to
+    the DB upon every request.
+
+    The timestamp is taken from the member document loaded for the request
+    anyway, and is refreshed with an atomic `$set` only if it's older than
+    `interval` seconds. The update is conditional, so several processes
+    serving the same member don't write it more than once per interval
+    either. The document isn't saved, so `User.pre_save` isn't triggered.
+    """
+
+    def __init__(self, user_model: type = User, interval: int = 300) -> None:
+        """
+        Constructor.
+
+        :param user_model: Active user model
+        :type user_model: type
+        :param interval: Minimal period between writes, in seconds
+        :type interval: int
+        """
+        assert interval >= 0, 'Interval must not be negative'
+
+        self._logger = logging.getLogger('vulyk.app')
+        self._user_model = user_model
+
+        self.interval = interval
+        self.writes = 0
+        self.skipped = 0
+
+    def touch(self, user: User) -> bool:
+        """
+        Notes that the member has been seen just now.
+
+        :param user: Member loaded for current request
+        :type user: User
+
+        :return: True if the timestamp has been written
+        :rtype: bool
+        """
+        now = self._now()
+        threshold = now - timedelta(seconds=self.interval)
+
+        if user.last_login is not None and user.last_login > threshold:
+            self.skipped += 1
+
+            return False
+
+        updated = self._user_model \
+            .objects(Q(id=user.id)
+                     & (Q(last_login__lte=threshold) | Q(last_login=None))) \
+            .update_one(set__last_login=now)  # type: int
+
+        self.writes += updated
+        user.last_login = now
+
+        self._logger.debug('Member %s was last seen at %s.', user.id, now)
+
+        return updated > 0
+
+    @staticmethod
+    def _now() -> datetime:
+        """
+        :return: Current time, in the same manner `last_login` is kept
+        :rtype: datetime
+        """
+        return datetime.now()
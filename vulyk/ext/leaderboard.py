@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
-from collections import defaultdict
-from operator import itemgetter
-from typing import List, Tuple, Dict, Union
+import threading
+import time
+from bisect import bisect_right
+from typing import List, Optional, Tuple, Dict, Type, Union
 
 from bson import ObjectId
+from mongoengine import signals
+from mongoengine.queryset import QuerySet
+from pymongo import DeleteMany, UpdateOne
 
+from vulyk.models.stats import LeaderboardScore
 from vulyk.models.tasks import AbstractAnswer
 from vulyk.models.user import User
 
@@ -14,10 +19,31 @@ __all__ = [
 
 
 class LeaderBoardManager:
+    """
+    Provides leaderboards basing on materialised scores of members.
+
+    Scores are incremented as soon as a new answer is saved and could be
+    rebuilt from answers should they go out of sync.
+
+    Ranks are dense, members having the same score share the position.
+    If `rank_staleness` is set, distinct scores are kept in memory and
+    reloaded once they get older than that many seconds, otherwise they
+    are counted on every lookup.
+
+    If `cache_ttl` is set, leaderboards are kept in memory for that many
+    seconds or until a new answer is saved.
+    """
+    # fields of members needed to render the leaderboard
+    user_fields = ['id', 'username']
+
     def __init__(self,
                  task_type_name: str,
                  answer_model: AbstractAnswer,
-                 user_model: type) -> None:
+                 user_model: type,
+                 score_model: Type[LeaderboardScore] = LeaderboardScore,
+                 rank_staleness: int = 0,
+                 cache_ttl: int = 0
+                 ) -> None:
         """
         :param task_type_name: Current task type name
         :type task_type_name: str
@@ -25,10 +51,44 @@ class LeaderBoardManager:
         :type answer_model: AbstractAnswer
         :param user_model: Active user model
         :type user_model: User
+        :param score_model: Model of materialised scores
+        :type score_model: Type[LeaderboardScore]
+        :param rank_staleness: How long cached distinct scores are used for
+                               rank lookups, in seconds. Zero disables cache.
+        :type rank_staleness: int
+        :param cache_ttl: How long leaderboards are cached, in seconds.
+                          Zero disables cache.
+        :type cache_ttl: int
         """
+        assert issubclass(score_model, LeaderboardScore), \
+            'You should define score model properly'
+
         self._task_type_name = task_type_name
         self._answer_model = answer_model
         self._user_model = user_model
+        self._score_model = score_model
+        self._rank_staleness = rank_staleness
+        self._distinct_scores = None  # type: Optional[List[int]]
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._cache_ttl = cache_ttl
+        self._cache = {}  # type: Dict[int, Tuple[float, List[Dict]]]
+
+        # connecting the same handler twice is a no-op
+        signals.post_save.connect(score_model.on_answer_saved,
+                                  sender=answer_model,
+                                  weak=False)
+
+        if cache_ttl > 0:
+            signals.post_save.connect(self.invalidate, sender=answer_model)
+
+    @property
+    def score_model(self) -> Type[LeaderboardScore]:
+        """
+        :return: Model of materialised scores
+        :rtype: Type[LeaderboardScore]
+        """
+        return self._score_model
 
     def get_leaders(self) -> List[Tuple[ObjectId, int]]:
         """Return sorted list of tuples (user_id, tasks_done)
@@ -36,11 +96,65 @@ class LeaderBoardManager:
         :returns: list of tuples (user_id, tasks_done)
         :rtype: List[Tuple[ObjectId, int]]
         """
-        scores = self._answer_model \
-            .objects(task_type=self._task_type_name) \
-            .item_frequencies('created_by')
+        return [
+            (doc['user'], doc['score'])
+            for doc in self.leaders_qs().only('user', 'score').as_pymongo()
+        ]
+
+    def get_rank(self, user_id: ObjectId) -> Dict[str, int]:
+        """
+        Finds the member's score and dense position among others.
 
-        return sorted(scores.items(), key=itemgetter(1), reverse=True)
+        :param user_id: ID of the member
+        :type user_id: ObjectId
+
+        :return: Dictionary with total finished tasks count and the position.
+                 Those who have no score share the position of the last
+                 member who has.
+        :rtype: Dict[str, int]
+        """
+        score = self._score_model \
+            .objects(task_type=self._task_type_name, user=user_id) \
+            .scalar('score') \
+            .first() or 0
+
+        if self._rank_staleness > 0:
+            scores = self._get_distinct_scores()
+            higher = len(scores) - bisect_right(scores, score)
+        else:
+            higher = len(self.leaders_qs()
+                         .filter(score__gt=score)
+                         .distinct('score'))
+
+        return {
+            'total': score,
+            'position': higher + 1 if score > 0 else higher
+        }
+
+    def _get_distinct_scores(self) -> List[int]:
+        """
+        :return: Cached distinct scores in ascending order, reloaded if stale
+        :rtype: List[int]
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            if self._distinct_scores is None \
+                    or now - self._loaded_at > self._rank_staleness:
+                self._distinct_scores = sorted(
+                    self.leaders_qs().distinct('score'))
+                self._loaded_at = now
+
+            return self._distinct_scores
+
+    def leaders_qs(self) -> QuerySet:
+        """
+        :return: Scores of members who contributed, the best ones go first
+        :rtype: QuerySet
+        """
+        return self._score_model \
+            .objects(task_type=self._task_type_name, score__gt=0) \
+            .order_by('-score')
 
     def get_leaderboard(self, limit: int) -> List[Dict[str, Union[User, int]]]:
         """Find users who contributed the most
@@ -51,18 +165,105 @@ class LeaderBoardManager:
         :returns: List of dicts {user: user_obj, freq: count}
         :rtype: List[Dict[str, Union[User, int]]]
         """
+        if self._cache_ttl > 0:
+            expires_at, result = self._cache.get(limit, (0, None))
+
+            if result is not None and expires_at > time.monotonic():
+                return result
+
         result = []
-        top = defaultdict(list)
+        scores = self._top_scores(limit)
+        ranks = {score: i + 1 for i, score in enumerate(scores)}
+        leaders = list(self.leaders_qs()
+                       .filter(score__gte=scores[-1])
+                       .only('user', 'score')
+                       .as_pymongo()) if scores else []
+        users = {
+            u.id: u
+            for u in self._user_model
+            .objects(id__in=[doc['user'] for doc in leaders])
+            .only(*self.user_fields)
+        }
 
-        [top[e[1]].append(e) for e in self.get_leaders() if len(top) < limit]
+        for doc in leaders:
+            if doc['user'] not in users:
+                continue
 
-        sorted_top = sorted(top.values(), key=lambda r: r[0][1], reverse=True)
+            result.append({
+                'rank': ranks[doc['score']],
+                'user': users[doc['user']],
+                'freq': doc['score']})
 
-        for i, el in enumerate(sorted_top):
-            for v in el:
-                result.append({
-                    'rank': i + 1,
-                    'user': self._user_model.objects.get(id=v[0]),
-                    'freq': v[1]})
+        if self._cache_ttl > 0:
+            self._cache[limit] = (time.monotonic() + self._cache_ttl, result)
 
         return result
+
+    def _top_scores(self, limit: int) -> List[int]:
+        """
+        Finds distinct scores of the first `limit` positions. Every score is
+        a single lookup over the index, right below the previous one, so
+        members sharing positions aren't read.
+
+        :param limit: Number of positions
+        :type limit: int
+
+        :return: Distinct scores, the best first
+        :rtype: List[int]
+        """
+        if self._rank_staleness > 0:
+            return self._get_distinct_scores()[::-1][:limit]
+
+        scores = []  # type: List[int]
+
+        while len(scores) < limit:
+            rs = self.leaders_qs()
+
+            if scores:
+                rs = rs.filter(score__lt=scores[-1])
+
+            score = rs.scalar('score').first()
+
+            if score is None:
+                break
+
+            scores.append(score)
+
+        return scores
+
+    def invalidate(self, *args, **kwargs) -> None:
+        """
+        Drops cached leaderboards. Called every time an answer is saved.
+        """
+        self._cache.clear()
+
+    def rebuild(self) -> int:
+        """
+        Recounts scores of all members from their answers.
+
+        :return: Number of members having scores
+        :rtype: int
+        """
+        created_by = self._answer_model._fields['created_by'].db_field
+        counts = {
+            doc['_id']: doc['score']
+            for doc in self._answer_model
+            .objects(task_type=self._task_type_name)
+            .aggregate(
+                {'$group': {'_id': '$' + created_by, 'score': {'$sum': 1}}})
+            if doc['_id'] is not None
+        }
+        scores = self._score_model.objects(task_type=self._task_type_name)
+        requests = [
+            UpdateOne(scores.filter(user=user_id)._query,
+                      {'$set': {'score': score,
+                                '_cls': self._score_model._class_name}},
+                      upsert=True)
+            for user_id, score in counts.items()
+        ]
+        requests.append(
+            DeleteMany(scores.filter(user__nin=list(counts.keys()))._query))
+
+        self._score_model._get_collection().bulk_write(requests)
+
+        return len(counts)
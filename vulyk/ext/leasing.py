@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Type, TypeVar
+
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError
+from mongoengine.queryset import QuerySet
+
+from vulyk.models.leases import TaskLease
+from vulyk.models.tasks import AbstractTask
+
+__all__ = [
+    'LeaseManager'
+]
+
+
+class LeaseManager:
+    """
+    This class is responsible for reservation of task slots.
+
+    Once a task is given to a member, one of its `redundancy` slots is leased
+    to the member for `ttl` seconds. The lease is released when the task is
+    done or skipped, otherwise it expires and is reclaimed later. Assignment
+    managers take active leases into account to avoid giving the same task to
+    more members than needed.
+
+    Leases are counted in `leases_count` of their tasks, so a slot is
+    reserved with a single conditional update of the task: answers and
+    leases together never exceed the redundancy, however many members ask
+    for tasks at once.
+
+    Could be overridden in plugins.
+    """
+    L = TypeVar('L', bound=TaskLease)
+
+    def __init__(self, lease_model: Type[L], ttl: int = 900) -> None:
+        """
+        Constructor.
+
+        :param lease_model: Underlying mongoDB Document subclass.
+        :type lease_model: Type
+        :param ttl: Lease lifetime in seconds
+        :type ttl: int
+        """
+        assert issubclass(lease_model, TaskLease), \
+            'You should define lease model properly'
+        assert ttl > 0, 'Lease lifetime must be positive'
+
+        self._logger = logging.getLogger('vulyk.app')
+
+        self.lease = lease_model
+        self.ttl = ttl
+
+    def acquire(
+        self,
+        task: AbstractTask,
+        user_id: ObjectId,
+        redundancy: Optional[int] = None
+    ) -> bool:
+        """
+        Reserves a slot in the task for the user or prolongs existing lease.
+        If the task has no free slots, those held by expired leases are
+        reclaimed first.
+
+        :param task: Given task
+        :type task: AbstractTask
+        :param user_id: ID of user, who gets the task
+        :type user_id: ObjectId
+        :param redundancy: Number of slots in the task, not limited if omitted
+        :type redundancy: Optional[int]
+
+        :return: True if the slot is reserved for the user
+        :rtype: bool
+        """
+        expires_at = self._now() + timedelta(seconds=self.ttl)
+
+        prolonged = self.lease \
+            .objects(task=task, user=user_id) \
+            .update_one(set__expires_at=expires_at)
+
+        if not prolonged:
+            reserved = self._reserve(task, redundancy)
+
+            if not reserved and self._reclaim(self.lease.objects(
+                    task=task, expires_at__lte=self._now())):
+                reserved = self._reserve(task, redundancy)
+
+            if not reserved:
+                self._logger.debug('Task %s has no free slots for user %s.',
+                                   task.id, user_id)
+
+                return False
+
+            try:
+                self.lease(task=task,
+                           user=user_id,
+                           task_type=task.task_type,
+                           expires_at=expires_at).save(force_insert=True)
+            except NotUniqueError:
+                # the same user has got the same task concurrently
+                self._free(task.id)
+
+        self._logger.debug('Task %s is leased to user %s for %s seconds.',
+                           task.id, user_id, self.ttl)
+
+        return True
+
+    def release(self, task: AbstractTask, user_id: ObjectId) -> None:
+        """
+        Frees the slot reserved for the user.
+
+        :param task: Given task
+        :type task: AbstractTask
+        :param user_id: ID of user, who finishes or skips the task
+        :type user_id: ObjectId
+        """
+        if self.lease.objects(task=task, user=user_id).delete():
+            self._free(task.id)
+
+    def active_leases(
+        self,
+        task_ids: List[str],
+        exclude_user: Optional[ObjectId] = None
+    ) -> Dict[str, int]:
+        """
+        Counts active leases for given tasks.
+
+        :param task_ids: IDs of tasks to check
+        :type task_ids: List[str]
+        :param exclude_user: Don't count leases of this user
+        :type exclude_user: Optional[ObjectId]
+
+        :return: Map of task ID to number of active leases. Tasks having no
+                 leases are omitted.
+        :rtype: Dict[str, int]
+        """
+        if not task_ids:
+            return {}
+
+        rs = self.active_leases_qs(task_ids, exclude_user)
+
+        return {
+            doc['_id']: doc['count']
+            for doc in rs.aggregate(
+                {'$group': {'_id': '$task', 'count': {'$sum': 1}}})
+        }
+
+    def active_leases_qs(
+        self,
+        task_ids: List[str],
+        exclude_user: Optional[ObjectId] = None
+    ) -> QuerySet:
+        """
+        :param task_ids: IDs of tasks to check
+        :type task_ids: List[str]
+        :param exclude_user: Don't count leases of this user
+        :type exclude_user: Optional[ObjectId]
+
+        :return: Active leases of given tasks
+        :rtype: QuerySet
+        """
+        rs = self.lease.objects(task__in=task_ids, expires_at__gt=self._now())
+
+        if exclude_user is not None:
+            rs = rs.filter(user__ne=exclude_user)
+
+        return rs
+
+    def active_leases_of_type(
+        self,
+        task_type: str,
+        exclude_user: Optional[ObjectId] = None
+    ) -> Dict[str, int]:
+        """
+        Counts active leases for all tasks of given task type.
+
+        :param task_type: Task type name
+        :type task_type: str
+        :param exclude_user: Don't count leases of this user
+        :type exclude_user: Optional[ObjectId]
+
+        :return: Map of task ID to number of active leases. Tasks having no
+                 leases are omitted.
+        :rtype: Dict[str, int]
+        """
+        rs = self.active_leases_of_type_qs(task_type, exclude_user)
+
+        return {
+            doc['_id']: doc['count']
+            for doc in rs.aggregate(
+                {'$group': {'_id': '$task', 'count': {'$sum': 1}}})
+        }
+
+    def active_leases_of_type_qs(
+        self,
+        task_type: str,
+        exclude_user: Optional[ObjectId] = None
+    ) -> QuerySet:
+        """
+        :param task_type: Task type name
+        :type task_type: str
+        :param exclude_user: Don't count leases of this user
+        :type exclude_user: Optional[ObjectId]
+
+        :return: Active leases of tasks of given task type
+        :rtype: QuerySet
+        """
+        rs = self.lease.objects(task_type=task_type,
+                                expires_at__gt=self._now())
+
+        if exclude_user is not None:
+            rs = rs.filter(user__ne=exclude_user)
+
+        return rs
+
+    def leased_to(self, user_id: ObjectId) -> List[str]:
+        """
+        :param user_id: ID of user
+        :type user_id: ObjectId
+
+        :return: IDs of tasks the user holds active leases on
+        :rtype: List[str]
+        """
+        return [
+            doc['task']
+            for doc in self.lease
+            .objects(user=user_id, expires_at__gt=self._now())
+            .only('task')
+            .as_pymongo()
+        ]
+
+    def reclaim_expired(self) -> int:
+        """
+        Removes all expired leases and frees slots they held.
+
+        :return: Number of removed leases
+        :rtype: int
+        """
+        removed = self._reclaim(
+            self.lease.objects(expires_at__lte=self._now()))
+
+        self._logger.debug('Reclaimed %s expired leases.', removed)
+
+        return removed
+
+    def _reserve(
+        self,
+        task: AbstractTask,
+        redundancy: Optional[int] = None
+    ) -> bool:
+        """
+        Takes a free slot in the task.
+
+        :param task: Given task
+        :type task: AbstractTask
+        :param redundancy: Number of slots in the task, not limited if omitted
+        :type redundancy: Optional[int]
+
+        :return: True if there was a free slot
+        :rtype: bool
+        """
+        tasks = type(task).objects(id=task.id)
+
+        if redundancy is not None:
+            tasks = tasks.filter(__raw__={'$expr': {'$lt': [
+                {'$add': [{'$ifNull': ['$usersCount', 0]},
+                          {'$ifNull': ['$leasesCount', 0]}]},
+                redundancy]}})
+
+        return tasks.update_one(inc__leases_count=1) > 0
+
+    def _free(self, task_id: str) -> None:
+        """
+        Gives the slot held by a removed lease back to the task.
+
+        :param task_id: ID of the task
+        :type task_id: str
+        """
+        AbstractTask \
+            .objects(id=task_id, leases_count__gt=0) \
+            .update_one(dec__leases_count=1)
+
+    def _reclaim(self, leases: QuerySet) -> int:
+        """
+        Removes expired leases one by one, so those prolonged meanwhile are
+        kept, and frees slots they held.
+
+        :param leases: Expired leases
+        :type leases: QuerySet
+
+        :return: Number of removed leases
+        :rtype: int
+        """
+        removed = 0
+
+        for doc in leases.only('id', 'task').as_pymongo():
+            if self.lease \
+                    .objects(id=doc['_id'], expires_at__lte=self._now()) \
+                    .delete():
+                self._free(doc['task'])
+                removed += 1
+
+        return removed
+
+    @staticmethod
+    def _now() -> datetime:
+        """
+        :return: Current UTC time, leases expire in it
+        :rtype: datetime
+        """
+        return datetime.utcnow()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains live progress metrics of task types and batches.
+
+Numbers come from counters kept up to date on every answer (`Batch` and
+`TaskTypeCounters`) and from answers given within the recent window, which
+are counted over the index on their creation time. Neither tasks nor
+answers are scanned, and the snapshot is cached for a few seconds, so
+metrics could be polled as often as monitoring likes.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from vulyk.models.task_types import AbstractTaskType
+from vulyk.models.tasks import Batch
+
+__all__ = [
+    'ProgressMetrics'
+]
+
+
+def _eta(remaining: float, per_second: float) -> Optional[int]:
+    """
+    :param remaining: Answers still needed
+    :type remaining: float
+    :param per_second: Answers given per second recently
+    :type per_second: float
+
+    :return: Seconds to completion at the recent pace, None if nothing is
+             being done
+    :rtype: Optional[int]
+    """
+    if remaining <= 0:
+        return 0
+
+    return int(remaining / per_second) if per_second > 0 else None
+
+
+def _labels(**labels: Any) -> str:
+    """
+    :return: Prometheus labels with escaped values
+    :rtype: str
+    """
+    return ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\')
+                         .replace('"', '\\"')
+                         .replace('\n', '\\n'))
+        for k, v in sorted(labels.items()))
+
+
+class ProgressMetrics:
+    """
+    Per-process cache of progress of task types and their batches.
+    """
+
+    def __init__(
+        self,
+        task_types: Iterable[AbstractTaskType],
+        window: int = 900,
+        ttl: int = 5
+    ) -> None:
+        """
+        :param task_types: Task types to watch
+        :type task_types: Iterable[AbstractTaskType]
+        :param window: Answers given within that many last seconds make up
+                       the pace
+        :type window: int
+        :param ttl: For how long the snapshot is cached, in seconds
+        :type ttl: int
+        """
+        self.window = window
+        self.ttl = ttl
+        self._task_types = list(task_types)
+        self._snapshot = None  # type: Optional[Dict[str, Any]]
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        :return: Progress of task types and batches by their names
+        :rtype: Dict[str, Any]
+        """
+        with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._expires_at:
+                self._snapshot = self._collect()
+                self._expires_at = time.monotonic() + self.ttl
+
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        """
+        Drops the snapshot, so numbers are read anew upon the next call.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def _collect(self) -> Dict[str, Any]:
+        """
+        Reads counters and counts recent answers.
+
+        :rtype: Dict[str, Any]
+        """
+        now = datetime.now()
+        since = now - timedelta(seconds=self.window)
+        task_types = {}
+        batches = {}
+        paces = {}
+        by_name = {t.type_name: t for t in self._task_types}
+
+        for name, task_type in by_name.items():
+            counters = task_type.get_counters()
+            recent = task_type.answer_model.objects(
+                created_at__gt=since, created_at__lte=now).count()
+            per_second = paces[name] = recent / self.window
+
+            task_types[name] = {
+                'tasks': counters.total,
+                'closed': counters.closed,
+                'open': counters.open,
+                'answers_per_minute': round(per_second * 60, 2),
+                'eta_seconds': _eta(counters.open * task_type.redundancy,
+                                    per_second)
+            }
+
+        for batch in Batch.objects(task_type__in=list(by_name)) \
+                .only('id', 'task_type', 'tasks_count', 'tasks_processed',
+                      'closed') \
+                .order_by('id'):
+            task_type = by_name[batch.task_type]
+            remaining = batch.tasks_count - batch.tasks_processed
+
+            batches[batch.id] = {
+                'task_type': batch.task_type,
+                'tasks': batch.tasks_count,
+                'processed': batch.tasks_processed,
+                'closed': batch.closed,
+                'percent': round(
+                    100.0 * batch.tasks_processed / (batch.tasks_count or 1),
+                    2),
+                # as if the batch got all answers of its task type
+                'eta_seconds': None if batch.closed else _eta(
+                    remaining * task_type.redundancy, paces[batch.task_type])
+            }
+
+        return {
+            'generated_at': now.isoformat(),
+            'window_seconds': self.window,
+            'task_types': task_types,
+            'batches': batches
+        }
+
+    def prometheus(self) -> str:
+        """
+        :return: Snapshot in the text exposition format of Prometheus
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = []  # type: List[str]
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP vulyk_{} {}'.format(name, help_text))
+            lines.append('# TYPE vulyk_{} {}'.format(name, kind))
+            lines.extend('vulyk_{}{{{}}} {}'.format(name, _labels(**labels),
+                                                    value)
+                         for labels, value in samples if value is not None)
+
+        types = sorted(snapshot['task_types'].items())
+        batches = sorted(snapshot['batches'].items())
+
+        metric('tasks', 'gauge', 'Number of tasks by state.',
+               [({'task_type': name, 'state': state}, t[state])
+                for name, t in types for state in ('open', 'closed')])
+        metric('answers_per_minute', 'gauge',
+               'Answers given per minute within the recent window.',
+               [({'task_type': name}, t['answers_per_minute'])
+                for name, t in types])
+        metric('eta_seconds', 'gauge',
+               'Seconds to completion of the task type at the recent pace.',
+               [({'task_type': name}, t['eta_seconds']) for name, t in types])
+        metric('batch_tasks', 'gauge', 'Number of tasks in the batch.',
+               [({'batch': b_id, 'task_type': b['task_type']}, b['tasks'])
+                for b_id, b in batches])
+        metric('batch_processed_tasks', 'gauge',
+               'Number of completed tasks in the batch.',
+               [({'batch': b_id, 'task_type': b['task_type']}, b['processed'])
+                for b_id, b in batches])
+        metric('batch_eta_seconds', 'gauge',
+               'Seconds to completion of the batch at the recent pace.',
+               [({'batch': b_id, 'task_type': b['task_type']},
+                 b['eta_seconds']) for b_id, b in batches])
+
+        return '\n'.join(lines) + '\n'
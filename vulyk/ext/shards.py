@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains the orchestrator that exports answers of many task types
+and batches at once.
+
+Every pair of a task type and a batch is a partition written into its own
+shard by a pool of processes, each process has its own connection to the
+database. The manifest lists shards with numbers of tasks and answers and
+checksums of files, so a consumer could check nothing is missing.
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from mongoengine.connection import connect, disconnect_all
+
+from vulyk.ext.export import export_to
+from vulyk.models.task_types import AbstractTaskType
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+__all__ = [
+    'MANIFEST',
+    'ShardedExport'
+]
+
+MANIFEST = 'manifest.json'
+
+# Task types instantiated by the worker process, by class
+_task_types = {}  # type: Dict[type, AbstractTaskType]
+
+
+def _connect(connection: Dict[str, Any]) -> None:
+    """
+    Opens the default connection of the worker process.
+
+    :param connection: Settings of the connection (`MONGODB_SETTINGS`)
+    :type connection: Dict[str, Any]
+    """
+    disconnect_all()
+    connect(**{k.lower(): v for k, v in connection.items()
+               if v is not None})
+
+
+def _checksum(path: str) -> str:
+    """
+    :param path: Path to the file
+    :type path: str
+
+    :return: SHA-256 hex digest of the file
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _export_shard(
+    task_type: AbstractTaskType,
+    batch: Optional[str],
+    path: str,
+    closed: bool
+) -> Dict[str, Any]:
+    """
+    Writes answers of the single partition into its shard.
+
+    :param task_type: Task type to export
+    :type task_type: AbstractTaskType
+    :param batch: Batch ID, None stands for tasks out of batches
+    :type batch: Optional[str]
+    :param path: Path to the shard
+    :type path: str
+    :param closed: Export only answers to closed tasks
+    :type closed: bool
+
+    :return: Entry of the manifest
+    :rtype: Dict[str, Any]
+    """
+    stats = export_to(path, task_type.export_reports(batch, closed))
+
+    return {
+        'task_type': task_type.type_name,
+        'batch': batch,
+        'path': os.path.basename(path),
+        'tasks': stats.tasks,
+        'answers': stats.answers,
+        'bytes': os.path.getsize(path),
+        'sha256': _checksum(path),
+        'seconds': round(stats.elapsed, 3)
+    }
+
+
+def _run_job(job: Tuple) -> Dict[str, Any]:
+    """
+    Exports the partition in a worker process. Task types can't be pickled,
+    so they are instantiated from their classes and settings once per
+    process.
+
+    :param job: Class and settings of the task type, batch, path and
+                whether to export only answers to closed tasks
+    :type job: Tuple
+
+    :return: Entry of the manifest
+    :rtype: Dict[str, Any]
+    """
+    task_type_class, settings, batch, path, closed = job
+
+    if task_type_class not in _task_types:
+        _task_types[task_type_class] = task_type_class(settings)
+
+    return _export_shard(_task_types[task_type_class], batch, path, closed)
+
+
+class ShardedExport:
+    """
+    Exports answers of task types partitioned by batches in parallel.
+    """
+
+    def __init__(
+        self,
+        task_types: Iterable[AbstractTaskType],
+        connection: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None
+    ) -> None:
+        """
+        :param task_types: Task types to export
+        :type task_types: Iterable[AbstractTaskType]
+        :param connection: Settings of the connection for worker processes
+        :type connection: Optional[Dict[str, Any]]
+        :param workers: Number of processes, CPU count by default, 0 exports
+                        everything in the current process
+        :type workers: Optional[int]
+        """
+        self._task_types = list(task_types)
+        self._connection = connection or {}
+        self._workers = (os.cpu_count() or 1) if workers is None else workers
+
+        assert self._workers >= 0, 'Number of workers can not be negative'
+
+    def partitions(
+        self,
+        batches: Optional[Iterable[str]] = None,
+        closed: bool = True
+    ) -> List[Tuple[AbstractTaskType, Optional[str], int]]:
+        """
+        Lists partitions, the largest ones go first so none of them is left
+        to the end of the run alone.
+
+        :param batches: Export only these batches, all by default
+        :type batches: Optional[Iterable[str]]
+        :param closed: Count only closed tasks
+        :type closed: bool
+
+        :return: Task types, batch IDs and numbers of tasks
+        :rtype: List[Tuple[AbstractTaskType, Optional[str], int]]
+        """
+        wanted = None if batches is None else set(batches)
+        result = []
+
+        for task_type in self._task_types:
+            qs = task_type.task_model.objects(task_type=task_type.type_name)
+
+            if closed:
+                qs = qs.filter(closed=True)
+
+            for group in qs.aggregate(
+                    [{'$group': {'_id': '$batch', 'tasks': {'$sum': 1}}}]):
+                if wanted is None or group['_id'] in wanted:
+                    result.append((task_type, group['_id'], group['tasks']))
+
+        return sorted(result,
+                      key=lambda p: (-p[2], p[0].type_name, p[1] or ''))
+
+    def run(
+        self,
+        folder: str,
+        suffix: str = '.jsonl',
+        batches: Optional[Iterable[str]] = None,
+        closed: bool = True,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Writes shards and the manifest into the folder.
+
+        :param folder: Existing folder to write into
+        :type folder: str
+        :param suffix: Extension of shards, sets the format and compression
+        :type suffix: str
+        :param batches: Export only these batches, all by default
+        :type batches: Optional[Iterable[str]]
+        :param closed: Export only answers to closed tasks
+        :type closed: bool
+        :param progress: Callback invoked with every written shard
+        :type progress: Optional[Callable[[Dict[str, Any]], None]]
+
+        :return: Manifest
+        :rtype: Dict[str, Any]
+        """
+        started = time.perf_counter()
+        jobs = [
+            (task_type, batch,
+             os.path.join(folder, self._shard_name(task_type, batch, suffix)))
+            for task_type, batch, _ in self.partitions(batches, closed)]
+        shards = []
+
+        for shard in self._map(jobs, closed):
+            shards.append(shard)
+
+            if progress is not None:
+                progress(shard)
+
+        shards.sort(key=lambda s: s['path'])
+        manifest = {
+            'created_at': datetime.utcnow().isoformat(),
+            'closed_only': closed,
+            'tasks': sum(s['tasks'] for s in shards),
+            'answers': sum(s['answers'] for s in shards),
+            'seconds': round(time.perf_counter() - started, 3),
+            'shards': shards
+        }
+
+        with open(os.path.join(folder, MANIFEST), 'w') as f:
+            f.write(json.dumps(manifest, indent=2))
+
+        return manifest
+
+    def _map(
+        self,
+        jobs: List[Tuple[AbstractTaskType, Optional[str], str]],
+        closed: bool
+    ) -> Iterable[Dict[str, Any]]:
+        """
+        Runs jobs in the pool yielding results as they're done.
+
+        :param jobs: Task types, batch IDs and paths to shards
+        :type jobs: List[Tuple[AbstractTaskType, Optional[str], str]]
+        :param closed: Export only answers to closed tasks
+        :type closed: bool
+
+        :rtype: Iterable[Dict[str, Any]]
+        """
+        if not self._workers:
+            for task_type, batch, path in jobs:
+                yield _export_shard(task_type, batch, path, closed)
+
+            return
+
+        # Forked copies of the client aren't safe, so workers start afresh
+        with multiprocessing.get_context('spawn').Pool(
+                min(self._workers, len(jobs) or 1),
+                initializer=_connect,
+                initargs=(self._connection,)) as pool:
+            yield from pool.imap_unordered(
+                _run_job,
+                [(type(task_type), task_type.settings, batch, path, closed)
+                 for task_type, batch, path in jobs])
+
+    @staticmethod
+    def _shard_name(
+        task_type: AbstractTaskType,
+        batch: Optional[str],
+        suffix: str
+    ) -> str:
+        """
+        :return: File name of the shard safe for any file system
+        :rtype: str
+        """
+        return re.sub(r'[^\w.-]', '_', '{}-{}'.format(
+            task_type.type_name, '_none_' if batch is None else batch)) \
+            + suffix
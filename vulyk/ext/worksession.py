@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
+import atexit
 import logging
+import math
+import threading
+import time
 from datetime import datetime
-from typing import TypeVar, Type
+from typing import (
+    AnyStr,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Type,
+    Union
+)
 
 from bson import ObjectId
 from mongoengine.errors import OperationError
+from mongoengine.queryset import QuerySet
 
+from vulyk.ext.leasing import LeaseManager
 from vulyk.models.exc import WorkSessionLookUpError, WorkSessionUpdateError
 from vulyk.models.stats import WorkSession
 from vulyk.models.tasks import AbstractTask, AbstractAnswer
@@ -16,6 +31,27 @@ __all__ = [
 ]
 
 
+class _Heartbeat:
+    """
+    Activity of a member on a task, which is known to the process but not
+    yet written to the session.
+    """
+    __slots__ = ('session_id', 'start_time', 'activity', 'pending',
+                 'pending_since', 'seen_at')
+
+    def __init__(self, session: WorkSession) -> None:
+        """
+        :param session: Session as it is stored
+        :type session: WorkSession
+        """
+        self.session_id = session.id
+        self.start_time = session.start_time
+        # the stored value as of the last read or write of this process
+        self.activity = session.activity
+        self.pending = 0
+        self.pending_since = self.seen_at = time.monotonic()
+
+
 class WorkSessionManager:
     """
     This class is responsible for accounting of work-sessions.
@@ -25,30 +61,62 @@ class WorkSessionManager:
     timestamp of the event.
     Thus we're able to perform any kind of data mining and stats counting using
     the data later.
+    If a lease manager is given, the task slot is reserved for the member
+    while the session is open.
+    Starting a session gives its ID, a handle which clients send back to
+    close or delete the session by ID; clients which don't send it get the
+    latest session of theirs on the task.
+    Activity heartbeats could be accumulated in memory and written with a
+    single increment once per `flush_interval` seconds; the session is
+    always brought up to date before it is closed.
 
     Could be overridden in plugins.
     """
     U = TypeVar('U', bound=WorkSession)
+    # sessions getting no heartbeats for that many seconds are forgotten
+    IDLE_TIMEOUT = 600
 
-    def __init__(self, work_session_model: Type[U]) -> None:
+    def __init__(
+        self,
+        work_session_model: Type[U],
+        lease_manager: Optional[LeaseManager] = None,
+        flush_interval: int = 0
+    ) -> None:
         """
         Constructor.
 
         :param work_session_model: Underlying mongoDB Document subclass.
         :type work_session_model: Type
+        :param lease_manager: Manager to reserve task slots with (optional)
+        :type lease_manager: Optional[LeaseManager]
+        :param flush_interval: For how many seconds activity may be kept in
+                               memory, 0 writes every heartbeat right away
+        :type flush_interval: int
         """
         assert issubclass(work_session_model, WorkSession), \
             'You should define working session model properly'
+        assert lease_manager is None \
+            or isinstance(lease_manager, LeaseManager), \
+            'You should define lease manager properly'
 
         self._logger = logging.getLogger('vulyk.app')
 
         self.work_session = work_session_model
+        self.lease_manager = lease_manager
+        self.flush_interval = flush_interval
+
+        self._heartbeats = {}  # type: Dict[Tuple[str, str], _Heartbeat]
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+        if flush_interval > 0:
+            atexit.register(self.flush)
 
     def start_work_session(
         self,
         task: AbstractTask,
         user_id: ObjectId
-    ) -> None:
+    ) -> ObjectId:
         """
         Starts new WorkSession for given user.
         By default we use `datetime.now` in the underlying model to save in
@@ -62,15 +130,24 @@ class WorkSessionManager:
         :param user_id: ID of user, who gets new task
         :type user_id: ObjectId
 
+        :return: Session handle
+        :rtype: ObjectId
+
         :raises:
             WorkSessionUpdateError -- can not start a session
         """
+        # whatever was accumulated belongs to the session being overwritten
+        self._drop_heartbeat(task, user_id)
+        session_id = ObjectId()
+
         try:
             existing = self.work_session \
                 .objects(user=user_id,
                          task=task,
                          task_type=task.task_type) \
+                .only('id') \
                 .modify(upsert=True,
+                        set_on_insert__id=session_id,
                         set__start_time=datetime.now(),
                         set__activity=0)
 
@@ -78,10 +155,16 @@ class WorkSessionManager:
                 self._logger.debug(
                     'Overwriting existing unfinished session for user %s and '
                     'task %s.', user_id, task.id)
+                session_id = existing.id
+
+            if self.lease_manager is not None:
+                self.lease_manager.acquire(task, user_id)
         except OperationError as err:
             msg = 'Can not create a session: {}.'.format(err)
             raise WorkSessionUpdateError(msg)
 
+        return session_id
+
     def record_activity(
         self,
         task: AbstractTask,
@@ -104,33 +187,61 @@ class WorkSessionManager:
             WorkSessionLookUpError -- session is not found;
             WorkSessionUpdateError -- can not update the session
         """
-        try:
-            session = self.work_session \
-                .objects.get(user=user_id,
-                             task=task)
-            duration = datetime.now() - session.start_time
+        key = self._key(task, user_id)
 
-            if duration.total_seconds() > seconds + session.activity > 0:
-                session.activity += seconds
-                session.save()
+        # the heartbeat is taken out of the buffer while being worked on, so
+        # the lock isn't held during round trips to the DB
+        with self._lock:
+            cached = self._heartbeats.pop(key, None)
+            idle = self._take_idle()
 
-                self._logger.debug(
-                    'Added %s seconds of activities for user %s and task %s.',
-                    seconds, user_id, task.id)
-            else:
-                msg = 'Can not update the session {} for user {}. Value: {}.' \
-                    .format(session.id, user_id, seconds)
-                raise WorkSessionUpdateError(msg)
-        except self.work_session.DoesNotExist:
-            msg = 'Did not found a session for user {} and task {}.'.format(
-                user_id, task.id)
-            raise WorkSessionLookUpError(msg)
+        for stale in idle:
+            self._flush_heartbeat(stale)
+
+        beat = cached or self._read_heartbeat(task, user_id)
+        accepted = self._add_activity(beat, seconds)
+
+        if not accepted and cached is not None:
+            # the session could have been restarted or updated by another
+            # process since it was read
+            beat = self._read_heartbeat(task, user_id, cached)
+            accepted = self._add_activity(beat, seconds)
+
+            if not accepted and beat.pending \
+                    and not self._add_activity(beat, 0):
+                # activity kept so far doesn't fit the session either
+                self._logger.warning(
+                    'Dropped %s seconds of activities for user %s and '
+                    'task %s.', beat.pending, user_id, task.id)
+                beat.pending = 0
+
+        self._put_heartbeat(key, beat)
+
+        if not accepted:
+            msg = 'Can not update the session {} for user {}. Value: {}.' \
+                .format(beat.session_id, user_id, seconds)
+            raise WorkSessionUpdateError(msg)
+
+        self._logger.debug(
+            'Added %s seconds of activities for user %s and task %s.',
+            seconds, user_id, task.id)
+
+    def flush(self) -> None:
+        """
+        Writes all accumulated activity down to sessions.
+        """
+        with self._lock:
+            beats, self._heartbeats = self._heartbeats, {}
+
+        for beat in beats.values():
+            self._flush_heartbeat(beat)
 
     def end_work_session(
         self,
         task: AbstractTask,
         user_id: ObjectId,
-        answer: AbstractAnswer
+        answer: AbstractAnswer,
+        session_id: Optional[Union[AnyStr, ObjectId]] = None
     ) -> None:
         """
         Ends given WorkSession for given user.
@@ -143,34 +254,41 @@ class WorkSessionManager:
         :type user_id: ObjectId
         :param answer: Given answer
         :type answer: AbstractAnswer
+        :param session_id: Session handle (optional)
+        :type session_id: Optional[Union[AnyStr, ObjectId]]
 
         :raises:
             WorkSessionLookUpError -- session is not found;
             WorkSessionUpdateError -- can not close the session
         """
-        # TODO: store id of active session in cookies or elsewhere
-        try:
-            rs = self.work_session \
-                .objects(user=user_id, task=task) \
-                .order_by('-start_time')
+        beat = self._drop_heartbeat(task, user_id)
 
-            if rs.count() > 0:
-                rs.first().update(
-                    set__end_time=datetime.now(),
-                    set__answer=answer)
+        if beat is not None:
+            self._flush_heartbeat(beat)
 
-                on_task_done.send(self, answer=answer)
-            else:
+        try:
+            # the session is found and closed in a single round trip
+            session = self._sessions(task, user_id, session_id) \
+                .only('id') \
+                .modify(set__end_time=datetime.now(), set__answer=answer)
+
+            if session is None:
                 msg = 'No session was found for {0}'.format(answer)
 
                 raise WorkSessionLookUpError(msg)
+
+            if self.lease_manager is not None:
+                self.lease_manager.release(task, user_id)
+
+            on_task_done.send(self, answer=answer)
         except OperationError as e:
             raise WorkSessionUpdateError(e)
 
     def delete_work_session(
         self,
         task: AbstractTask,
-        user_id: ObjectId
+        user_id: ObjectId,
+        session_id: Optional[Union[AnyStr, ObjectId]] = None
     ) -> None:
         """
         Deletes current WorkSession if skipped.
@@ -179,22 +297,226 @@ class WorkSessionManager:
         :type task: AbstractTask
         :param user_id: ID of user, who skips a task
         :type user_id: ObjectId
+        :param session_id: Session handle (optional)
+        :type session_id: Optional[Union[AnyStr, ObjectId]]
 
         :raises:
             WorkSessionLookUpError -- session is not found;
             WorkSessionUpdateError -- can not delete the session
         """
+        self._drop_heartbeat(task, user_id)
+
         try:
-            rs = self.work_session \
-                .objects(user=user_id, task=task) \
-                .order_by('-start_time')
+            session = self._sessions(task, user_id, session_id) \
+                .only('id') \
+                .modify(remove=True)
 
-            if rs.count() > 0:
-                rs.first().delete()
-            else:
+            if session is None:
                 msg = 'No session was found for {0} & {1}'.format(
                     user_id, task.id)
 
                 raise WorkSessionLookUpError(msg)
+
+            if self.lease_manager is not None:
+                self.lease_manager.release(task, user_id)
         except OperationError as e:
             raise WorkSessionUpdateError(e)
+
+    def _sessions(
+        self,
+        task: AbstractTask,
+        user_id: ObjectId,
+        session_id: Optional[Union[AnyStr, ObjectId]] = None
+    ) -> QuerySet:
+        """
+        :param task: Given task
+        :type task: AbstractTask
+        :param user_id: ID of current user
+        :type user_id: ObjectId
+        :param session_id: Session handle (optional)
+        :type session_id: Optional[Union[AnyStr, ObjectId]]
+
+        :return: The session given by its handle, or sessions of the user on
+                 the task, the latest first, if the handle is missing
+        :rtype: QuerySet
+        """
+        if session_id is not None and ObjectId.is_valid(session_id):
+            return self.work_session.objects(id=session_id,
+                                             user=user_id,
+                                             task=task)
+
+        return self.work_session \
+            .objects(user=user_id, task=task) \
+            .order_by('-start_time')
+
+    @staticmethod
+    def _key(task: AbstractTask, user_id: ObjectId) -> Tuple[str, str]:
+        return str(user_id), str(task.id)
+
+    def _read_heartbeat(
+        self,
+        task: AbstractTask,
+        user_id: ObjectId,
+        stale: Optional[_Heartbeat] = None
+    ) -> _Heartbeat:
+        """
+        Reads the session to accumulate activity against.
+
+        :param task: The task the session belongs to
+        :type task: AbstractTask
+        :param user_id: ID of current user
+        :type user_id: ObjectId
+        :param stale: Heartbeat read before, its pending activity is kept if
+                      the session wasn't restarted since (optional)
+        :type stale: Optional[_Heartbeat]
+
+        :rtype: _Heartbeat
+
+        :raises:
+            WorkSessionLookUpError -- session is not found
+        """
+        try:
+            beat = _Heartbeat(
+                self.work_session
+                    .objects(user=user_id, task=task)
+                    .only('id', 'start_time', 'activity')
+                    .get())
+        except self.work_session.DoesNotExist:
+            msg = 'Did not found a session for user {} and task {}.'.format(
+                user_id, task.id)
+            raise WorkSessionLookUpError(msg)
+
+        if stale is not None and stale.start_time == beat.start_time:
+            beat.pending = stale.pending
+            beat.pending_since = stale.pending_since
+
+        return beat
+
+    def _add_activity(self, beat: _Heartbeat, seconds: int) -> bool:
+        """
+        Accumulates activity unless the session would get more of it than
+        time passed since its start. Flushes it if it's been kept for long.
+
+        :param beat: Heartbeat of the session
+        :type beat: _Heartbeat
+        :param seconds: User was active for
+        :type seconds: int
+
+        :return: True if the activity is accepted
+        :rtype: bool
+        """
+        duration = datetime.now() - beat.start_time
+
+        if not duration.total_seconds() > \
+                seconds + beat.activity + beat.pending > 0:
+            return False
+
+        beat.seen_at = time.monotonic()
+
+        if not beat.pending:
+            beat.pending_since = beat.seen_at
+
+        beat.pending += seconds
+
+        if beat.seen_at - beat.pending_since >= self.flush_interval \
+                and not self._flush_heartbeat(beat, warn=False):
+            beat.pending -= seconds
+
+            return False
+
+        return True
+
+    def _flush_heartbeat(self, beat: _Heartbeat, warn: bool = True) -> bool:
+        """
+        Increments activity of the session by accumulated seconds, provided
+        the session is the same and still gets no more activity than time
+        passed since its start.
+
+        :param beat: Heartbeat of the session
+        :type beat: _Heartbeat
+        :param warn: Log activity that couldn't be written
+        :type warn: bool
+
+        :return: False if the session wasn't updated
+        :rtype: bool
+        """
+        if not beat.pending:
+            return True
+
+        duration = datetime.now() - beat.start_time
+        limit = math.ceil(duration.total_seconds() - beat.pending)
+        session = self.work_session \
+            .objects(id=beat.session_id,
+                     start_time=beat.start_time,
+                     activity__lt=limit) \
+            .only('activity') \
+            .modify(inc__activity=beat.pending, new=True)
+
+        if session is None:
+            if warn:
+                self._logger.warning(
+                    'Dropped %s seconds of activities in the session %s.',
+                    beat.pending, beat.session_id)
+
+            return False
+
+        beat.activity = session.activity
+        beat.pending = 0
+
+        return True
+
+    def _drop_heartbeat(
+        self,
+        task: AbstractTask,
+        user_id: ObjectId
+    ) -> Optional[_Heartbeat]:
+        """
+        :return: Heartbeat of the session, if the process keeps one
+        :rtype: Optional[_Heartbeat]
+        """
+        with self._lock:
+            return self._heartbeats.pop(self._key(task, user_id), None)
+
+    def _put_heartbeat(self, key: Tuple[str, str], beat: _Heartbeat) -> None:
+        """
+        Puts the heartbeat back to the buffer. Activity of the same session
+        buffered by a concurrent request meanwhile is added up.
+
+        :param key: User and task IDs
+        :type key: Tuple[str, str]
+        :param beat: Heartbeat of the session
+        :type beat: _Heartbeat
+        """
+        with self._lock:
+            other = self._heartbeats.get(key)
+
+            if other is not None and other.start_time == beat.start_time:
+                beat.activity = max(beat.activity, other.activity)
+                beat.pending += other.pending
+
+                if other.pending:
+                    beat.pending_since = min(beat.pending_since,
+                                             other.pending_since)
+
+            self._heartbeats[key] = beat
+
+    def _take_idle(self) -> List[_Heartbeat]:
+        """
+        Takes heartbeats of idle sessions out of the buffer, so sessions which
+        are never closed don't pile up in memory. Must be called having the
+        buffer locked, the activity is to be flushed afterwards.
+
+        :return: Heartbeats to flush
+        :rtype: List[_Heartbeat]
+        """
+        now = time.monotonic()
+        idle = max(self.flush_interval, self.IDLE_TIMEOUT)
+
+        if now - self._swept_at < idle:
+            return []
+
+        self._swept_at = now
+
+        return [self._heartbeats.pop(key)
+                for key, beat in list(self._heartbeats.items())
+                if now - beat.seen_at >= idle]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains models of watermarks that let answers be exported
+incrementally.
+"""
+from datetime import datetime
+
+from flask_mongoengine import Document
+from mongoengine import (
+    DateTimeField,
+    IntField,
+    ListField,
+    ObjectIdField,
+    StringField
+)
+
+__all__ = [
+    'ExportCheckpoint'
+]
+
+
+class ExportCheckpoint(Document):
+    """
+    Named watermark of the incremental export: `watermark` is the latest
+    `AbstractAnswer.created_at` (local time) exported so far. Answers given
+    a bit earlier are read again next time, as they could have been stored
+    later; `recent` keeps IDs of those exported already.
+    """
+    name = StringField(max_length=50, required=True)
+    task_type = StringField(max_length=50, required=True, db_field='taskType')
+    batch = StringField(max_length=50, required=True)
+    watermark = DateTimeField()
+    recent = ListField(ObjectIdField())
+    exported = IntField(default=0)
+    updated_at = DateTimeField(default=datetime.utcnow, db_field='updatedAt')
+
+    meta = {
+        'collection': 'export_checkpoints',
+        'allow_inheritance': True,
+        'indexes': [
+            {
+                'fields': ['name', 'task_type', 'batch'],
+                'unique': True
+            }
+        ]
+    }
+
+    def __str__(self) -> str:
+        return str(self.pk)
+
+    def __repr__(self) -> str:
+        return 'ExportCheckpoint [{} {} {}: {}, {} answers]'.format(
+            self.name, self.task_type, self.batch, self.watermark,
+            self.exported)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains models of the journal that lets interrupted imports of tasks
+be resumed.
+"""
+from datetime import datetime
+
+from flask_mongoengine import Document
+from mongoengine import (
+    BooleanField,
+    DateTimeField,
+    IntField,
+    LongField,
+    StringField
+)
+
+__all__ = [
+    'ImportCheckpoint'
+]
+
+
+class ImportCheckpoint(Document):
+    """
+    Progress of loading a single file into the batch. Everything before
+    `offset` (bytes of decompressed input) has been stored, `inserted` counts
+    tasks stored by all attempts, but those stored right before an
+    interruption.
+    """
+    task_type = StringField(max_length=50, required=True, db_field='taskType')
+    batch = StringField(max_length=50, null=True)
+    path = StringField(required=True)
+    offset = LongField(default=0)
+    line = IntField(default=0)
+    inserted = IntField(default=0)
+    finished = BooleanField(default=False)
+    updated_at = DateTimeField(default=datetime.utcnow, db_field='updatedAt')
+
+    meta = {
+        'collection': 'import_checkpoints',
+        'allow_inheritance': True,
+        'indexes': [
+            {
+                'fields': ['task_type', 'batch', 'path'],
+                'unique': True
+            }
+        ]
+    }
+
+    def __str__(self) -> str:
+        return str(self.pk)
+
+    def __repr__(self) -> str:
+        return 'ImportCheckpoint [{} {} {}: line {}, {} inserted]'.format(
+            self.task_type, self.batch, self.path, self.line, self.inserted)
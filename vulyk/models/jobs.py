@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains models of the durable queue of deferred signal listeners.
+"""
+from datetime import datetime
+
+from flask_mongoengine import Document
+from mongoengine import (
+    DateTimeField,
+    DictField,
+    IntField,
+    StringField
+)
+
+__all__ = [
+    'DeferredJob',
+    'JOB_FAILED',
+    'JOB_PENDING',
+    'JOB_RUNNING'
+]
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_FAILED = 'failed'
+
+
+class DeferredJob(Document):
+    """
+    A single call of a deferred listener. Jobs sharing the same key are run
+    in order of their IDs; jobs without a key wait for all earlier ones.
+    Done jobs are removed, failed ones are kept for investigation.
+    """
+    listener = StringField(required=True)
+    key = StringField(null=True)
+    payload = DictField()
+    state = StringField(choices=(JOB_PENDING, JOB_RUNNING, JOB_FAILED),
+                        default=JOB_PENDING)
+    attempts = IntField(default=0)
+    available_at = DateTimeField(default=datetime.utcnow,
+                                 db_field='availableAt')
+    locked_until = DateTimeField(db_field='lockedUntil')
+    error = StringField()
+
+    meta = {
+        'collection': 'deferred_jobs',
+        'allow_inheritance': True,
+        'indexes': [
+            ('state', 'id'),
+            ('key', 'state', 'id')
+        ]
+    }
+
+    def __str__(self) -> str:
+        return str(self.pk)
+
+    def __repr__(self) -> str:
+        return 'DeferredJob [{} {} ({})]'.format(
+            self.listener, self.key, self.state)
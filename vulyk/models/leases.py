@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Module contains models used to reserve tasks for members for a while.
+"""
+from flask_mongoengine import Document
+from mongoengine import (
+    CASCADE,
+    DateTimeField,
+    ReferenceField,
+    StringField
+)
+
+from vulyk.models.tasks import AbstractTask
+from vulyk.models.user import User
+
+__all__ = [
+    'TaskLease'
+]
+
+
+class TaskLease(Document):
+    """
+    Reservation of a single slot in the task for the member. It stays active
+    until it either expires or is released once the task is done or skipped.
+
+    Every lease is accounted in `leases_count` of its task, so expired leases
+    are reclaimed by the application rather than by a TTL index, which would
+    leave the counter behind.
+    """
+    task = ReferenceField(AbstractTask, reverse_delete_rule=CASCADE,
+                          required=True)
+    user = ReferenceField(User, reverse_delete_rule=CASCADE, required=True)
+    task_type = StringField(max_length=50, required=True, db_field='taskType')
+    expires_at = DateTimeField(required=True, db_field='expiresAt')
+
+    meta = {
+        'collection': 'task_leases',
+        'allow_inheritance': True,
+        'indexes': [
+            {
+                'fields': ['task', 'user'],
+                'unique': True
+            },
+            ('user', 'expires_at'),
+            ('task_type', 'expires_at'),
+            ('expires_at', 'task')
+        ]
+    }
+
+    def __str__(self) -> str:
+        return str(self.pk)
+
+    def __repr__(self) -> str:
+        return 'Lease [{} by {} till {}]'.format(
+            self.task, self.user, self.expires_at)
@@ -3,11 +3,14 @@
 Module contains all models used to keep some metadata we could use to perform
 any kind of analysis.
 """
+from typing import Type
+
 from bson import ObjectId
 from flask_mongoengine import Document
 from mongoengine import (
     CASCADE,
     DateTimeField,
+    IntField,
     LongField,
     ReferenceField,
     StringField
@@ -17,6 +20,8 @@ from vulyk.models.tasks import AbstractTask, AbstractAnswer
 from vulyk.models.user import User
 
 __all__ = [
+    'LeaderboardScore',
+    'TaskTypeCounters',
     'WorkSession'
 ]
 
@@ -77,3 +82,127 @@ class WorkSession(Document):
         return sum(map(
             lambda session: (session.end_time - session.start_time).seconds,
             cls.objects(user=user_id)))
+
+
+class LeaderboardScore(Document):
+    """
+    Materialised number of answers given by the member in certain task type.
+    Incremented every time a new answer is saved, so leaderboards don't have
+    to count answers over and over again.
+    """
+    task_type = StringField(max_length=50, required=True, db_field='taskType')
+    user = ReferenceField(User, reverse_delete_rule=CASCADE, required=True)
+    score = IntField(default=0)
+
+    meta = {
+        'allow_inheritance': True,
+        'collection': 'leaderboard_scores',
+        'indexes': [
+            {
+                'fields': ['task_type', 'user'],
+                'unique': True
+            },
+            ('task_type', '-score')
+        ]
+    }
+
+    @classmethod
+    def on_answer_saved(
+        cls,
+        sender: type,
+        document: AbstractAnswer,
+        created: bool = False,
+        **kwargs
+    ) -> None:
+        """
+        A signal handler which increments the score of the answer's author
+        once the new answer is saved.
+
+        :param sender: Type of signal emitter.
+        :type sender: type
+        :param document: Saved answer
+        :type document: AbstractAnswer
+        :param created: True if the answer has just been created
+        :type created: bool
+        """
+        if not created or document.created_by is None:
+            return
+
+        cls.objects(task_type=document.task_type, user=document.created_by) \
+            .update_one(upsert=True, inc__score=1)
+
+
+class TaskTypeCounters(Document):
+    """
+    Materialised numbers of tasks of certain task type. Updated as tasks are
+    imported and closed, so the index page doesn't have to count tasks upon
+    every visit.
+    """
+    id = StringField(max_length=50, primary_key=True)
+    total = IntField(default=0)
+    closed = IntField(default=0)
+
+    meta = {
+        'allow_inheritance': True,
+        'collection': 'task_type_counters'
+    }
+
+    @property
+    def open(self) -> int:
+        """
+        :return: Number of tasks that are still open
+        :rtype: int
+        """
+        return self.total - self.closed
+
+    @classmethod
+    def tasks_added(cls, task_type: str, count: int) -> None:
+        """
+        :param task_type: Task type name
+        :type task_type: str
+        :param count: Number of imported tasks
+        :type count: int
+        """
+        cls.objects(id=task_type).update_one(upsert=True, inc__total=count)
+
+    @classmethod
+    def task_closed(cls, task_type: str) -> None:
+        """
+        :param task_type: Task type name
+        :type task_type: str
+        """
+        cls.objects(id=task_type).update_one(upsert=True, inc__closed=1)
+
+    @classmethod
+    def rebuild(
+        cls,
+        task_type: str,
+        task_model: Type[AbstractTask]
+    ) -> 'TaskTypeCounters':
+        """
+        Recounts tasks of the task type from scratch.
+
+        :param task_type: Task type name
+        :type task_type: str
+        :param task_model: Task model of the task type
+        :type task_model: Type[AbstractTask]
+
+        :return: Fresh counters
+        :rtype: TaskTypeCounters
+        """
+        closed = task_model._fields['closed'].db_field
+        counts = next(
+            task_model.objects(task_type=task_type).aggregate(
+                {'$group': {
+                    '_id': None,
+                    'total': {'$sum': 1},
+                    'closed': {'$sum': {'$cond': ['$' + closed, 1, 0]}}
+                }}),
+            {'total': 0, 'closed': 0})
+
+        cls.objects(id=task_type).update_one(upsert=True,
+                                             set__total=counts['total'],
+                                             set__closed=counts['closed'])
+
+        return cls(id=task_type, total=counts['total'],
+                   closed=counts['closed'])
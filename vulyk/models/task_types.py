@@ -2,16 +2,9 @@
 """Module contains all models related to task type (plugin root) entity."""
 
 import logging
-import random
 from datetime import datetime
-from hashlib import sha1
 from typing import Dict, Any, AnyStr, Union, List, Optional, Generator, Tuple
 
-try:
-    import ujson as json
-except ImportError:
-    import json
-
 from bson import ObjectId
 from mongoengine import Q
 from mongoengine.errors import (
@@ -22,7 +15,10 @@ from mongoengine.errors import (
     ValidationError
 )
 
+from vulyk.ext.assignment import AssignmentManager
+from vulyk.ext.export import ReportExporter
 from vulyk.ext.leaderboard import LeaderBoardManager
+from vulyk.ext.leasing import LeaseManager
 from vulyk.ext.worksession import WorkSessionManager
 from vulyk.models.exc import (
     TaskImportError,
@@ -31,10 +27,11 @@ from vulyk.models.exc import (
     TaskValidationError,
     TaskNotFoundError
 )
-from vulyk.models.stats import WorkSession
+from vulyk.models.leases import TaskLease
+from vulyk.models.stats import TaskTypeCounters, WorkSession
 from vulyk.models.tasks import AbstractTask, AbstractAnswer, Batch
 from vulyk.models.user import User
-from vulyk.utils import get_tb
+from vulyk.utils import get_tb, make_task_id, StageTimer, TASK_ID_SCHEMES
 
 __all__ = [
     'AbstractTaskType'
@@ -54,12 +51,15 @@ class AbstractTaskType:
     # models
     answer_model = None
     task_model = None
+    counters_model = TaskTypeCounters
 
     template = ''
     helptext_template = ''
     type_name = ''
 
     redundancy = 3
+    # how IDs of tasks are derived from their data, see `TASK_ID_SCHEMES`
+    task_id_scheme = 'legacy'
     JS_ASSETS = []
     CSS_ASSETS = []
 
@@ -73,6 +73,8 @@ class AbstractTaskType:
     # managers
     _work_session_manager = None  # type: WorkSessionManager
     _leaderboard_manager = None  # type: LeaderBoardManager
+    _assignment_manager = None  # type: AssignmentManager
+    _report_exporter = None  # type: ReportExporter
 
     def __init__(self, settings: Dict[str, Any]) -> None:
         """
@@ -83,13 +85,31 @@ class AbstractTaskType:
         :type settings: Dict[str, Any]
         """
         self._logger = logging.getLogger('vulyk.app')
+        self._settings = settings
+        self.task_id_scheme = settings.get('TASK_ID_SCHEME',
+                                           self.task_id_scheme)
 
         self._leaderboard_manager = \
-            self._leaderboard_manager or LeaderBoardManager(self.type_name,
-                                                            self.answer_model,
-                                                            User)
+            self._leaderboard_manager or LeaderBoardManager(
+                self.type_name,
+                self.answer_model,
+                User,
+                rank_staleness=settings.get('LEADERBOARD_RANK_STALENESS', 0),
+                cache_ttl=settings.get('LEADERBOARD_CACHE_TTL', 0))
         self._work_session_manager = \
-            self._work_session_manager or WorkSessionManager(WorkSession)
+            self._work_session_manager or WorkSessionManager(
+                WorkSession,
+                LeaseManager(TaskLease),
+                flush_interval=settings.get('ACTIVITY_FLUSH_INTERVAL', 0))
+        self._assignment_manager = \
+            self._assignment_manager or AssignmentManager(
+                self.type_name,
+                self.task_model,
+                redundancy=self.redundancy,
+                lease_manager=self._work_session_manager.lease_manager)
+        self._report_exporter = \
+            self._report_exporter or ReportExporter(
+                self.task_model, self.answer_model, User)
 
         assert issubclass(self.task_model, AbstractTask), \
             'You should define task_model property'
@@ -100,11 +120,17 @@ class AbstractTaskType:
             'You should define _work_session_manager property'
         assert isinstance(self._leaderboard_manager, LeaderBoardManager), \
             'You should define _leaderboard_manager property'
+        assert isinstance(self._assignment_manager, AssignmentManager), \
+            'You should define _assignment_manager property'
+        assert isinstance(self._report_exporter, ReportExporter), \
+            'You should define _report_exporter property'
 
         assert self.type_name, 'You should define type_name (underscore)'
         assert self.template, 'You should define template'
         assert isinstance(self._task_type_meta, dict), \
             'Batch meta must of dict type'
+        assert self.task_id_scheme in TASK_ID_SCHEMES, \
+            'Unknown task ID scheme {}'.format(self.task_id_scheme)
 
     @property
     def name(self) -> str:
@@ -116,6 +142,16 @@ class AbstractTaskType:
         """
         return self._name if len(self._name) > 0 else self.type_name
 
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """
+        Settings the task type was instantiated with, so the same task type
+        could be instantiated in another process.
+
+        :rtype: Dict[str, Any]
+        """
+        return self._settings
+
     @property
     def task_type_meta(self) -> Dict[str, Any]:
         """
@@ -146,6 +182,36 @@ class AbstractTaskType:
         """
         return self._work_session_manager
 
+    @property
+    def leaderboard_manager(self) -> LeaderBoardManager:
+        """
+        Returns current instance of LeaderBoardManager used in the task type.
+
+        :return: Active LeaderBoardManager instance.
+        :rtype: LeaderBoardManager
+        """
+        return self._leaderboard_manager
+
+    @property
+    def report_exporter(self) -> ReportExporter:
+        """
+        Returns current instance of ReportExporter used in the task type.
+
+        :return: Active ReportExporter instance.
+        :rtype: ReportExporter
+        """
+        return self._report_exporter
+
+    @property
+    def assignment_manager(self) -> AssignmentManager:
+        """
+        Returns current instance of AssignmentManager used in the task type.
+
+        :return: Active AssignmentManager instance.
+        :rtype: AssignmentManager
+        """
+        return self._assignment_manager
+
     def import_tasks(
         self,
         tasks: List[Dict],
@@ -170,25 +236,51 @@ class AbstractTaskType:
                 assert isinstance(task, dict)
 
                 bulk.append(self.task_model(
-                    id=sha1(json.dumps(task).encode('utf8')).hexdigest()[:20],
+                    id=self.make_task_id(task),
                     batch=batch,
                     task_type=self.type_name,
                     task_data=task))
 
             self.task_model.objects.insert(bulk)
+            self.counters_model.tasks_added(self.type_name, len(bulk))
 
             self._logger.debug('Inserted %s tasks in batch %s for plugin <%s>',
                                len(bulk), batch, self.name)
         except errors as e:
+            if isinstance(e, OperationError):
+                # some of tasks could be inserted anyway
+                self.counters_model.rebuild(self.type_name, self.task_model)
+
             raise TaskImportError('Can\'t load task: {}'.format(e))
 
+    def make_task_id(self, task: Dict) -> str:
+        """
+        Derives ID of the task from its data, so the same task isn't stored
+        twice.
+
+        :param task: Task data
+        :type task: Dict
+
+        :return: Task ID
+        :rtype: str
+        """
+        return make_task_id(task, self.task_id_scheme)
+
     def export_reports(
         self,
         batch: str,
         closed: bool = True,
-        qs=None
+        qs=None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        exported: Optional[Dict[ObjectId, datetime]] = None
     ) -> Generator[Dict[str, Any], None, None]:
-        """Exports results. IO is left out of scope here as well
+        """Exports results. IO is left out of scope here as well.
+        Answers are streamed by a single aggregation, see `ReportExporter`.
+
+        If either `since` or `until` is set, only answers given within
+        the range are exported, whether tasks are closed or not: a task gets
+        closed after the range of its first answers has been exported.
 
         :param batch: Certain batch to extract
         :type batch: str
@@ -197,10 +289,26 @@ class AbstractTaskType:
         :param qs: Queryset, an optional argument. Default value is QS that
                    exports all tasks with amount of answers > redundancy
         :type qs: QuerySet
+        :param since: Export answers given after this moment only
+        :type since: Optional[datetime]
+        :param until: Export answers given not later than this moment only
+        :type until: Optional[datetime]
+        :param exported: Answers exported already, see
+                         `ReportExporter.reports_between` (optional)
+        :type exported: Optional[Dict[ObjectId, datetime]]
 
         :returns: Generator of lists of dicts with results
         :rtype: Generator[Dict[str, Any], None, None]
         """
+        if since is not None or until is not None:
+            yield from self._report_exporter.reports_between(
+                since,
+                until or datetime.now(),
+                None if batch == '__all__' else batch,
+                exported)
+
+            return
+
         if qs is None:
             query = Q()
 
@@ -212,9 +320,7 @@ class AbstractTaskType:
 
             qs = self.task_model.objects(query)
 
-        for task in qs:
-            yield list(map(lambda a: a.as_dict(),
-                           self.answer_model.objects(task=task)))
+        yield from self._report_exporter.reports(qs)
 
     def get_leaders(self) -> List[Tuple[ObjectId, int]]:
         """Return sorted list of tuples (user_id, tasks_done)
@@ -224,6 +330,17 @@ class AbstractTaskType:
         """
         return self._leaderboard_manager.get_leaders()
 
+    def get_rank(self, user_id: ObjectId) -> Dict[str, int]:
+        """Find member's score and dense position on the leaderboard
+
+        :param user_id: ID of the member
+        :type user_id: ObjectId
+
+        :returns: Dict {total: tasks_done, position: rank}
+        :rtype: Dict[str, int]
+        """
+        return self._leaderboard_manager.get_rank(user_id)
+
     def get_leaderboard(self, limit: int = 10) -> List[Dict]:
         """Find users who contributed the most
 
@@ -237,80 +354,111 @@ class AbstractTaskType:
 
     def get_next(self, user: User) -> Dict:
         """
-        Finds given user a new task and starts new WorkSession
+        Finds given user a new task and starts new WorkSession.
+        Tasks the user already holds leases on, e.g. prefetched ones, are
+        given again only when nothing else is left.
 
         :param user: an instance of User model
         :type user: User
 
-        :returns: Prepared dictionary of model, or empty dictionary
+        :returns: Prepared dictionary of model along with the handle of the
+                  session, or empty dictionary
         :rtype: Dict
         """
-        task = self._get_next_task(user)
+        task = self._get_next_task(user, held=self._leased_to(user))
 
         if task is not None:
             # Not sure if we should do that here on GET requests
-            self._work_session_manager.start_work_session(task, user.id)
+            session_id = self._work_session_manager.start_work_session(
+                task, user.id)
 
             self._logger.debug('Assigned task %s to user %s', task.id, user.id)
 
-            return task.as_dict()
+            return dict(task.as_dict(), session=str(session_id))
         else:
             self._logger.debug('No suitable task found for  user %s', user.id)
 
             return {}
 
-    def _get_next_task(self, user: User) -> Optional[AbstractTask]:
+    def prefetch(
+        self,
+        user: User,
+        count: int,
+        exclude: Optional[List[str]] = None
+    ) -> List[Dict]:
         """
-        Finds given user a new task
+        Finds given user up to `count` follow-up tasks and starts a
+        WorkSession for every one of them, so the frontend may switch to
+        the next task without a round trip.
+
+        Tasks the user already holds leases on are never given again, so
+        prefetched tasks aren't duplicated on subsequent calls. Leases of
+        abandoned tasks just expire.
 
         :param user: an instance of User model
         :type user: User
+        :param count: Number of tasks to prefetch
+        :type count: int
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
 
-        :returns: Model instance or None
-        :rtype: Optional[AbstractTask]
+        :returns: List of prepared dictionaries of models along with handles
+                  of their sessions
+        :rtype: List[Dict]
         """
-        rs = None
-        base_q = Q(task_type=self.type_name) \
-            & Q(users_processed__nin=[user]) \
-            & Q(closed__ne=True)
+        exclude = list(exclude or []) + self._leased_to(user)
+        tasks = []
 
-        for batch in Batch \
-                .objects(task_type=self.type_name, closed__ne=True) \
-                .order_by('id'):
+        for _ in range(count):
+            task = self._get_next_task(user, exclude)
 
-            if batch.tasks_count == batch.tasks_processed:
-                continue
+            if task is None:
+                break
 
-            rs = self.task_model.objects(
-                base_q & Q(users_skipped__nin=[user]) & Q(batch=batch.id))
+            session_id = self._work_session_manager.start_work_session(
+                task, user.id)
+            exclude.append(task.id)
+            tasks.append(dict(task.as_dict(), session=str(session_id)))
 
-            if rs.count() == 0:
-                del rs
-                rs = self.task_model.objects(base_q & Q(batch=batch.id))
+        self._logger.debug('Prefetched %s tasks for user %s',
+                           len(tasks), user.id)
 
-            if rs.count() > 0:
-                break
-        else:
-            # Now searching w/o batch restriction
-            rs = self.task_model.objects(
-                base_q & Q(users_skipped__nin=[user]))
+        return tasks
 
-            if rs.count() == 0:
-                del rs
-                rs = self.task_model.objects(base_q)
+    def _leased_to(self, user: User) -> List[str]:
+        """
+        :param user: an instance of User model
+        :type user: User
 
-        if rs:
-            _id = random.choice(rs.distinct('id') or [])
+        :returns: IDs of tasks the user holds active leases on
+        :rtype: List[str]
+        """
+        lease_manager = self._work_session_manager.lease_manager
 
-            try:
-                return rs.get(id=_id)
-            except self.task_model.DoesNotExist:
-                self._logger.error(
-                    'DoesNotExist when trying to fetch task {}'.format(_id))
+        return lease_manager.leased_to(user.id) \
+            if lease_manager is not None else []
 
-                return None
-        else:
-            return None
+    def _get_next_task(
+        self,
+        user: User,
+        exclude: Optional[List[str]] = None,
+        held: Optional[List[str]] = None
+    ) -> Optional[AbstractTask]:
+        """
+        Finds given user a new task
+
+        :param user: an instance of User model
+        :type user: User
+        :param exclude: IDs of tasks that mustn't be given (optional)
+        :type exclude: Optional[List[str]]
+        :param held: IDs of tasks the user holds already, given only if
+                     nothing else is left (optional)
+        :type held: Optional[List[str]]
+
+        :returns: Model instance or None
+        :rtype: Optional[AbstractTask]
+        """
+        return self._assignment_manager.get_next_task(user, exclude, held)
 
     def record_activity(
         self,
@@ -341,7 +489,12 @@ class AbstractTaskType:
         except self.task_model.DoesNotExist:
             raise TaskNotFoundError()
 
-    def skip_task(self, task_id: AnyStr, user: User):
+    def skip_task(
+        self,
+        task_id: AnyStr,
+        user: User,
+        session_id: Optional[AnyStr] = None
+    ):
         """
         Marks given task as a skipped by a given user
         Assumes that user is eligible for this kind of tasks
@@ -350,6 +503,9 @@ class AbstractTaskType:
         :type task_id: AnyStr
         :param user: an instance of User model who provided an answer
         :type user: User
+        :param session_id: Handle of the session given along with the task
+                           (optional)
+        :type session_id: Optional[AnyStr]
 
         :raises: TaskSkipError, TaskNotFoundError
         """
@@ -359,7 +515,8 @@ class AbstractTaskType:
                 task_type=self.type_name)
 
             task.update(add_to_set__users_skipped=user)
-            self._work_session_manager.delete_work_session(task, user.id)
+            self._work_session_manager.delete_work_session(
+                task, user.id, session_id)
 
             self._logger.debug('User %s skipped the task %s', user.id, task_id)
         except self.task_model.DoesNotExist:
@@ -371,7 +528,8 @@ class AbstractTaskType:
         self,
         user: User,
         task_id: AnyStr,
-        result: Dict[str, Any]
+        result: Dict[str, Any],
+        session_id: Optional[AnyStr] = None
     ) -> None:
         """
         Saves user's answers for a given task.
@@ -383,11 +541,14 @@ class AbstractTaskType:
         :type user: User
         :param result: Task solving result
         :type result: Dict[str, Any]
+        :param session_id: Handle of the session given along with the task
+                           (optional)
+        :type session_id: Optional[AnyStr]
 
         :raises: TaskSaveError - in case of general problems
         :raises: TaskValidationError - in case of validation problems
         """
-
+        timer = StageTimer()
         answer = None
         try:
             task = self.task_model.objects.get(
@@ -398,6 +559,8 @@ class AbstractTaskType:
                                     'trying to save an answer from {user!r}.'
                                     .format(id=task_id, user=user))
 
+        timer.lap('task')
+
         try:
             answer = self.answer_model.objects.create(
                 task=task,
@@ -405,18 +568,28 @@ class AbstractTaskType:
                 created_at=datetime.now(),
                 task_type=self.type_name,
                 result=result)
+            timer.lap('answer')
 
             # update task
             closed = self._update_task_on_answer(task, answer, user)
+            timer.lap('task update')
             # update user
             user.update(inc__processed=1)
+            timer.lap('user')
             # update stats record
-            self._work_session_manager.end_work_session(task, user.id, answer)
+            self._work_session_manager.end_work_session(
+                task, user.id, answer, session_id)
+            timer.lap('work session')
 
-            self._logger.debug('User %s has done task %s', user.id, task_id)
+            # the reference is taken as is to avoid fetching the batch
+            batch = task._data.get('batch')
 
-            if closed and task.batch is not None:
-                Batch.task_done_in(batch_id=task.batch.id)
+            if closed and batch is not None:
+                Batch.task_done_in(batch_id=batch.id)
+                timer.lap('batch')
+
+            self._logger.debug('User %s has done task %s: %s',
+                               user.id, task_id, timer)
         except NotUniqueError:
             raise TaskValidationError('Attempt to save over the existing '
                                       'answer for task {id} by user {user!r}'
@@ -452,7 +625,9 @@ class AbstractTaskType:
         user: User
     ) -> bool:
         """
-        Sets flag 'closed' to True if task's goal has been reached
+        Sets flag 'closed' to True if task's goal has been reached.
+        The task is updated in a single round trip, previous state of the
+        document tells whether it was closed by someone else meanwhile.
 
         :param task: an instance of self.task_model model
         :type task: AbstractTask
@@ -474,18 +649,37 @@ class AbstractTaskType:
         if closed:
             update_q['set__closed'] = closed
 
-        num_changed = self.task_model \
-            .objects(id=task.id, closed=False) \
-            .update_one(**update_q)  # type: int
+        previous = self.task_model \
+            .objects(id=task.id) \
+            .only('closed') \
+            .modify(**update_q)  # type: Optional[AbstractTask]
 
-        if closed and num_changed == 0:
-            update_q.pop('set__closed', None)
+        if previous is None or previous.closed:
             closed = False
 
-            task.update(**update_q)
+        if closed:
+            self.counters_model.task_closed(self.type_name)
 
         return closed
 
+    def get_counters(self) -> TaskTypeCounters:
+        """
+        Reads materialised numbers of tasks, they are counted from scratch
+        if there are none yet.
+
+        :return: Counters of the task type
+        :rtype: TaskTypeCounters
+        """
+        counters = self.counters_model \
+            .objects(id=self.type_name) \
+            .first()  # type: Optional[TaskTypeCounters]
+
+        if counters is None:
+            counters = self.counters_model.rebuild(
+                self.type_name, self.task_model)
+
+        return counters
+
     def to_dict(self) -> Dict[str, Any]:
         """
         Prepare simplified dict that contains basic info about the task type.
@@ -493,19 +687,14 @@ class AbstractTaskType:
         :return: distilled dict with basic info
         :rtype: Dict[str, Any]
         """
-
-        closed_tasks = self.task_model \
-            .objects(closed=True) \
-            .count()  # type: int
-        tasks = self.task_model.objects().count()  # type: int
-        open_tasks = tasks - closed_tasks  # type: int
+        counters = self.get_counters()
 
         return {
             'name': self.name,
             'description': self.description,
             'type': self.type_name,
-            'tasks': tasks,
-            'open_tasks': open_tasks,
-            'closed_tasks': closed_tasks,
-            'has_tasks': open_tasks > 0
+            'tasks': counters.total,
+            'open_tasks': counters.open,
+            'closed_tasks': counters.closed,
+            'has_tasks': counters.open > 0
         }
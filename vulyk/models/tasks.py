@@ -45,7 +45,12 @@ class Batch(Document):
         'allow_inheritance': True,
         'indexes': [
             'task_type',
-            'closed'
+            'closed',
+            # open batches of the task type in order of their IDs
+            {
+                'fields': ['task_type', 'id'],
+                'partialFilterExpression': {'closed': False}
+            }
         ]
     }
 
@@ -61,31 +66,33 @@ class Batch(Document):
         :return: Aggregate which represents complex effect of the method
         :rtype: BatchUpdateResult
         """
-        num_changed = 0
-        batch = cls.objects.get(id=batch_id)  # type: Batch
-        processed = batch.tasks_processed + 1
+        # the counter is incremented only while there is room for it, so
+        # the common case costs a single round trip and nothing is undone
+        batch = cls \
+            .objects(id=batch_id, __raw__={'$expr': {'$lt': [
+                {'$ifNull': ['$tasksProcessed', 0]},
+                {'$ifNull': ['$tasksCount', 0]}]}}) \
+            .modify(new=True, inc__tasks_processed=1)  # type: Batch
+
+        if batch is None:
+            if cls.objects(id=batch_id).count() == 0:
+                raise cls.DoesNotExist(
+                    'Batch {} does not exist'.format(batch_id))
 
-        if processed > batch.tasks_count:
             return BatchUpdateResult(success=False, closed=False)
 
-        closed = processed == batch.tasks_count
-        update_q = {'inc__tasks_processed': 1}
+        closed = False
 
-        if closed:
-            update_q['set__closed'] = closed
-            num_changed = cls \
+        if batch.tasks_processed == batch.tasks_count:
+            closed = cls \
                 .objects(id=batch.id, closed=False) \
-                .update(**update_q)
-
-        if num_changed == 0:
-            update_q.pop('set__closed', None)
-            closed = False
+                .update_one(set__closed=True) > 0
 
-            num_changed = batch.update(**update_q)
-        elif closed:
-            on_batch_done.send(batch)
+            if closed:
+                batch.closed = True
+                on_batch_done.send(batch)
 
-        return BatchUpdateResult(success=num_changed > 0, closed=closed)
+        return BatchUpdateResult(success=True, closed=closed)
 
     def __str__(self) -> str:
         return str(self.id)
@@ -107,6 +114,8 @@ class AbstractTask(Document):
     batch = ReferenceField(Batch, reverse_delete_rule=CASCADE)
 
     users_count = IntField(default=0, db_field='usersCount')
+    # slots reserved by leases, see `vulyk.ext.leasing.LeaseManager`
+    leases_count = IntField(default=0, db_field='leasesCount')
     users_processed = ListField(ReferenceField(User),
                                 db_field='usersProcessed')
     users_skipped = ListField(ReferenceField(User), db_field='usersSkipped')
@@ -119,7 +128,13 @@ class AbstractTask(Document):
         'allow_inheritance': True,
         'indexes': [
             'task_type',
-            'batch'
+            'batch',
+            # open tasks of the task type, optionally within the batch,
+            # walked in order of their IDs
+            {
+                'fields': ['task_type', 'batch', 'id'],
+                'partialFilterExpression': {'closed': False}
+            }
         ]
     }
 
@@ -2,15 +2,66 @@
 """Module contains all models related to member entity."""
 
 import datetime
+import threading
+import time
 from itertools import chain
-from typing import Optional, Dict, Type
+from typing import Optional, Dict, FrozenSet, Iterable, Set, Type
 
+import flask
 from flask_login import UserMixin, AnonymousUserMixin
 from flask_mongoengine import Document
 from mongoengine import (
     StringField, BooleanField, DateTimeField, IntField, ReferenceField, PULL,
     ListField, signals, ValidationError)
 
+from vulyk.signals import on_group_changed
+
+
+class GroupsCache:
+    """
+    Per-process cache of task types allowed for every group.
+    Groups are few, so all of them are loaded at once and kept for `ttl`
+    seconds, unless any group is changed by this process meanwhile. Changes
+    made by other processes, e.g. CLI commands, are seen once `ttl` expires.
+    """
+
+    def __init__(self, ttl: int = 60) -> None:
+        """
+        :param ttl: For how long groups are cached, in seconds
+        :type ttl: int
+        """
+        self.ttl = ttl
+        self._types = None  # type: Optional[Dict[str, FrozenSet[str]]]
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def allowed_types(self) -> Dict[str, FrozenSet[str]]:
+        """
+        :return: Map of group ID to the set of allowed task types
+        :rtype: Dict[str, FrozenSet[str]]
+        """
+        with self._lock:
+            if self._types is None or time.monotonic() >= self._expires_at:
+                self._types = {
+                    doc['_id']: frozenset(doc.get('allowed_types', []))
+                    for doc in Group.objects
+                    .only('id', 'allowed_types')
+                    .as_pymongo()
+                }
+                self._expires_at = time.monotonic() + self.ttl
+
+            return self._types
+
+    def invalidate(self, *args, **kwargs) -> None:
+        """
+        Drops cached groups, so they are loaded anew upon the next check.
+        """
+        with self._lock:
+            self._types = None
+
+
+GROUPS_CACHE = GroupsCache()
+
 
 class Group(Document):
     """
@@ -22,6 +73,22 @@ class Group(Document):
 
     meta = {'collection': 'groups'}
 
+    @classmethod
+    def allowed_types_of(cls, group_ids: Iterable[str]) -> Set[str]:
+        """
+        Collects task types allowed for any of given groups. Uses cached
+        groups, so normally no queries are made.
+
+        :param group_ids: IDs of groups
+        :type group_ids: Iterable[str]
+
+        :return: Set of task type names
+        :rtype: Set[str]
+        """
+        types = GROUPS_CACHE.allowed_types()
+
+        return set(chain(*(types.get(gid, ()) for gid in group_ids)))
+
     def __str__(self) -> str:
         return str(self.id)
 
@@ -66,8 +133,25 @@ class User(Document, UserMixin):
         """
         assert task_type, 'Empty parameter `task_type` passed'
 
-        return self.admin \
-               or task_type in chain(*(g.allowed_types for g in self.groups))
+        return self.admin or task_type in self.get_eligible_types()
+
+    def get_eligible_types(self) -> Set[str]:
+        """
+        Collects task types the user is authorized to work with, admins
+        aside. The set is computed once per request and kept on `flask.g`.
+        Groups aren't dereferenced, their IDs are read as they are stored.
+
+        :return: Set of task type names
+        :rtype: Set[str]
+        """
+        cache = flask.g.setdefault('eligible_types', {}) \
+            if flask.has_app_context() else {}
+
+        if self.id not in cache:
+            cache[self.id] = Group.allowed_types_of(
+                ref.id for ref in self._data.get('groups') or [] if ref)
+
+        return cache[self.id]
 
     def get_stats(self, task_type) -> Dict[str, int]:
         """
@@ -81,24 +165,7 @@ class User(Document, UserMixin):
                  position in the global rank.
         :rtype: Dict[str, int]
         """
-        leaders = task_type.get_leaders()
-        i = 0
-        prev_val = -1
-        total = 0
-
-        for user, freq in leaders:
-            if freq != prev_val:
-                i += 1
-                prev_val = freq
-
-            if user == self.id:
-                total = freq
-                break
-
-        return {
-            'total': total,
-            'position': i
-        }
+        return task_type.get_rank(self.id)
 
     def as_dict(self) -> Dict[str, str]:
         """
@@ -160,3 +227,6 @@ class Anonymous(AnonymousUserMixin):
 
 
 signals.pre_save.connect(User.pre_save, sender=User)
+signals.post_save.connect(GROUPS_CACHE.invalidate, sender=Group)
+signals.post_delete.connect(GROUPS_CACHE.invalidate, sender=Group)
+on_group_changed.connect(GROUPS_CACHE.invalidate)
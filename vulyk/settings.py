@@ -78,6 +78,53 @@ COLLECT_PLUGIN_DIR_PREFIX = 'plugin_'
 # Default redundancy level for processing
 USERS_PER_TASK = ENV('USERS_PER_TASK', 2)
 
+# How IDs of imported tasks are derived from their data: 'legacy' (as before,
+# to keep deduplicating against tasks loaded by earlier versions) or
+# 'canonical' (the same regardless of keys order and environment). Opt in to
+# the latter only for task types with no tasks loaded by earlier versions.
+TASK_ID_SCHEME = ENV('TASK_ID_SCHEME', 'legacy')
+
+# Answers are stamped before they are stored, so incremental exports read
+# answers given within that many seconds before the latest exported one
+# again, skipping those exported already. Answers stored later than that
+# after being stamped (or by hosts whose clocks are ahead) are missed.
+EXPORT_OVERLAP = int(ENV('EXPORT_OVERLAP', 300))
+
+# Max number of follow-up tasks given along with the next one on request
+TASKS_PREFETCH_LIMIT = int(ENV('TASKS_PREFETCH_LIMIT', 5))
+
+# Members' last login time is written at most once per that many seconds
+LAST_SEEN_INTERVAL = int(ENV('LAST_SEEN_INTERVAL', 300))
+# For how many seconds task types allowed for groups are cached per process.
+# Groups saved within the process (e.g. in the admin) invalidate its cache
+# right away, while changes made by CLI commands or by other processes are
+# seen once the TTL expires.
+GROUPS_CACHE_TTL = int(ENV('GROUPS_CACHE_TTL', 60))
+
+# For how many seconds leaderboard ranks may be stale, 0 gives exact ranks
+LEADERBOARD_RANK_STALENESS = int(ENV('LEADERBOARD_RANK_STALENESS', 0))
+# For how many seconds leaderboards are cached unless a new answer comes
+LEADERBOARD_CACHE_TTL = int(ENV('LEADERBOARD_CACHE_TTL', 0))
+
+# Activity heartbeats are accumulated per process and written to work
+# sessions at most once per that many seconds, 0 writes every heartbeat.
+# Sessions are brought up to date before they are closed anyway.
+ACTIVITY_FLUSH_INTERVAL = int(ENV('ACTIVITY_FLUSH_INTERVAL', 0))
+
+# Progress metrics (/metrics and /metrics.json) are open to admins and to
+# requests bearing the token, if set. The pace of work is measured over
+# METRICS_WINDOW seconds, numbers are cached for METRICS_CACHE_TTL seconds.
+METRICS_TOKEN = ENV('METRICS_TOKEN', '')
+METRICS_WINDOW = int(ENV('METRICS_WINDOW', 900))
+METRICS_CACHE_TTL = int(ENV('METRICS_CACHE_TTL', 5))
+
+# How deferrable signal listeners are run: 'sync' (within the request),
+# 'threads' (pool of SIGNALS_WORKERS threads per process) or 'mongo' (durable
+# queue processed by `vulyk jobs work`)
+SIGNALS_DISPATCHER = ENV('SIGNALS_DISPATCHER', 'sync')
+SIGNALS_WORKERS = int(ENV('SIGNALS_WORKERS', 4))
+SIGNALS_QUEUE_SIZE = int(ENV('SIGNALS_QUEUE_SIZE', 1000))
+
 # Restrict an access to site to admins only
 SITE_IS_CLOSED = ENV('SITE_IS_CLOSED', False)
 
@@ -1,10 +1,481 @@
 # coding=utf-8
+"""
+Module contains signals of the application and the dispatcher layer, which
+lets expensive listeners run out of the request.
+
+Listeners that aren't required to finish before the response is sent may
+declare themselves deferrable:
+
+    @on_task_done.connect
+    @deferrable(key=lambda sender, answer: answer.created_by.id)
+    def listener(sender, answer):
+        ...
+
+Calls of deferrable listeners are handed to the current dispatcher. Those
+sharing the same key (e.g. the same member) are run in the order they were
+dispatched; a call without a key waits for all calls dispatched before it.
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
 from blinker import signal
+from bson import ObjectId
+from mongoengine import Document, Q
+from mongoengine.base import get_document
+from werkzeug.utils import import_string
+
+from vulyk.models.jobs import (
+    DeferredJob,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_RUNNING
+)
 
 __all__ = [
+    'deferrable',
+    'Dispatcher',
+    'get_dispatcher',
+    'MongoQueueDispatcher',
     'on_batch_done',
-    'on_task_done'
+    'on_group_changed',
+    'on_task_done',
+    'set_dispatcher',
+    'SyncDispatcher',
+    'ThreadPoolDispatcher'
 ]
 
 on_task_done = signal('on_task_done')
 on_batch_done = signal('on_batch_done')
+on_group_changed = signal('on_group_changed')
+
+_logger = logging.getLogger('vulyk.app')
+
+
+def deferrable(
+    key: Optional[Callable[..., Hashable]] = None,
+    retries: int = 3
+) -> Callable:
+    """
+    Marks signal listener as one that may be run out of the request.
+
+    :param key: Function of signal arguments, which gives the ordering key.
+                Calls without a key wait for all calls dispatched earlier.
+    :type key: Optional[Callable[..., Hashable]]
+    :param retries: How many times failed call is repeated
+    :type retries: int
+
+    :return: Decorator
+    :rtype: Callable
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(sender: Any, **kwargs) -> None:
+            _dispatcher.dispatch(wrapper, sender, kwargs)
+
+        wrapper.ordering_key = key
+        wrapper.retries = retries
+
+        return wrapper
+
+    return decorator
+
+
+def _key_of(listener: Callable, sender: Any, kwargs: Dict) -> Optional[str]:
+    """
+    :return: Ordering key of the call, if any
+    :rtype: Optional[str]
+    """
+    if listener.ordering_key is None:
+        return None
+
+    return str(listener.ordering_key(sender, **kwargs))
+
+
+def _path_of(listener: Callable) -> str:
+    """
+    :return: Importable path to the listener
+    :rtype: str
+    """
+    return '{}.{}'.format(listener.__module__, listener.__qualname__)
+
+
+class Dispatcher:
+    """
+    Base class of dispatchers: decides when and where deferred listeners are
+    run.
+    """
+
+    def dispatch(self, listener: Callable, sender: Any, kwargs: Dict) -> None:
+        """
+        :param listener: Deferrable listener
+        :type listener: Callable
+        :param sender: Signal sender
+        :type sender: Any
+        :param kwargs: Signal arguments
+        :type kwargs: Dict
+        """
+        raise NotImplementedError()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops accepting new calls.
+
+        :param wait: Wait until calls dispatched so far are done
+        :type wait: bool
+        """
+        pass
+
+
+class SyncDispatcher(Dispatcher):
+    """
+    Runs listeners right away, exceptions are propagated to the sender.
+    Default one, handy for tests.
+    """
+
+    def dispatch(self, listener: Callable, sender: Any, kwargs: Dict) -> None:
+        listener.__wrapped__(sender, **kwargs)
+
+
+class _Barrier:
+    """
+    A call that is put into every lane and is run by the lane that reaches
+    it the last, i.e. after all calls dispatched earlier are done.
+    """
+    __slots__ = ['call', 'pending', 'lock']
+
+    def __init__(self, call: tuple, lanes: int) -> None:
+        self.call = call
+        self.pending = lanes
+        self.lock = threading.Lock()
+
+    def arrive(self) -> bool:
+        """
+        :return: True if the calling lane is the last one to arrive
+        :rtype: bool
+        """
+        with self.lock:
+            self.pending -= 1
+
+            return self.pending == 0
+
+
+class ThreadPoolDispatcher(Dispatcher):
+    """
+    Runs listeners on a bounded pool of threads within current process.
+
+    Every thread serves its own lane. Calls are put into lanes by the key,
+    so the order is kept per key. When the lane is full the sender waits.
+    Failed calls are retried with exponential backoff, holding the lane.
+    """
+    _STOP = object()
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 1000,
+        backoff: float = 0.5
+    ) -> None:
+        """
+        Constructor.
+
+        :param workers: Number of threads
+        :type workers: int
+        :param queue_size: Max number of calls waiting in a single lane
+        :type queue_size: int
+        :param backoff: Delay before the first retry in seconds
+        :type backoff: float
+        """
+        assert workers > 0, 'At least one worker is needed'
+
+        self._backoff = backoff
+        self._lanes = [queue.Queue(maxsize=queue_size)
+                       for _ in range(workers)]  # type: List[queue.Queue]
+        self._threads = [
+            threading.Thread(target=self._work,
+                             args=(lane,),
+                             name='vulyk-dispatcher-{}'.format(i),
+                             daemon=True)
+            for i, lane in enumerate(self._lanes)
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def dispatch(self, listener: Callable, sender: Any, kwargs: Dict) -> None:
+        key = _key_of(listener, sender, kwargs)
+        call = (listener, sender, kwargs)
+
+        if key is None:
+            barrier = _Barrier(call, len(self._lanes))
+
+            for lane in self._lanes:
+                lane.put(barrier)
+        else:
+            self._lanes[hash(key) % len(self._lanes)].put(call)
+
+    def join(self) -> None:
+        """
+        Waits until calls dispatched so far are done.
+        """
+        for lane in self._lanes:
+            lane.join()
+
+    def shutdown(self, wait: bool = True) -> None:
+        for lane in self._lanes:
+            lane.put(self._STOP)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self, lane: queue.Queue) -> None:
+        """
+        Worker's loop.
+
+        :param lane: Lane served by the worker
+        :type lane: queue.Queue
+        """
+        while True:
+            item = lane.get()
+
+            try:
+                if item is self._STOP:
+                    return
+
+                if isinstance(item, _Barrier):
+                    if not item.arrive():
+                        continue
+
+                    item = item.call
+
+                self._run(*item)
+            finally:
+                lane.task_done()
+
+    def _run(self, listener: Callable, sender: Any, kwargs: Dict) -> None:
+        """
+        Runs the call, retrying it if needed.
+        """
+        for attempt in range(listener.retries + 1):
+            try:
+                listener.__wrapped__(sender, **kwargs)
+
+                return
+            except Exception:
+                if attempt == listener.retries:
+                    _logger.exception('Deferred call of %s failed.',
+                                      _path_of(listener))
+                else:
+                    time.sleep(self._backoff * 2 ** attempt)
+
+
+class MongoQueueDispatcher(Dispatcher):
+    """
+    Puts calls into durable queue kept in MongoDB, so they survive restarts
+    and are shared by all processes. Calls are run by `vulyk jobs work`.
+
+    Documents among signal arguments are stored as references and fetched
+    anew by the worker. Other values should be BSON-friendly, unknown objects
+    (e.g. managers sending the signal) are passed as None.
+    """
+
+    def __init__(
+        self,
+        job_model: type = DeferredJob,
+        backoff: int = 30,
+        lock_timeout: int = 300,
+        lookahead: int = 100
+    ) -> None:
+        """
+        Constructor.
+
+        :param job_model: Underlying mongoDB Document subclass.
+        :type job_model: type
+        :param backoff: Delay before the first retry in seconds
+        :type backoff: int
+        :param lock_timeout: After that many seconds running job is
+                             considered abandoned and is run again
+        :type lock_timeout: int
+        :param lookahead: Number of jobs checked at once by the worker
+        :type lookahead: int
+        """
+        assert issubclass(job_model, DeferredJob), \
+            'You should define job model properly'
+
+        self.job = job_model
+        self._backoff = backoff
+        self._lock_timeout = lock_timeout
+        self._lookahead = lookahead
+
+    def dispatch(self, listener: Callable, sender: Any, kwargs: Dict) -> None:
+        self.job(
+            listener=_path_of(listener),
+            key=_key_of(listener, sender, kwargs),
+            payload={'sender': _pack(sender), 'kwargs': _pack(kwargs)}
+        ).save()
+
+    def work(self, burst: bool = False, poll: float = 1.0) -> int:
+        """
+        Worker's loop.
+
+        :param burst: Quit once there are no jobs to run
+        :type burst: bool
+        :param poll: Delay between checks of an empty queue in seconds
+        :type poll: float
+
+        :return: Number of processed jobs
+        :rtype: int
+        """
+        processed = 0
+
+        while True:
+            job = self.claim()
+
+            if job is None:
+                if burst:
+                    return processed
+
+                time.sleep(poll)
+                continue
+
+            self.run(job)
+            processed += 1
+
+    def claim(self) -> Optional[DeferredJob]:
+        """
+        Locks the oldest job that may run now.
+
+        :return: Locked job or None
+        :rtype: Optional[DeferredJob]
+        """
+        now = datetime.utcnow()
+        candidates = self.job \
+            .objects(Q(state=JOB_PENDING, available_at__lte=now)
+                     | Q(state=JOB_RUNNING, locked_until__lte=now)) \
+            .order_by('id') \
+            .limit(self._lookahead)
+
+        for job in candidates:
+            if self._blocked(job):
+                continue
+
+            claimed = self.job \
+                .objects(id=job.id, state=job.state, attempts=job.attempts) \
+                .modify(new=True,
+                        set__state=JOB_RUNNING,
+                        set__locked_until=now + timedelta(
+                            seconds=self._lock_timeout),
+                        inc__attempts=1)
+
+            if claimed is not None:
+                return claimed
+
+        return None
+
+    def _blocked(self, job: DeferredJob) -> bool:
+        """
+        :return: True if some job dispatched earlier must be done first
+        :rtype: bool
+        """
+        earlier = self.job.objects(id__lt=job.id,
+                                   state__in=[JOB_PENDING, JOB_RUNNING])
+
+        if job.key is not None:
+            earlier = earlier.filter(key__in=[job.key, None])
+
+        return earlier.only('id').first() is not None
+
+    def run(self, job: DeferredJob) -> None:
+        """
+        Runs locked job. Done job is removed, failed one is either scheduled
+        for retry or marked as failed once retries are exhausted.
+
+        :param job: Locked job
+        :type job: DeferredJob
+        """
+        retries = 0
+
+        try:
+            listener = import_string(job.listener)
+            retries = listener.retries
+            listener.__wrapped__(_unpack(job.payload['sender']),
+                                 **_unpack(job.payload['kwargs']))
+            job.delete()
+        except Exception as err:
+            if job.attempts > retries:
+                _logger.exception('Deferred job %s failed.', job.id)
+                job.update(set__state=JOB_FAILED, set__error=repr(err))
+            else:
+                delay = self._backoff * 2 ** (job.attempts - 1)
+                job.update(set__state=JOB_PENDING,
+                           set__available_at=datetime.utcnow() + timedelta(
+                               seconds=delay),
+                           set__error=repr(err))
+
+
+def _pack(value: Any) -> Any:
+    """
+    Prepares signal argument to be stored in the queue.
+    """
+    if isinstance(value, Document):
+        return {'_document': value._class_name, 'pk': value.pk}
+    elif isinstance(value, dict):
+        return {k: _pack(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_pack(v) for v in value]
+    elif value is None \
+            or isinstance(value, (str, int, float, datetime, ObjectId)):
+        return value
+
+    return None
+
+
+def _unpack(value: Any) -> Any:
+    """
+    Restores signal argument stored in the queue.
+    """
+    if isinstance(value, dict):
+        if '_document' in value:
+            model = get_document(value['_document'])
+
+            return model.objects.get(pk=value['pk'])
+
+        return {k: _unpack(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_unpack(v) for v in value]
+
+    return value
+
+
+_dispatcher = SyncDispatcher()  # type: Dispatcher
+
+
+def get_dispatcher() -> Dispatcher:
+    """
+    :return: Current dispatcher
+    :rtype: Dispatcher
+    """
+    return _dispatcher
+
+
+def set_dispatcher(dispatcher: Dispatcher) -> Dispatcher:
+    """
+    Replaces current dispatcher, the previous one is shut down.
+
+    :param dispatcher: New dispatcher
+    :type dispatcher: Dispatcher
+
+    :return: The previous dispatcher
+    :rtype: Dispatcher
+    """
+    global _dispatcher
+
+    previous, _dispatcher = _dispatcher, dispatcher
+    previous.shutdown()
+
+    return previous
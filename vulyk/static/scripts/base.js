@@ -8,6 +8,7 @@ var Vulyk = Vulyk || {
             task_type: "",
             task_title: "",
             task_id: 0,
+            task_session: null,
             task_init_state: null,
             task_state: null,
             task_wrapper: null,
@@ -40,6 +41,7 @@ var Vulyk = Vulyk || {
                 "/type/" + vus.task_type + "/next",
                 function (data) {
                     vus.task_id = data.result.task.id;
+                    vus.task_session = data.result.task.session;
                     vus.body.trigger("vulyk.next", data);
                 }
             ).fail(function (data) {
@@ -60,7 +62,7 @@ var Vulyk = Vulyk || {
 
             $.post(
                 "/type/" + vus.task_type + "/skip/" + vus.task_id,
-                {},
+                {session: vus.task_session},
                 function (data) {
                     vu.load_next();
                 }
@@ -76,7 +78,7 @@ var Vulyk = Vulyk || {
 
             $.post(
                 "/type/" + vus.task_type + "/done/" + vus.task_id,
-                {result: JSON.stringify(result)},
+                {result: JSON.stringify(result), session: vus.task_session},
                 function (data) {
                     vu.load_next();
                 });
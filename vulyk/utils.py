@@ -2,9 +2,13 @@
 """Every project must have a package called `utils`."""
 import os
 import sys
+import time
+from collections import OrderedDict
+from hashlib import blake2b, sha1
 from http import HTTPStatus
 from itertools import islice
-from typing import Iterator, Optional, Dict, Generator, Tuple
+from json import JSONEncoder
+from typing import Any, Callable, Iterator, Optional, Dict, Generator, Tuple
 
 import flask
 from flask import abort, Response
@@ -17,12 +21,17 @@ except ImportError:
 from vulyk.models.user import User
 
 __all__ = [
+    'canonical_json',
     'chunked',
     'get_tb',
     'get_template_path',
+    'index_templates',
     'json_response',
+    'make_task_id',
     'NO_TASKS',
-    'resolve_task_type'
+    'resolve_task_type',
+    'StageTimer',
+    'TASK_ID_SCHEMES'
 ]
 
 
@@ -82,6 +91,57 @@ def chunked(iterable: Iterator, n: int) -> Generator[Tuple, None, None]:
             return
 
 
+class StageTimer:
+    """
+    Measures how long every consecutive stage of an operation takes.
+
+    Example:
+
+    >>> timer = StageTimer()
+    >>> do_this()
+    >>> timer.lap('this')
+    >>> do_that()
+    >>> timer.lap('that')
+    >>> str(timer)
+    'this=1.2ms, that=0.4ms, total=1.6ms'
+    """
+
+    def __init__(self) -> None:
+        self.timings = OrderedDict()  # type: Dict[str, float]
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        """
+        Finishes the stage, the next one starts right away.
+
+        :param stage: Stage name
+        :type stage: str
+
+        :return: Stage duration in milliseconds
+        :rtype: float
+        """
+        now = time.perf_counter()
+        elapsed = (now - self._last) * 1000
+        self._last = now
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+        return elapsed
+
+    @property
+    def total(self) -> float:
+        """
+        :return: Duration of all finished stages in milliseconds
+        :rtype: float
+        """
+        return sum(self.timings.values())
+
+    def __str__(self) -> str:
+        return ', '.join(
+            '{}={:.1f}ms'.format(stage, ms)
+            for stage, ms in list(self.timings.items())
+            + [('total', self.total)])
+
+
 def get_tb() -> Dict:
     """
     Returns traceback of the latest exception caught in 'except' block
@@ -91,10 +151,39 @@ def get_tb() -> Dict:
     return sys.exc_info()[2]
 
 
+def index_templates(app: flask.Flask) -> Dict[str, str]:
+    """
+    Walks through all templates available to the application and maps
+    names of base templates to their paths within `TEMPLATE_BASE_FOLDERS`.
+    When a few paths match, the first one listed by the loader wins.
+
+    :param app: Flask application instance.
+    :type app: flask.Flask
+
+    :return: Map of template name to the full path
+    :rtype: Dict[str, str]
+    """
+    prefixes = [os.path.join(folder, 'base', '')
+                for folder in app.config.get('TEMPLATE_BASE_FOLDERS', [])
+                if folder]
+    index = {}  # type: Dict[str, str]
+
+    for x in app.jinja_loader.list_templates():
+        for prefix in prefixes:
+            if x.startswith(prefix):
+                index.setdefault(x[len(prefix):], x)
+
+    return index
+
+
 def get_template_path(app: flask.Flask, name: str) -> str:
     """
     Finds the path to the template.
 
+    Uses the index built by `init_plugins`, templates are walked through
+    upon every call only if they are reloaded automatically (e.g. in debug
+    mode) or the index is missing.
+
     :param app: Flask application instance.
     :type app: flask.Flask
     :param name: Name of the template.
@@ -103,11 +192,65 @@ def get_template_path(app: flask.Flask, name: str) -> str:
     :return: Full path to the template.
     :rtype: str
     """
-    for x in app.jinja_loader.list_templates():
-        for folder in app.config.get('TEMPLATE_BASE_FOLDERS', []):
-            if folder and os.path.join(folder, 'base', name) == x:
-                return x
-    return 'base/%s' % name
+    index = getattr(app, '_template_index', None)
+
+    if index is None or app.templates_auto_reload:
+        index = index_templates(app)
+
+    return index.get(name, 'base/%s' % name)
+
+
+_CANONICAL_ENCODER = JSONEncoder(ensure_ascii=False,
+                                 allow_nan=False,
+                                 sort_keys=True,
+                                 separators=(',', ':'))
+
+
+def canonical_json(value: Any) -> bytes:
+    """
+    Serialises the value the same way regardless of the environment: keys
+    are sorted, there is no whitespace, floats are written in the shortest
+    form that reads back to the same number, text is kept as UTF-8.
+
+    :param value: JSON-compatible value
+    :type value: Any
+
+    :return: UTF-8 encoded JSON
+    :rtype: bytes
+    """
+    return _CANONICAL_ENCODER.encode(value).encode('utf8')
+
+
+def _canonical_task_id(task: Dict) -> str:
+    return blake2b(canonical_json(task), digest_size=10).hexdigest()
+
+
+def _legacy_task_id(task: Dict) -> str:
+    # depends on keys order and on the JSON library installed
+    return sha1(json.dumps(task).encode('utf8')).hexdigest()[:20]
+
+
+# Ways to derive IDs of tasks from their data. Both give 20 hex digits.
+TASK_ID_SCHEMES = {
+    'canonical': _canonical_task_id,
+    'legacy': _legacy_task_id
+}  # type: Dict[str, Callable[[Dict], str]]
+
+
+def make_task_id(task: Dict, scheme: str = 'legacy') -> str:
+    """
+    Derives ID of the task from its data, so the same task isn't stored
+    twice.
+
+    :param task: Task data
+    :type task: Dict
+    :param scheme: Name of the scheme from `TASK_ID_SCHEMES`
+    :type scheme: str
+
+    :return: Task ID
+    :rtype: str
+    """
+    return TASK_ID_SCHEMES[scheme](task)
 
 
 def json_response(result: Dict,